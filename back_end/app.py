@@ -1,16 +1,41 @@
 from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from database import mongo
+from database import init_db
+from cache import catalog_cache, identity_cache, revision_cache, song_meta_cache
+from history_buffer import play_history_buffer
+from json_provider import init_json
+from logging_setup import init_logging
+from metrics import init_metrics
+from storage import init_storage
+from trending import trending_ranker
 import cloudinary
 import cloudinary.uploader
 import os
 from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
 from datetime import timedelta
 
 # Load environment variables
 load_dotenv()
 
+# Sent on every response, including asgi.py's native routes
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+}
+
+# Flask-CORS options for /api/*, next to the CORS_ORIGINS config; asgi.py
+# applies the same ones to its native routes
+CORS_OPTIONS = {
+    "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    "allow_headers": ["Content-Type", "Authorization", "Content-Range", "Range"],
+    "supports_credentials": True,
+    "expose_headers": ["Content-Type", "Authorization", "ETag", "Content-Range", "Accept-Ranges"]
+}
+
 
 def create_app():
     app = Flask(__name__)
@@ -20,6 +45,39 @@ def create_app():
         'MONGO_URI',
         "mongodb://localhost:27017/MusicSphere"
     )
+
+    # Connection pool (per worker process), timeouts and wire compression.
+    # Unset values keep the driver default; these override MONGO_URI options.
+    app.config['MONGO_MAX_POOL_SIZE'] = int(os.getenv('MONGO_MAX_POOL_SIZE', 20))
+    app.config['MONGO_MIN_POOL_SIZE'] = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    app.config['MONGO_MAX_CONNECTING'] = int(os.getenv('MONGO_MAX_CONNECTING', 2))
+    app.config['MONGO_MAX_IDLE_TIME_MS'] = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))
+    app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = int(
+        os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)
+    )
+    app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'] = int(
+        os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+    )
+    app.config['MONGO_CONNECT_TIMEOUT_MS'] = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    app.config['MONGO_SOCKET_TIMEOUT_MS'] = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 30000))
+    # Overall per-operation budget (client-side operation timeout); unset = none
+    app.config['MONGO_TIMEOUT_MS'] = (
+        int(os.getenv('MONGO_TIMEOUT_MS')) if os.getenv('MONGO_TIMEOUT_MS') else None
+    )
+    # Used in this order where the codec is installed (zstandard, python-snappy)
+    app.config['MONGO_COMPRESSORS'] = [
+        name.strip() for name in os.getenv('MONGO_COMPRESSORS', 'zstd,snappy,zlib').split(',')
+        if name.strip()
+    ]
+    app.config['MONGO_APP_NAME'] = os.getenv('MONGO_APP_NAME', 'music-sphere')
+    # Read preference for lag-tolerant reads (search, recommendations)
+    app.config['MONGO_SECONDARY_READ_PREFERENCE'] = os.getenv(
+        'MONGO_SECONDARY_READ_PREFERENCE', 'secondaryPreferred'
+    )
+    app.config['MONGO_MAX_STALENESS_SECONDS'] = int(
+        os.getenv('MONGO_MAX_STALENESS_SECONDS', -1)
+    )
+
     app.config['JWT_SECRET_KEY'] = os.getenv(
         'JWT_SECRET_KEY',
         os.urandom(24).hex()
@@ -32,19 +90,132 @@ def create_app():
     app.config['JWT_TOKEN_LOCATION'] = ["cookies"]
     app.config['JWT_COOKIE_CSRF_PROTECT'] = False  # For development only
 
+    # Browser origins allowed to call the API with credentials
+    app.config['CORS_ORIGINS'] = os.getenv(
+        'CORS_ORIGINS', 'http://localhost:5173'
+    ).split(',')
+
+    # Catalog response and song metadata cache sizing
+    app.config['CATALOG_CACHE_SIZE'] = int(os.getenv('CATALOG_CACHE_SIZE', 1024))
+    app.config['CATALOG_CACHE_TTL'] = int(os.getenv('CATALOG_CACHE_TTL', 60))
+    app.config['SONG_META_CACHE_SIZE'] = int(os.getenv('SONG_META_CACHE_SIZE', 50000))
+    app.config['SONG_META_CACHE_TTL'] = int(os.getenv('SONG_META_CACHE_TTL', 3600))
+    app.config['IDENTITY_CACHE_SIZE'] = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))
+    app.config['IDENTITY_CACHE_TTL'] = int(os.getenv('IDENTITY_CACHE_TTL', 60))
+    # How long a worker may answer conditional GETs from a revision it read
+    app.config['REVISION_CACHE_TTL'] = float(os.getenv('REVISION_CACHE_TTL', 1.0))
+
+    # Password hashing: a werkzeug method string, e.g. 'scrypt' or 'pbkdf2:sha256:600000'.
+    # Stored hashes made with other parameters are upgraded on the next login.
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv(
+        'PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'
+    )
+    app.config['PASSWORD_SALT_LENGTH'] = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+    # werkzeug fills in omitted parameters ('scrypt' is stored as 'scrypt:32768:8:1'),
+    # so hash a probe once to learn exactly what a current hash looks like
+    from models import User
+    app.config['PASSWORD_HASH_PARAMS'] = User.hash_parameters(generate_password_hash(
+        "probe",
+        method=app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_SALT_LENGTH']
+    ))
+
+    # Play-history write-behind buffer
+    app.config['HISTORY_BUFFER_MAX_EVENTS'] = int(
+        os.getenv('HISTORY_BUFFER_MAX_EVENTS', 10000)
+    )
+    app.config['HISTORY_FLUSH_BATCH_SIZE'] = int(
+        os.getenv('HISTORY_FLUSH_BATCH_SIZE', 500)
+    )
+    app.config['HISTORY_FLUSH_INTERVAL'] = float(
+        os.getenv('HISTORY_FLUSH_INTERVAL', 1.0)
+    )
+    app.config['HISTORY_ENQUEUE_TIMEOUT'] = float(
+        os.getenv('HISTORY_ENQUEUE_TIMEOUT', 0.05)
+    )
+    # Writes of a batch that raised, before its events are dropped
+    app.config['HISTORY_FLUSH_MAX_ATTEMPTS'] = int(
+        os.getenv('HISTORY_FLUSH_MAX_ATTEMPTS', 3)
+    )
+
+    # Chunked uploads: where partial files are spooled and the size cap
+    app.config['UPLOAD_SPOOL_DIR'] = os.getenv('UPLOAD_SPOOL_DIR')
+    app.config['MAX_UPLOAD_BYTES'] = int(
+        os.getenv('MAX_UPLOAD_BYTES', 1024 * 1024 * 1024)
+    )
+
+    # Background upload processing
+    app.config['UPLOAD_WORKERS'] = int(os.getenv('UPLOAD_WORKERS', 2))
+    app.config['UPLOAD_QUEUE_SIZE'] = int(os.getenv('UPLOAD_QUEUE_SIZE', 32))
+    app.config['UPLOAD_JOB_LEASE'] = int(os.getenv('UPLOAD_JOB_LEASE', 600))
+    # How often abandoned chunked-upload spool files are deleted (seconds)
+    app.config['UPLOAD_SPOOL_SWEEP_INTERVAL'] = int(
+        os.getenv('UPLOAD_SPOOL_SWEEP_INTERVAL', 3600)
+    )
+
+    # Trending rankings: how often scores are persisted and re-ranked
+    app.config['TRENDING_REFRESH_INTERVAL'] = float(
+        os.getenv('TRENDING_REFRESH_INTERVAL', 30.0)
+    )
+    app.config['TRENDING_TOP_SIZE'] = int(os.getenv('TRENDING_TOP_SIZE', 200))
+
+    # Media storage: "cloudinary" or "local" (files served by this app)
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'cloudinary')
+    app.config['LOCAL_STORAGE_DIR'] = os.getenv(
+        'LOCAL_STORAGE_DIR', os.path.join(os.path.dirname(__file__), 'media')
+    )
+    app.config['PUBLIC_BASE_URL'] = os.getenv('PUBLIC_BASE_URL', 'http://localhost:5000')
+
+    # Logging: levels and sampling per logger or route (see logging_setup.py)
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+    app.config['LOG_LEVELS'] = os.getenv('LOG_LEVELS', '')
+    app.config['LOG_SAMPLING'] = os.getenv('LOG_SAMPLING', '')
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text')
+    app.config['LOG_FILE'] = os.getenv('LOG_FILE')
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+    # Request metrics on /metrics; log requests slower than this (0 = off)
+    app.config['METRICS_ENABLED'] = (
+        os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    )
+    app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', 0))
+
+    # Create missing indexes at startup (otherwise run `flask indexes sync`)
+    app.config['ENSURE_INDEXES_ON_STARTUP'] = (
+        os.getenv('ENSURE_INDEXES_ON_STARTUP', 'False').lower() == 'true'
+    )
+
+    # Before anything logs, so Flask's logger defers to the queue handler
+    init_logging(app)
+
     # Initialize extensions
-    mongo.init_app(app)
+    # Before the Mongo client exists, so its command listener is attached
+    init_metrics(app)
+    init_db(app)
+    # After Flask-PyMongo, which installs its own JSON provider in init_app
+    init_json(app)
     JWTManager(app)
+    catalog_cache.configure(
+        maxsize=app.config['CATALOG_CACHE_SIZE'],
+        ttl=app.config['CATALOG_CACHE_TTL']
+    )
+    song_meta_cache.configure(
+        maxsize=app.config['SONG_META_CACHE_SIZE'],
+        ttl=app.config['SONG_META_CACHE_TTL']
+    )
+    identity_cache.configure(
+        maxsize=app.config['IDENTITY_CACHE_SIZE'],
+        ttl=app.config['IDENTITY_CACHE_TTL']
+    )
+    revision_cache.configure(ttl=app.config['REVISION_CACHE_TTL'])
+    init_storage(app)
+    from models import UserHistory
+    play_history_buffer.init_app(app, writer=UserHistory.write_play_events)
+    trending_ranker.init_app(app)
 
     # CORS configuration
     CORS(app, 
-         resources={r"/api/*": {
-             "origins": ["http://localhost:5173"],
-             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-             "allow_headers": ["Content-Type", "Authorization"],
-             "supports_credentials": True,
-             "expose_headers": ["Content-Type", "Authorization"]
-         }},
+         resources={r"/api/*": dict(CORS_OPTIONS, origins=app.config['CORS_ORIGINS'])},
          supports_credentials=True)
 
     # Error handling middleware
@@ -60,12 +231,7 @@ def create_app():
     @app.after_request
     def after_request(response):
         # Add security headers
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
-        response.headers['Strict-Transport-Security'] = (
-            'max-age=31536000; includeSubDomains'
-        )
+        response.headers.update(SECURITY_HEADERS)
         return response
 
     # Register blueprints
@@ -74,6 +240,28 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(audio_bp, url_prefix="/api/audio")
 
+    # Upload worker threads start lazily in each serving process
+    from routes.audio import process_upload_job
+    from upload_jobs import upload_queue
+    upload_queue.init_app(app, processor=process_upload_job)
+
+    @app.before_request
+    def start_upload_workers():
+        upload_queue.ensure_started()
+
+    # Register maintenance CLI commands
+    from commands import register_commands
+    register_commands(app)
+
+    if app.config['ENSURE_INDEXES_ON_STARTUP']:
+        from indexes import ensure_indexes
+        with app.app_context():
+            created, conflicts = ensure_indexes()
+        if created:
+            app.logger.info('Created indexes: %s', ', '.join(created))
+        for conflict in conflicts:
+            app.logger.warning('Index conflict: %s', conflict)
+
     # Configure Cloudinary
     cloudinary.config(
         cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -84,10 +272,18 @@ def create_app():
     return app
 
 
-app = create_app()
+def __getattr__(name):
+    # ``from app import app`` builds the app on first use, so importing
+    # create_app (the wsgi entry point, benchmarks) does not open a client
+    if name == "app":
+        globals()["app"] = instance = create_app()
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    app.run(
+    # Development server only; production runs gunicorn (see gunicorn.conf.py)
+    create_app().run(
         debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true',
         port=int(os.getenv('PORT', 5000)),
         host=os.getenv('HOST', 'localhost')
@@ -0,0 +1,244 @@
+"""
+Async (ASGI) serving mode.
+
+    uvicorn asgi:app --workers 4 --port 5000
+
+The hot public catalog reads are served natively on the event loop with
+PyMongo's async client, through ``AsyncMusicRepository``. They return the
+same documents, cache entries and ETags as the Flask views:
+
+* ``GET /api/audio/music``
+* ``GET /api/audio/music/<id>``
+* ``GET /api/audio/search``
+
+They are timed under the same route labels as the Flask views, so
+``/metrics`` reads the same in both modes, and answer with the Flask app's
+security and CORS headers. Every other ``/api/auth`` and
+``/api/audio`` route is the unchanged Flask app mounted through a WSGI
+adapter, so both modes expose the same API.
+Uploads were already moved off the request path (the route spools the
+file and a job worker talks to storage), so no request waits on Cloudinary
+in either mode.
+
+Status: this is a partial port. Only the three reads above run on the
+async client; everything else still holds a thread-pool slot for the
+whole request. The sync/async comparison this mode was added for
+(``benchmarks/load_test.py`` against ``gunicorn`` and ``uvicorn`` on the
+same mongod) has not been run yet, so no throughput gain is claimed;
+port more routes only once those numbers show the native path pays off.
+"""
+import logging
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from bson.objectid import ObjectId
+from flask_cors.core import DEFAULT_OPTIONS, get_cors_headers, serialize_options
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_date, parse_etags
+
+import metrics
+import serializers
+from app import CORS_OPTIONS, SECURITY_HEADERS, app as flask_app
+from cache import SongMeta, cache_key, catalog_cache, revision_cache, song_meta_cache
+from database import client_options, pool_monitor, secondary_read_preference
+from models import Music
+from repository import AsyncMusicRepository
+from revisions import CATALOG_REVISION, cache_headers, is_not_modified, validators
+from search import MAX_RESULTS
+
+logger = logging.getLogger(__name__)
+
+client = AsyncMongoClient(
+    flask_app.config["MONGO_URI"], event_listeners=[pool_monitor],
+    **client_options(flask_app.config)
+)
+_db = client.get_default_database()
+repository = AsyncMusicRepository(_db, _db.with_options(
+    read_preference=secondary_read_preference(flask_app.config)
+))
+# The options create_app hands Flask-CORS for /api/*
+cors_options = serialize_options(
+    dict(DEFAULT_OPTIONS, **CORS_OPTIONS, origins=flask_app.config["CORS_ORIGINS"])
+)
+
+
+def json_response(payload, status=200):
+    # The Flask app's provider, so both modes write values (dates included) alike
+    return Response(
+        flask_app.json.dumps_bytes(payload), status_code=status, media_type="application/json"
+    )
+
+
+def flask_headers(view):
+    """Add the headers the Flask app's after_request hooks would have."""
+    async def wrapper(request):
+        response = await view(request)
+        response.headers.update(SECURITY_HEADERS)
+        cors = get_cors_headers(cors_options, Headers(request.headers.items()), request.method)
+        for name, value in cors.items():
+            response.headers.append(name, value)
+        return response
+    return wrapper
+
+
+def timed(route):
+    """Request metrics for a native route, labelled like its Flask view."""
+    def decorator(view):
+        async def wrapper(request):
+            stats, token = metrics.begin_request(request.method, route)
+            try:
+                response = await view(request)
+                stats.status = response.status_code
+                stats.response_bytes = len(response.body)
+                return response
+            finally:
+                metrics.end_request(stats, token)
+        return wrapper
+    return decorator
+
+
+def conditional(scope):
+    """Async counterpart of revisions.conditional for public catalog views."""
+    def decorator(view):
+        async def wrapper(request):
+            cached = revision_cache.get(scope)
+            if cached is None:
+                cached = await repository.revision(scope)
+                revision_cache.set(scope, cached)
+            revision, updated_at = cached
+            request.state.revision = revision
+            # Same as Flask's request.full_path, so both modes hand out the same ETags
+            full_path = f"{request.url.path}?{request.url.query}"
+            etag, last_modified = validators(scope, revision, updated_at, full_path)
+
+            if is_not_modified(etag, last_modified,
+                               parse_etags(request.headers.get("if-none-match")),
+                               parse_date(request.headers.get("if-modified-since"))):
+                response = Response(status_code=304)
+            else:
+                response = await view(request)
+                if response.status_code != 200:
+                    return response
+            response.headers.update(cache_headers(etag, last_modified))
+            return response
+        return wrapper
+    return decorator
+
+
+@timed("/api/audio/music")
+@flask_headers
+@conditional(CATALOG_REVISION)
+async def get_music(request):
+    args = request.query_params
+    key = cache_key("get_music", args, revision=request.state.revision)
+    payload = catalog_cache.get(key)
+    if payload is not None:
+        return json_response(payload)
+    try:
+        limit = int(args.get("limit", Music.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return json_response({"error": "limit must be an integer"}, 400)
+    limit = max(1, min(limit, Music.MAX_PAGE_SIZE))
+    fields = {f.strip() for f in args.get("fields", "").split(",") if f.strip()}
+    try:
+        docs, next_cursor = await repository.page(
+            limit=limit, cursor=args.get("cursor"),
+            projection=serializers.LIST.projection(fields)
+        )
+    except ValueError as ve:
+        return json_response({"error": str(ve)}, 400)
+    except Exception as e:
+        logger.error("Database error: %s", str(e))
+        return json_response({"error": str(e)}, 500)
+    payload = {"items": docs, "next_cursor": next_cursor, "count": len(docs)}
+    catalog_cache.set(key, payload)
+    return json_response(payload)
+
+
+@timed("/api/audio/music/<song_id>")
+@flask_headers
+@conditional(CATALOG_REVISION)
+async def get_song_by_id(request):
+    song_id = request.path_params["song_id"]
+    if not ObjectId.is_valid(song_id):
+        return json_response({"error": "Invalid song ID format"}, 400)
+    key = cache_key("get_song_by_id", {"song_id": song_id}, revision=request.state.revision)
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        return json_response(cached)
+    try:
+        song = await repository.get(ObjectId(song_id), serializers.DETAIL.projection())
+    except Exception as e:
+        logger.error("Error fetching song: %s", str(e))
+        return json_response({"error": f"Failed to fetch song: {str(e)}"}, 500)
+    if not song:
+        return json_response({"error": "Song not found"}, 404)
+    song_meta_cache.set(song["_id"], SongMeta.from_doc(song))
+    catalog_cache.set(key, song)
+    return json_response(song)
+
+
+@timed("/api/audio/search")
+@flask_headers
+async def search_music(request):
+    args = request.query_params
+    query = args.get("q", "").strip()
+    if not query:
+        return json_response({"error": "Search query is required"}, 400)
+    try:
+        limit = int(args.get("limit", 20))
+        offset = int(args.get("offset", 0))
+    except ValueError:
+        return json_response(
+            {"error": "limit and offset must be integers"}, 400
+        )
+    if limit < 1 or offset < 0:
+        return json_response(
+            {"error": "limit must be positive and offset non-negative"}, 400
+        )
+    if offset + limit > MAX_RESULTS:
+        return json_response(
+            {"error": f"offset + limit may not exceed {MAX_RESULTS}"}, 400
+        )
+
+    key = cache_key("search_music", {"q": query, "limit": limit, "offset": offset})
+    payload = catalog_cache.get(key)
+    if payload is None:
+        try:
+            results = await repository.search(
+                query, limit=limit, offset=offset,
+                projection=serializers.SEARCH_HIT.projection()
+            )
+        except Exception as e:
+            logger.error("Search error: %s", str(e))
+            return json_response({"error": f"Search failed: {str(e)}"}, 500)
+        payload = {
+            "query": query,
+            "results": results,
+            "count": len(results),
+            "limit": limit,
+            "offset": offset
+        }
+        catalog_cache.set(key, payload)
+    return json_response(payload)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await client.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/audio/music", get_music, methods=["GET"]),
+        Route("/api/audio/music/{song_id}", get_song_by_id, methods=["GET"]),
+        Route("/api/audio/search", search_music, methods=["GET"]),
+        # Everything else: the Flask app, run in a thread pool
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,206 @@
+"""
+Local audio analysis at ingest time.
+
+``ffprobe`` reads the container headers (duration, sample rate, bitrate,
+codec) and ``ffmpeg`` decodes the audio to 48 kHz float PCM on a pipe.
+The PCM is consumed in fixed one-second blocks and reduced with NumPy as
+it streams, so memory stays bounded by the block size whatever the track
+length:
+
+* integrated loudness (LUFS) per ITU-R BS.1770: K-weighting filter,
+  400 ms blocks with 75% overlap, absolute (-70 LUFS) and relative
+  (-10 LU) gating;
+* a fixed number of waveform peaks for the player scrubber, stored as a
+  uint8 binary array rather than a JSON list.
+
+Sources can be local paths or URLs ffmpeg can read, which is how the
+backfill analyses tracks that only exist in remote storage.
+"""
+import json
+import math
+import subprocess
+from datetime import datetime
+import numpy as np
+from bson.binary import Binary
+from scipy.signal import lfilter, lfilter_zi
+
+ANALYSIS_SAMPLE_RATE = 48000
+DEFAULT_PEAKS = 1000
+# 100 ms gating steps; reads are a whole number of steps
+STEP_FRAMES = ANALYSIS_SAMPLE_RATE // 10
+BLOCK_STEPS = 10
+
+# BS.1770 K-weighting at 48 kHz: high-shelf pre-filter then RLB high-pass
+K_SHELF = (
+    np.array([1.53512485958697, -2.69169618940638, 1.19839281085285]),
+    np.array([1.0, -1.69065929318241, 0.73248077421585]),
+)
+K_HIGHPASS = (
+    np.array([1.0, -2.0, 1.0]),
+    np.array([1.0, -1.99004745483398, 0.99007225036621]),
+)
+
+
+class AnalysisUnavailable(Exception):
+    """Raised when the source cannot be probed or decoded."""
+
+
+def probe(source):
+    """Read container/stream headers with ffprobe."""
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0",
+             "-show_entries", "format=duration,bit_rate:stream=sample_rate,channels,codec_name,bit_rate",
+             "-of", "json", source],
+            capture_output=True, check=True, timeout=60
+        ).stdout
+    except FileNotFoundError:
+        raise AnalysisUnavailable("ffprobe is not installed")
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        raise AnalysisUnavailable(f"ffprobe failed: {e}")
+
+    info = json.loads(output or b"{}")
+    fmt = info.get("format", {})
+    streams = info.get("streams") or []
+    if not streams or "sample_rate" not in streams[0]:
+        raise AnalysisUnavailable("No audio stream found")
+    stream = streams[0]
+    bit_rate = stream.get("bit_rate") or fmt.get("bit_rate")
+    return {
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+        "sample_rate": int(stream["sample_rate"]),
+        "channels": int(stream.get("channels") or 1),
+        "codec": stream.get("codec_name"),
+        "bitrate": int(bit_rate) // 1000 if bit_rate else None,
+    }
+
+
+class _LoudnessMeter:
+    """Streaming BS.1770 integrated loudness."""
+
+    def __init__(self, channels):
+        self._zi_shelf = [lfilter_zi(*K_SHELF) * 0.0 for _ in range(channels)]
+        self._zi_high = [lfilter_zi(*K_HIGHPASS) * 0.0 for _ in range(channels)]
+        # Channel-summed mean square per 100 ms step
+        self._steps = []
+
+    def feed(self, frames):
+        """Consume a (n_steps * STEP_FRAMES, channels) block."""
+        energy = np.zeros(len(frames) // STEP_FRAMES)
+        for ch in range(frames.shape[1]):
+            y, self._zi_shelf[ch] = lfilter(*K_SHELF, frames[:, ch], zi=self._zi_shelf[ch])
+            y, self._zi_high[ch] = lfilter(*K_HIGHPASS, y, zi=self._zi_high[ch])
+            energy += np.mean(y.reshape(-1, STEP_FRAMES) ** 2, axis=1)
+        self._steps.extend(energy.tolist())
+
+    def integrated(self):
+        steps = np.asarray(self._steps)
+        if len(steps) < 4:
+            return None
+        # 400 ms blocks = 4 consecutive 100 ms steps (75% overlap)
+        blocks = np.convolve(steps, np.full(4, 0.25), mode="valid")
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[loudness > -70.0]
+        if not len(gated):
+            return None
+        relative = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+        with np.errstate(divide="ignore"):
+            gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+        if not len(gated):
+            return None
+        return round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+
+class _PeakTracker:
+    """Streaming max-abs per fixed-size bucket of frames."""
+
+    def __init__(self, bucket_frames):
+        self.bucket = max(1, int(bucket_frames))
+        self.position = 0
+        self.peaks = []
+
+    def feed(self, frames):
+        amplitude = np.abs(frames).max(axis=1)
+        ids = (self.position + np.arange(len(amplitude))) // self.bucket
+        self.position += len(amplitude)
+        starts = np.r_[0, np.flatnonzero(np.diff(ids)) + 1]
+        values = np.maximum.reduceat(amplitude, starts)
+        first_id = int(ids[0])
+        if self.peaks and first_id == len(self.peaks) - 1:
+            self.peaks[-1] = max(self.peaks[-1], float(values[0]))
+            values = values[1:]
+        self.peaks.extend(values.tolist())
+
+    def result(self, count):
+        peaks = np.asarray(self.peaks, dtype=np.float32)
+        if len(peaks) > count:
+            edges = np.linspace(0, len(peaks), count, endpoint=False).astype(np.int64)
+            peaks = np.maximum.reduceat(peaks, edges)
+        return peaks
+
+
+def analyze(source, peaks=DEFAULT_PEAKS):
+    """Probe and decode ``source``; return duration, format, loudness and waveform peaks."""
+    header = probe(source)
+    channels = min(header["channels"], 2)
+    expected_frames = (header["duration"] or 0) * ANALYSIS_SAMPLE_RATE
+    # Unknown duration: ten buckets per second, downsampled at the end
+    bucket = math.ceil(expected_frames / peaks) if expected_frames else STEP_FRAMES
+    meter = _LoudnessMeter(channels)
+    tracker = _PeakTracker(bucket)
+
+    try:
+        proc = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-i", source, "-f", "f32le",
+             "-ac", str(channels), "-ar", str(ANALYSIS_SAMPLE_RATE), "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        raise AnalysisUnavailable("ffmpeg is not installed")
+
+    frame_bytes = 4 * channels
+    read_size = STEP_FRAMES * BLOCK_STEPS * frame_bytes
+    total_frames = 0
+    try:
+        while True:
+            data = proc.stdout.read(read_size)
+            if not data:
+                break
+            usable = len(data) - len(data) % frame_bytes
+            frames = np.frombuffer(data[:usable], dtype="<f4").reshape(-1, channels)
+            if not len(frames):
+                break
+            total_frames += len(frames)
+            tracker.feed(frames)
+            whole = len(frames) - len(frames) % STEP_FRAMES
+            if whole:
+                meter.feed(frames[:whole])
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0 or not total_frames:
+        raise AnalysisUnavailable(f"ffmpeg could not decode {source}")
+
+    waveform = tracker.result(peaks)
+    peak = float(waveform.max()) if len(waveform) else 0.0
+    duration = header["duration"] or total_frames / ANALYSIS_SAMPLE_RATE
+    return {
+        "duration": round(duration, 3),
+        "sample_rate": header["sample_rate"],
+        "channels": header["channels"],
+        "codec": header["codec"],
+        "bitrate": header["bitrate"],
+        "loudness_lufs": meter.integrated(),
+        "sample_peak_db": round(20 * math.log10(peak), 2) if peak > 0 else None,
+        "waveform": np.round(np.clip(waveform, 0.0, 1.0) * 255).astype(np.uint8).tobytes(),
+    }
+
+
+def to_document(result):
+    """Shape an analyze() result for storage on a music document."""
+    doc = dict(result)
+    doc["waveform"] = Binary(result["waveform"])
+    doc["waveform_points"] = len(result["waveform"])
+    doc["analyzed_at"] = datetime.utcnow()
+    return doc
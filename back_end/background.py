@@ -0,0 +1,55 @@
+"""
+Background threads that start lazily, once per process.
+
+Threads do not survive fork: with gunicorn's ``preload_app`` the master's
+module-level singletons are copied into every worker without their
+threads. ``PerProcess`` remembers which process ran a start function, and
+runs it again in a forked child or after one of the threads it started
+died. The play buffer, trending ranker, upload workers and log listener
+all start through it.
+"""
+import os
+import threading
+
+
+def start_thread(target, name):
+    """Start and return a daemon thread."""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class PerProcess:
+    def __init__(self, start):
+        """``start()`` starts the work and returns the threads it started, if any."""
+        self._start = start
+        self._pid = None
+        self._lock = threading.Lock()
+        self.threads = []
+
+    @property
+    def started(self):
+        """True if ``start`` ran in this process."""
+        return self._pid == os.getpid()
+
+    def _running(self):
+        return self.started and all(thread.is_alive() for thread in self.threads)
+
+    def ensure(self):
+        """Run ``start`` unless its threads already run here; True if it ran now."""
+        if self._running():
+            return False
+        with self._lock:
+            if self._running():
+                return False
+            self.threads = list(self._start() or ())
+            self._pid = os.getpid()
+            return True
+
+    def reset(self, stop=None):
+        """Forget the start, calling ``stop`` first if the work runs in this process."""
+        with self._lock:
+            if stop is not None and self.started:
+                stop()
+            self._pid = None
+            self.threads = []
@@ -0,0 +1,461 @@
+"""
+Benchmark suite for the audio and auth APIs.
+
+Seeds a throwaway database with benchmarks/datagen.py, then runs:
+
+* microbenchmarks of ``Music.search_music``, the ``UserHistory`` reads,
+  batch writes and stats backfill aggregation, the auth identity lookup,
+  and list-response formatting (legacy loop vs projection + JSON provider);
+* an HTTP scenario through the full Flask stack (routing, JWT cookies,
+  ETags, caches) from ``--threads`` concurrent clients, mixing browse,
+  search, play-record and history stats requests.
+
+Cloudinary is stubbed (``StubUploader``), so nothing leaves the machine.
+Results are JSON: one line per benchmark on stdout, and with ``--output``
+a file with run metadata that a later run can be checked against:
+
+    python benchmarks/api_benchmark.py --mongomock --output base.json
+    python benchmarks/api_benchmark.py --mongomock --baseline base.json \\
+        --max-regression 0.25        # exits 1 if any p50 got >25% slower
+
+``--mongomock`` needs ``pip install mongomock``. ``--mongo-uri`` runs
+against a real ``mongod`` instead; its database is
+dropped first, so its name must contain "bench" or "test". mongomock is pure Python
+and lacks some operators the app uses: ``$ifNull`` find projections are
+computed in Python, ``$text`` queries fail as if the text index were
+missing (search serves prefix matches only), and the ``$merge`` backfill
+is reported as skipped. Use a local mongod for those and for absolute
+numbers, and only compare results from the same backend. Any benchmark
+that reports errors makes the run exit 1.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import QUERIES, percentile  # noqa: E402
+
+# HTTP scenario mix: (name, weight)
+SCENARIO = [
+    ("browse_page", 25),
+    ("browse_song", 15),
+    ("search", 25),
+    ("record_play", 20),
+    ("most_played", 5),
+    ("recently_played", 5),
+    ("history", 5),
+]
+
+# Benchmarks built on operators mongomock lacks, with the operator
+MONGOMOCK_UNSUPPORTED = {"history.backfill_song_stats_user": "$merge"}
+
+
+class StubUploader:
+    """Stands in for ``cloudinary.uploader``, returning canned results after ``latency`` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def upload(self, source, **options):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        folder = options.get("folder", "music_sphere")
+        return {
+            "public_id": f"{folder}/stub-{n}",
+            "secure_url": f"https://res.cloudinary.invalid/{folder}/stub-{n}.mp3",
+            "bytes": 4_000_000,
+            "duration": 200.0,
+            "format": "mp3",
+        }
+
+    def upload_large(self, source, chunk_size=None, **options):
+        return self.upload(source, **options)
+
+
+def use_mongomock(app, mongo):
+    """Point flask_pymongo's ``mongo`` at an in-process mongomock database."""
+    import mongomock
+    from mongomock.collection import BulkOperationBuilder, Collection, Cursor
+
+    # mongomock predates the ``sort`` argument newer PyMongo passes to bulk updates
+    add_update = BulkOperationBuilder.add_update
+    if not getattr(add_update, "accepts_sort", False):
+        def add_update_compat(self, *args, sort=None, **kwargs):
+            return add_update(self, *args, **kwargs)
+        add_update_compat.accepts_sort = True
+        BulkOperationBuilder.add_update = add_update_compat
+    if not getattr(Collection.find, "shimmed", False):
+        Collection.find = _find_compat(Collection.find)
+        Cursor.__next__ = Cursor.next = _next_compat(Cursor.__next__)
+    mongo.cx = mongomock.MongoClient()
+    mongo.db = mongo.cx["MusicSphereBench"]
+    app.extensions["mongo_secondary"] = mongo.db
+
+
+def _find_compat(find):
+    """Wrap mongomock's ``find`` with the parts of ``find`` it lacks.
+
+    ``$ifNull`` projections (the serializers' views) are computed in Python
+    as documents are read, and ``$text`` filters fail the way they do on a
+    mongod without the text index, so search serves prefix matches only.
+    """
+    from pymongo.errors import OperationFailure
+
+    def find_compat(self, filter=None, projection=None, *args, **kwargs):
+        if filter and "$text" in filter:
+            raise OperationFailure("text index required for $text query", code=27)
+        computed = {}
+        if isinstance(projection, dict):
+            projection = dict(projection)
+            for output, value in list(projection.items()):
+                if isinstance(value, dict) and "$ifNull" in value:
+                    source, default = value["$ifNull"]
+                    computed[output] = (source.lstrip("$"), default)
+                    del projection[output]
+            # Sources that are not outputs themselves are read, then dropped
+            hidden = {source for source, _ in computed.values()} - set(projection) - set(computed)
+            projection.update({source: 1 for source, _ in computed.values()})
+        cursor = find(self, filter, projection, *args, **kwargs)
+        if computed:
+            cursor.computed_fields = (computed, hidden)
+        return cursor
+
+    find_compat.shimmed = True
+    return find_compat
+
+
+def _next_compat(cursor_next):
+    def next_compat(self):
+        doc = cursor_next(self)
+        if not getattr(self, "computed_fields", None):
+            return doc
+        computed, hidden = self.computed_fields
+        shaped = {key: value for key, value in doc.items() if key not in hidden}
+        for output, (source, default) in computed.items():
+            value = doc.get(source)
+            shaped[output] = default if value is None else value
+        return shaped
+
+    return next_compat
+
+
+def summarize(name, kind, latencies, errors, elapsed, error=None):
+    latencies = sorted(latencies)
+    result = {
+        "benchmark": name,
+        "kind": kind,
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50),
+        "p90_ms": percentile(latencies, 0.90),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else None,
+        "ops_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if error:
+        result["error"] = error
+    return result
+
+
+def micro(name, fn, repeats, warmup=3):
+    """Time ``fn(i)`` ``repeats`` times; stops at the first exception."""
+    latencies = []
+    started = time.perf_counter()
+    try:
+        for i in range(warmup):
+            fn(i)
+        started = time.perf_counter()
+        for i in range(repeats):
+            call_started = time.perf_counter()
+            fn(i)
+            latencies.append((time.perf_counter() - call_started) * 1000)
+    except Exception as e:
+        return summarize(name, "micro", latencies, 1, time.perf_counter() - started,
+                         error=f"{type(e).__name__}: {e}")
+    return summarize(name, "micro", latencies, 0, time.perf_counter() - started)
+
+
+def micro_benchmarks(app, data, args):
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    import json_provider
+    import serialization_benchmark
+    from models import Music, User, UserHistory
+    from storage import get_storage
+
+    rng = random.Random(args.seed)
+    emails = data["emails"]
+    song_ids = data["song_ids"]
+    heavy_users = emails[:10]  # Zipf-weighted history makes the first users the heaviest
+
+    def write_batch(i):
+        UserHistory.write_play_events([
+            {
+                "username": rng.choice(emails),
+                "song_id": str(rng.choice(song_ids)),
+                "duration_played": rng.randint(5, 300),
+                "played_at": datetime.utcnow(),
+            }
+            for _ in range(100)
+        ])
+
+    def lookup_identity(i):
+        # Half the lookups miss the identity cache
+        if i % 2:
+            from cache import identity_cache
+            identity_cache.clear()
+        User.get_identity(rng.choice(emails))
+
+    results = []
+    with app.app_context():
+        cases = [
+            ("music.search_music", lambda i: Music.search_music(QUERIES[i % len(QUERIES)])),
+            ("music.get_music_page", lambda i: Music.get_music_page(limit=50)),
+            ("history.get_user_history", lambda i: UserHistory.get_user_history(heavy_users[i % 10])),
+            ("history.get_recently_played",
+             lambda i: UserHistory.get_recently_played(heavy_users[i % 10])),
+            ("history.get_most_played", lambda i: UserHistory.get_most_played(heavy_users[i % 10])),
+            ("history.write_play_events_x100", write_batch),
+            ("history.backfill_song_stats_user",
+             lambda i: UserHistory.backfill_song_stats(heavy_users[i % 10])),
+            ("auth.get_identity", lookup_identity),
+            ("storage.upload_audio_stub",
+             lambda i: get_storage().upload_audio(__file__, "bench.mp3")),
+        ]
+        for name, fn in cases:
+            if args.mongomock and name in MONGOMOCK_UNSUPPORTED:
+                results.append({"benchmark": name, "kind": "micro",
+                                "skipped": f"mongomock has no {MONGOMOCK_UNSUPPORTED[name]}"})
+                continue
+            results.append(micro(name, fn, args.repeats))
+
+        # The list formatting loop the catalog views used to run, vs the current path
+        doc_rng = random.Random(args.seed)
+        stored = [serialization_benchmark.stored_document(doc_rng) for _ in range(args.docs)]
+        shaped = [serialization_benchmark.list_view_document(doc) for doc in stored]
+        flask_app = Flask(__name__)
+        stdlib = DefaultJSONProvider(flask_app)
+        fast = json_provider.init_json(flask_app)
+        results.append(micro(
+            f"format.legacy_loop_stdlib_x{args.docs}",
+            lambda i: serialization_benchmark.legacy_list(stored, stdlib), args.repeats
+        ))
+        results.append(micro(
+            f"format.projected_{type(fast).__name__}_x{args.docs}",
+            lambda i: serialization_benchmark.current_list(shaped, fast), args.repeats
+        ))
+    return results
+
+
+def http_scenario(app, data, args):
+    from flask_jwt_extended import create_access_token
+    from models import User
+
+    with app.test_request_context():
+        tokens = []
+        for email in data["emails"][:max(1, args.clients)]:
+            identity = User.get_identity(email)
+            tokens.append(create_access_token(
+                identity=email,
+                additional_claims={"uid": identity["id"], "username": identity["username"]}
+            ))
+    song_ids = [str(song_id) for song_id in data["song_ids"]]
+    names = [name for name, _ in SCENARIO]
+    weights = [weight for _, weight in SCENARIO]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def request(client, name, rng):
+        if name == "browse_page":
+            return client.get(f"/api/audio/music?limit={rng.choice([20, 50])}")
+        if name == "browse_song":
+            return client.get(f"/api/audio/music/{rng.choice(song_ids)}")
+        if name == "search":
+            return client.get(f"/api/audio/search?q={rng.choice(QUERIES)}")
+        if name == "record_play":
+            return client.post("/api/audio/history/record", json={
+                "song_id": rng.choice(song_ids), "duration_played": rng.randint(5, 300)
+            })
+        if name == "most_played":
+            return client.get("/api/audio/history/most-played")
+        if name == "recently_played":
+            return client.get("/api/audio/history/recent")
+        return client.get("/api/audio/history?limit=50")
+
+    def worker(n):
+        rng = random.Random(args.seed + n)
+        client = app.test_client()
+        client.set_cookie("access_token_cookie", tokens[n % len(tokens)])
+        mine = {name: [] for name in names}
+        failed = {name: 0 for name in names}
+        for _ in range(per_thread):
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            response = request(client, name, rng)
+            response.close()
+            mine[name].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                failed[name] += 1
+        with lock:
+            for name in names:
+                latencies[name].extend(mine[name])
+                errors[name] += failed[name]
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = [
+        summarize(f"http.{name}", "http", latencies[name], errors[name], elapsed)
+        for name in names
+    ]
+    everything = [value for name in names for value in latencies[name]]
+    results.append(summarize(
+        "http.mix", "http", everything, sum(errors.values()), elapsed
+    ))
+    return results
+
+
+def compare(results, baseline_path, max_regression):
+    """Print p50 regressions against a baseline file; returns True if any exceed the limit."""
+    with open(baseline_path) as f:
+        baseline = {r["benchmark"]: r for r in json.load(f)["results"]}
+    failed = False
+    for result in results:
+        before = baseline.get(result["benchmark"])
+        if not before or not before.get("p50_ms") or result.get("p50_ms") is None:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        # New failures count as a regression however fast they were
+        regressed = change > max_regression or result["errors"] > before["errors"]
+        failed = failed or regressed
+        print(json.dumps({
+            "benchmark": result["benchmark"],
+            "baseline_p50_ms": before["p50_ms"],
+            "p50_ms": result["p50_ms"],
+            "change": round(change, 3),
+            "errors": result["errors"],
+            "regressed": regressed,
+        }), file=sys.stderr)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--mongomock", action="store_true",
+                         help="Run against an in-process mongomock database.")
+    backend.add_argument("--mongo-uri", default="mongodb://localhost:27017/MusicSphereBench")
+    parser.add_argument("--songs", type=int, default=5_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--history", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--docs", type=int, default=1_000,
+                        help="Documents per formatting benchmark call.")
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=50,
+                        help="Distinct logged-in users in the HTTP scenario.")
+    parser.add_argument("--cold-cache", action="store_true",
+                        help="Disable the catalog response cache.")
+    parser.add_argument("--upload-latency", type=float, default=0.0,
+                        help="Seconds each stubbed Cloudinary upload takes.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["STORAGE_BACKEND"] = "cloudinary"
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-" + "0" * 16)
+    if args.cold_cache:
+        os.environ["CATALOG_CACHE_SIZE"] = "0"
+    if args.mongomock:
+        # mongomock has no pipeline updates; keep trending persistence out of the run
+        os.environ["TRENDING_REFRESH_INTERVAL"] = "86400"
+
+    import cloudinary.uploader
+    stub = StubUploader(args.upload_latency)
+    cloudinary.uploader.upload = stub.upload
+    cloudinary.uploader.upload_large = stub.upload_large
+
+    from app import create_app
+    from database import mongo
+    from history_buffer import play_history_buffer
+    import datagen
+    import indexes
+
+    app = create_app()
+    # Failing requests are counted in the results; keep stderr for regressions
+    for name in (app.logger.name, "routes"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+    if args.mongomock:
+        use_mongomock(app, mongo)
+
+    with app.app_context():
+        datagen.drop(mongo.db)
+        if not args.mongomock:
+            indexes.ensure_indexes()
+        started = time.perf_counter()
+        data = datagen.seed(args.songs, args.users, args.history, seed=args.seed)
+        seed_seconds = time.perf_counter() - started
+
+    results = micro_benchmarks(app, data, args) + http_scenario(app, data, args)
+    play_history_buffer.stop()
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "backend": "mongomock" if args.mongomock else "mongod",
+                    "songs": args.songs,
+                    "users": args.users,
+                    "history": args.history,
+                    "requests": args.requests,
+                    "threads": args.threads,
+                    "cold_cache": args.cold_cache,
+                    "seed": args.seed,
+                    "seed_seconds": round(seed_seconds, 2),
+                    "python": platform.python_version(),
+                    "started_at": datetime.utcnow().isoformat(),
+                },
+                "results": results,
+            }, f, indent=2)
+
+    with app.app_context():
+        datagen.drop(mongo.db)
+    failing = [r["benchmark"] for r in results if r.get("errors")]
+    if failing:
+        # Timings of failing calls say nothing about the code under test
+        print(f"Benchmarks with errors: {', '.join(failing)}", file=sys.stderr)
+    regressed = args.baseline and compare(results, args.baseline, args.max_regression)
+    if failing or regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Pieces shared by the benchmark scripts: the vocabulary synthetic songs
+are built from, the search queries they time, and latency percentiles.
+Track documents come from ``datagen.song_document``.
+"""
+import sys
+
+WORDS = [
+    "love", "night", "dance", "fire", "heart", "summer", "dream", "light",
+    "rain", "city", "gold", "wild", "blue", "river", "echo", "storm",
+    "shadow", "neon", "ocean", "star", "midnight", "velvet", "thunder", "sky",
+]
+GENRES = ["pop", "rock", "jazz", "hip hop", "electronic", "classical", "indie"]
+# Benchmarks drop what they seed; only databases named like these qualify
+DISPOSABLE_MARKERS = ("bench", "test")
+QUERIES = ["lo", "love", "midn", "neon sky", "artist 12", "jazz", "thunder st", "zzz"]
+
+
+def percentile(sorted_values, fraction, digits=3):
+    """Nearest-rank percentile of already sorted latencies; None when empty."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(sorted_values[index], digits)
+
+
+def require_disposable(db):
+    """Exit unless ``db`` is named as a benchmark or test database.
+
+    Scripts fall back to an inherited MONGO_URI, which may well name the
+    production database; this is checked before anything is dropped.
+    """
+    if not any(marker in db.name.lower() for marker in DISPOSABLE_MARKERS):
+        sys.exit(f"Refusing to drop database {db.name!r}: its name contains "
+                 f"none of {', '.join(DISPOSABLE_MARKERS)}")
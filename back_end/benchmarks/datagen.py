@@ -0,0 +1,151 @@
+"""
+Synthetic data for benchmarks: N songs, M users and K play-history rows.
+
+Song popularity is Zipf-like, so a few tracks dominate history the way
+real catalogs do; play durations mix completed and skipped plays. The
+per-user ``user_song_stats`` aggregates are built from the generated
+history through ``UserHistory.update_song_stats``, the same code path
+the play buffer uses.
+
+    MONGO_URI=mongodb://localhost:27017/MusicSphereBench \\
+        python benchmarks/datagen.py --songs 100000 --users 10000 --history 1000000
+
+The database named in MONGO_URI is dropped first; ``drop`` refuses
+unless its name contains "bench" or "test". ``seed`` needs an app context and writes through
+``database.mongo``, so api_benchmark.py can run it against mongomock.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from common import GENRES, WORDS, require_disposable  # noqa: E402
+
+PASSWORD = "Benchmark1"
+# Cheap on purpose: seeding hashes once, and login is not what is measured
+PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+COLLECTIONS = ("music", "users", "user_history", "user_song_stats", "revisions")
+
+
+def song_document(rng, n, created_at):
+    from search import build_search_tokens
+
+    doc = {
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))),
+        "artist": f"Artist {rng.randint(1, 5000)}",
+        "album": rng.choice([None, f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"]),
+        "genre": rng.choice(GENRES),
+        "description": rng.choice(["", "Recorded live. " * rng.randint(1, 4)]),
+        "cloudinary_url": f"https://res.cloudinary.invalid/music_sphere/{n}.mp3",
+        "duration": rng.randint(90, 420),
+        "file_size": rng.randint(2_000_000, 12_000_000),
+        "format": "mp3",
+        "uploaded_by": "Anonymous",
+        "created_at": created_at.isoformat(),
+        "cover_url": None,
+        "play_count": 0,
+        "likes": rng.randint(0, 500),
+        "public": True,
+        "storage_backend": "cloudinary",
+        "storage_key": f"music_sphere/{n}",
+    }
+    doc["search_tokens"] = build_search_tokens(doc)
+    return doc
+
+
+def zipf_index(rng, size, exponent=1.1):
+    """Index in [0, size) with Zipf-like skew towards 0."""
+    return min(size - 1, int(rng.paretovariate(exponent)) - 1)
+
+
+def seed(songs, users, history, seed=42, batch_size=5000):
+    """Populate the current app's database; returns ``{"song_ids", "emails"}``."""
+    from database import mongo
+    from models import UserHistory
+
+    rng = random.Random(seed)
+    db = mongo.db
+    now = datetime.utcnow()
+
+    song_ids = []
+    song_meta = []
+    for offset in range(0, songs, batch_size):
+        docs = [
+            song_document(rng, n, now - timedelta(minutes=songs - n))
+            for n in range(offset, min(offset + batch_size, songs))
+        ]
+        song_ids.extend(db.music.insert_many(docs, ordered=False).inserted_ids)
+        song_meta.extend(
+            {"title": doc["title"], "artist": doc["artist"], "duration": doc["duration"]}
+            for doc in docs
+        )
+    # Popular songs spread over the catalog instead of all being the oldest
+    popularity = list(range(songs))
+    rng.shuffle(popularity)
+
+    password = generate_password_hash(PASSWORD, method=PASSWORD_HASH_METHOD)
+    emails = [f"user{n}@bench.invalid" for n in range(users)]
+    for offset in range(0, users, batch_size):
+        db.users.insert_many([
+            {"email": emails[n], "username": f"user{n}", "password": password}
+            for n in range(offset, min(offset + batch_size, users))
+        ], ordered=False)
+
+    for offset in range(0, history, batch_size):
+        entries = []
+        for _ in range(offset, min(offset + batch_size, history)):
+            index = popularity[zipf_index(rng, songs)]
+            song = song_meta[index]
+            played = song["duration"] if rng.random() < 0.7 else rng.randint(5, song["duration"])
+            entries.append(UserHistory.build_entry(
+                emails[zipf_index(rng, users, 1.3)], song_ids[index], song, played,
+                now - timedelta(seconds=rng.randint(0, 30 * 86400))
+            ))
+        db.user_history.insert_many(entries, ordered=False)
+        UserHistory.update_song_stats(entries)
+    return {"song_ids": song_ids, "emails": emails}
+
+
+def drop(db):
+    require_disposable(db)
+    for name in COLLECTIONS:
+        db[name].drop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--songs", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--history", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/MusicSphereBench")
+    from app import create_app
+    from database import mongo
+    import indexes
+
+    app = create_app()
+    with app.app_context():
+        drop(mongo.db)
+        indexes.ensure_indexes()
+        started = time.perf_counter()
+        seed(args.songs, args.users, args.history, seed=args.seed)
+        print(json.dumps({
+            "benchmark": "datagen",
+            "songs": args.songs,
+            "users": args.users,
+            "history": args.history,
+            "seconds": round(time.perf_counter() - started, 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
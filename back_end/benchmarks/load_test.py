@@ -0,0 +1,129 @@
+"""
+HTTP load test: many concurrent keep-alive connections against one URL set.
+
+Used to compare the sync (WSGI) and async (ASGI) serving modes under the
+same worker count, e.g. with 1,000 concurrent connections:
+
+    gunicorn -w 4 --threads 32 -b 127.0.0.1:5000 app:app
+    python benchmarks/load_test.py --base http://127.0.0.1:5000 --label sync
+
+    uvicorn asgi:app --workers 4 --port 5001
+    python benchmarks/load_test.py --base http://127.0.0.1:5001 --label async
+
+Both servers should point at the same MONGO_URI, with the catalog seeded
+(e.g. by benchmarks/search_benchmark.py). Each connection sends requests
+back to back for ``--duration`` seconds, cycling through ``--paths``. One
+JSON line per run reports throughput, latency percentiles and errors. The
+client is plain asyncio streams, so it adds no dependencies and has far
+less overhead than the servers it measures.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from common import percentile
+
+DEFAULT_PATHS = [
+    "/api/audio/music?limit=50",
+    "/api/audio/search?q=lo",
+    "/api/audio/search?q=midnight",
+]
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns its status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def connection(host, port, paths, deadline, latencies, errors, offset):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors["connect"] += 1
+        return
+    i = offset
+    try:
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n"
+            started = time.perf_counter()
+            writer.write(request.encode("ascii"))
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+        errors["dropped"] += 1
+    finally:
+        writer.close()
+
+
+async def run(args):
+    url = urlsplit(args.base)
+    host, port = url.hostname, url.port or 80
+    latencies = []
+    errors = {"connect": 0, "dropped": 0}
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        connection(host, port, args.paths, deadline, latencies, errors, n)
+        for n in range(args.connections)
+    ))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "label": args.label,
+        "connections": args.connections,
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50, digits=2),
+        "p90_ms": percentile(latencies, 0.90, digits=2),
+        "p99_ms": percentile(latencies, 0.99, digits=2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else None,
+        "errors": {k: v for k, v in errors.items() if v},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent keep-alive HTTP load test.")
+    parser.add_argument("--base", default="http://127.0.0.1:5000")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Recommendation index build benchmark.
+
+Generates synthetic play history (Zipf-distributed song popularity, a
+few taste clusters so neighbours are meaningful), then times the same
+code path ``recommendations.build_index`` runs after loading from Mongo:
+matrix construction and batched top-K cosine neighbours. Results are
+printed as JSON lines.
+
+    python benchmarks/recommendations_benchmark.py --rows 10000000
+
+No database is needed; ``--sample`` times neighbours for a random subset
+of songs and extrapolates, for quick runs on small machines.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import similarity  # noqa: E402
+
+
+def synthetic_history(rng, rows, users, songs, clusters=50, zipf=1.2):
+    """Return (user_idx, item_idx, weights) for ``rows`` plays."""
+    user_idx = rng.integers(0, users, size=rows, dtype=np.int32)
+    # Each user mostly listens within their cluster's slice of the catalog
+    cluster = user_idx % clusters
+    span = songs // clusters
+    rank = np.minimum(rng.zipf(zipf, size=rows) - 1, span - 1)
+    in_cluster = (cluster * span + rank).astype(np.int32)
+    anywhere = np.minimum(rng.zipf(zipf, size=rows) - 1, songs - 1).astype(np.int32)
+    item_idx = np.where(rng.random(rows) < 0.8, in_cluster, anywhere)
+    weights = np.where(rng.random(rows) < 0.7, 1.0, 0.25).astype(np.float32)
+    return user_idx, item_idx, weights
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--songs", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=similarity.DEFAULT_K)
+    parser.add_argument("--batch-size", type=int, default=similarity.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--sample", type=int, default=0,
+                        help="Compute neighbours for this many songs only (0 = all).")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+    user_idx, item_idx, weights = synthetic_history(rng, args.rows, args.users, args.songs)
+    generated_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matrix = similarity.interaction_matrix(
+        user_idx, item_idx, weights, shape=(args.users, args.songs)
+    )
+    matrix_s = time.perf_counter() - started
+    print(json.dumps({
+        "stage": "matrix", "rows": args.rows, "users": args.users, "songs": args.songs,
+        "nnz": int(matrix.nnz), "generate_s": round(generated_s, 3),
+        "build_s": round(matrix_s, 3), "peak_rss_mb": round(peak_rss_mb(), 1)
+    }))
+
+    items = None
+    if args.sample:
+        items = np.sort(rng.choice(args.songs, size=min(args.sample, args.songs), replace=False))
+    started = time.perf_counter()
+    items, neighbors, scores = similarity.top_k_neighbors(
+        matrix, k=args.k, items=items, batch_size=args.batch_size
+    )
+    neighbors_s = time.perf_counter() - started
+    filled = float((neighbors >= 0).sum(axis=1).mean()) if len(items) else 0.0
+    print(json.dumps({
+        "stage": "neighbors", "songs_computed": len(items), "k": args.k,
+        "batch_size": args.batch_size, "neighbors_s": round(neighbors_s, 3),
+        "songs_per_s": round(len(items) / max(neighbors_s, 1e-9), 1),
+        "estimated_full_s": round(neighbors_s * args.songs / max(len(items), 1), 3),
+        "mean_neighbors": round(filled, 2), "peak_rss_mb": round(peak_rss_mb(), 1)
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Search latency benchmark: legacy unanchored $regex scan vs the indexed
+prefix-token search in search.py.
+
+Seeds a throwaway database with synthetic tracks, growing it through each
+requested size, and reports p50/p99 latency per path as JSON lines.
+
+    MONGO_URI=mongodb://localhost:27017/MusicSphereBench \\
+        python benchmarks/search_benchmark.py --sizes 10000 100000 1000000
+
+The database named in MONGO_URI is dropped first, so its name must
+contain "bench" or "test".
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/MusicSphereBench")
+
+from app import create_app  # noqa: E402
+from database import mongo  # noqa: E402
+import indexes  # noqa: E402
+import search  # noqa: E402
+from common import QUERIES, percentile, require_disposable  # noqa: E402
+from datagen import song_document  # noqa: E402
+
+
+def seed(rng, start, stop, batch_size=5000):
+    """Insert tracks numbered [start, stop)."""
+    now = datetime.utcnow()
+    for offset in range(start, stop, batch_size):
+        end = min(offset + batch_size, stop)
+        mongo.db.music.insert_many(
+            [song_document(rng, n, now) for n in range(offset, end)], ordered=False
+        )
+
+
+def legacy_regex_search(query):
+    """The pre-index implementation of Music.search_music."""
+    pattern = {"$regex": query, "$options": "i"}
+    return list(mongo.db.music.find({
+        "$or": [
+            {"title": pattern},
+            {"artist": pattern},
+            {"album": pattern},
+            {"genre": pattern},
+        ]
+    }))
+
+
+def indexed_search(query):
+    return search.search_catalog(query, limit=20)
+
+
+def measure(fn, repeats):
+    """Return per-call latencies in milliseconds over all QUERIES."""
+    samples = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            started = time.perf_counter()
+            fn(query)
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        require_disposable(mongo.db)
+        mongo.db.music.drop()
+        indexes.ensure_indexes(["music"])
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed(rng, seeded, size)
+            seeded = size
+            for name, fn in (("regex", legacy_regex_search), ("indexed", indexed_search)):
+                samples = sorted(measure(fn, args.repeats))
+                print(json.dumps({
+                    "benchmark": "search",
+                    "path": name,
+                    "tracks": size,
+                    "calls": len(samples),
+                    "p50_ms": percentile(samples, 0.50),
+                    "p99_ms": percentile(samples, 0.99),
+                }), flush=True)
+        mongo.db.music.drop()
+
+
+if __name__ == "__main__":
+    main()
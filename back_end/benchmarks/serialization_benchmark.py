@@ -0,0 +1,134 @@
+"""
+Response serialization microbenchmark.
+
+Compares, per batch of documents, the old list-route path (full stored
+documents minus internal fields, reformatted in a Python loop, encoded
+with Flask's stdlib provider) against the current one (documents already
+shaped by the list view's Mongo projection, encoded by the orjson
+provider). The projection itself runs inside mongod, so the "current"
+path starts from its output. Reports time and payload size as JSON lines.
+
+    python benchmarks/serialization_benchmark.py --docs 10000 --repeats 20
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import json_provider  # noqa: E402
+import serializers  # noqa: E402
+
+from common import GENRES, WORDS  # noqa: E402
+
+
+def stored_document(rng):
+    """A music document as stored, minus the fields INTERNAL_PROJECTION drops."""
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    return {
+        "_id": ObjectId(),
+        "title": title,
+        "artist": f"Artist {rng.randint(1, 5000)}",
+        "album": rng.choice([None, f"{rng.choice(WORDS).title()} Sessions"]),
+        "genre": rng.choice([None] + GENRES),
+        "description": rng.choice([None, "Recorded live. " * rng.randint(1, 6)]),
+        "cloudinary_url": f"https://res.cloudinary.com/demo/video/upload/music_sphere/{title}.mp3",
+        "duration": rng.randint(90, 420),
+        "file_size": rng.randint(2_000_000, 12_000_000),
+        "format": "mp3",
+        "uploaded_by": "Anonymous",
+        "created_at": datetime.utcnow().isoformat(),
+        "cover_url": None,
+        "play_count": rng.randint(0, 10000),
+        "likes": rng.randint(0, 500),
+        "public": True,
+        "storage_backend": "cloudinary",
+        "storage_key": f"music_sphere/{title}",
+        "catalog_rev": rng.randint(1, 1000),
+        "analysis": {
+            "duration": 201.3, "sample_rate": 44100, "channels": 2, "codec": "mp3",
+            "bitrate": 320, "loudness_lufs": -9.4, "sample_peak_db": -0.3,
+            "waveform_points": 1000, "analyzed_at": datetime.utcnow(),
+        },
+    }
+
+
+def list_view_document(doc):
+    """What serializers.LIST's projection returns for a stored document."""
+    shaped = {"_id": doc["_id"]}
+    for output, (source, default) in serializers.LIST.fields.items():
+        value = doc.get(source)
+        shaped[output] = default if value is None else value
+    return shaped
+
+
+def legacy_list(docs, provider):
+    """The pre-serializer get_music loop followed by stdlib encoding."""
+    out = []
+    for stored in docs:
+        doc = dict(stored)
+        doc['_id'] = str(doc['_id'])
+        doc['url'] = doc.get('cloudinary_url', '')
+        doc['artist'] = doc.get('artist', 'Unknown Artist')
+        doc['cover_url'] = doc.get('cover_url', None)
+        out.append(doc)
+    return provider.dumps({"items": out, "count": len(out)})
+
+
+def current_list(docs, provider):
+    return provider.dumps({"items": docs, "count": len(docs)})
+
+
+def measure(fn, docs, provider, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = fn(docs, provider)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(body.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization microbenchmark.")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stored = [stored_document(rng) for _ in range(args.docs)]
+    shaped = [list_view_document(doc) for doc in stored]
+
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = json_provider.init_json(app)
+
+    results = {
+        "legacy_loop_stdlib": measure(legacy_list, stored, stdlib, args.repeats),
+        "projected_stdlib": measure(current_list, shaped, json_provider.MongoJSONProvider(app),
+                                    args.repeats),
+        "projected_" + type(fast).__name__: measure(current_list, shaped, fast, args.repeats),
+    }
+    baseline_ms = results["legacy_loop_stdlib"][0]
+    for name, (median_ms, size) in results.items():
+        print(json.dumps({
+            "path": name,
+            "docs": args.docs,
+            "median_ms": round(median_ms, 2),
+            "ms_per_10k_docs": round(median_ms * 10000 / args.docs, 2),
+            "speedup": round(baseline_ms / median_ms, 2),
+            "payload_bytes": size,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+In-process response cache for catalog reads.
+
+Catalog data only changes on upload/update/delete, so the formatted
+payloads of the catalog, song-detail and search routes are kept in a
+bounded LRU with a per-entry TTL. Writers call ``catalog_cache.clear()``,
+which only reaches their own process; routes that send a revision ETag
+therefore put the revision in the key, so another worker never serves a
+body cached before the write under the new ETag. For the rest the TTL
+bounds staleness across worker processes.
+
+``song_meta_cache`` holds compact title/artist/duration records for the
+play-history writers and the song detail route, so hot tracks are not
+re-read from ``music`` on every play.
+
+``identity_cache`` maps an email to the ``{id, email, username}`` record
+the auth routes return, so token refreshes and checks of tokens issued
+before the username claim don't read ``users`` every time. User writes
+invalidate their entry; the short TTL bounds staleness across workers.
+
+``revision_cache`` keeps each revision scope's ``(revision, updated_at)``
+for about a second, so conditional GETs and catalog cache hits do not
+read ``revisions`` on every request. Bumps update the writer's entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        """Resize or retune the cache, dropping current entries."""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key):
+        """Return the cached value or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a single entry if present."""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Invalidate every entry."""
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Return counters for sizing the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class SongMeta:
+    """Compact record of the song fields play history copies."""
+
+    __slots__ = ("title", "artist", "duration")
+
+    def __init__(self, title, artist, duration):
+        self.title = title
+        self.artist = artist
+        self.duration = duration
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(doc.get("title"), doc.get("artist"), doc.get("duration"))
+
+    def get(self, field, default=None):
+        """Dict-style access so callers can treat it like a music document."""
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+
+class SongMetadataCache(TTLCache):
+    """LRU of SongMeta records keyed by music ObjectId."""
+
+    def get_many(self, song_ids):
+        """Return ``(found, missing)``: a dict of cached records and the uncached ids."""
+        found = {}
+        missing = []
+        for song_id in song_ids:
+            meta = self.get(song_id)
+            if meta is None:
+                missing.append(song_id)
+            else:
+                found[song_id] = meta
+        return found, missing
+
+
+def cache_key(route, args=None, revision=None):
+    """Build a key from a route name, its query args (in any order) and the revision served."""
+    items = ()
+    if args:
+        items = tuple(sorted(
+            (name, tuple(args.getlist(name)) if hasattr(args, "getlist") else (args[name],))
+            for name in args
+        ))
+    return (route, revision, items)
+
+
+catalog_cache = TTLCache()
+song_meta_cache = SongMetadataCache(maxsize=50000, ttl=3600)
+identity_cache = TTLCache(maxsize=10000, ttl=60)
+revision_cache = TTLCache(maxsize=10000, ttl=1)
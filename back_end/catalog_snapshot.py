@@ -0,0 +1,94 @@
+"""
+Compressed, columnar catalog snapshots with delta sync.
+
+A snapshot lists every song column by column, so each field name appears
+once instead of once per song, and is compressed with brotli (when the
+``brotli`` package is installed and the client accepts it) or gzip::
+
+    {"revision": 42, "full": true, "fields": ["_id", "title", ...],
+     "count": 2, "columns": {"_id": [...], "title": [...], ...},
+     "deleted": []}
+
+``revision`` is the catalog revision the snapshot reflects. A client that
+passes it back as ``since`` receives only the songs written at or after
+that revision (``full`` is false) plus the ids deleted since, and merges
+them into its copy. Including the boundary revision re-sends a few songs
+but guarantees a write that was stamped while the previous snapshot was
+being read is not missed.
+"""
+import gzip
+import json
+from datetime import datetime
+from database import mongo
+from revisions import CATALOG_REVISION, get_revision
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# What a client needs to list, search and play the catalog; play counts
+# move too often for revision-based deltas
+SNAPSHOT_FIELDS = [
+    "_id", "title", "artist", "album", "genre", "duration", "cloudinary_url",
+    "cover_url", "uploaded_by", "created_at", "format", "likes", "public",
+]
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def build_snapshot(since=None):
+    """Build the columnar snapshot payload (a delta when ``since`` is given)."""
+    revision, _ = get_revision(CATALOG_REVISION)
+    # A revision from the future (e.g. a reset database) forces a full reload
+    full = since is None or since > revision
+    query = {} if full else {"catalog_rev": {"$gte": since}}
+
+    columns = {field: [] for field in SNAPSHOT_FIELDS}
+    projection = {field: 1 for field in SNAPSHOT_FIELDS}
+    for doc in mongo.db.music.find(query, projection).sort("_id", 1):
+        doc["_id"] = str(doc["_id"])
+        for field in SNAPSHOT_FIELDS:
+            columns[field].append(_value(doc.get(field)))
+
+    deleted = []
+    if not full:
+        deleted = [
+            str(doc["_id"]) for doc in mongo.db.music_tombstones.find(
+                {"catalog_rev": {"$gte": since}}, {"_id": 1}
+            )
+        ]
+    return {
+        "revision": revision,
+        "since": None if full else since,
+        "full": full,
+        "fields": SNAPSHOT_FIELDS,
+        "count": len(columns["_id"]),
+        "columns": columns,
+        "deleted": deleted,
+    }
+
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported Content-Encoding for an Accept-Encoding header."""
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return None
+
+
+def encode_snapshot(payload, encoding):
+    """Serialize a snapshot to compact JSON bytes, compressed with ``encoding``."""
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
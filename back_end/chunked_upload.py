@@ -0,0 +1,227 @@
+"""
+Resumable chunked uploads.
+
+A client opens a session, PUTs byte ranges of the file in any order (and
+in parallel), and then finalizes. Each chunk is copied from the request
+stream straight into a preallocated spool file with ``os.pwrite`` in
+small blocks, so a worker holds at most one block of the body in memory
+regardless of file size. Received ranges are recorded on the session in
+Mongo; after an interruption the client asks which ranges are missing and
+resends only those. Finalizing hands the spool file to the upload job
+queue, which sends it to storage and completes the session.
+
+Abandoned sessions are removed by a TTL index after a day; ``sweep_spool``
+(run hourly by the upload workers, or ``flask sweep-uploads``) deletes the
+spool files they leave behind.
+"""
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from flask import current_app
+from pymongo import ReturnDocument
+from database import mongo
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+COPY_BLOCK_SIZE = 64 * 1024
+SPOOL_SUFFIX = ".part"
+# Spool files younger than this are never swept: the file is created
+# before its session document is inserted
+SWEEP_GRACE_SECONDS = 3600
+SWEEP_BATCH_SIZE = 1000
+
+
+def spool_dir():
+    path = current_app.config.get("UPLOAD_SPOOL_DIR") or os.path.join(
+        tempfile.gettempdir(), "musicsphere_uploads"
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool_path(upload_id):
+    return os.path.join(spool_dir(), f"{upload_id}{SPOOL_SUFFIX}")
+
+
+def create_session(filename, size, metadata, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Open an upload session and preallocate its spool file."""
+    max_bytes = current_app.config.get("MAX_UPLOAD_BYTES", 1024 * 1024 * 1024)
+    if not isinstance(size, int) or size <= 0:
+        raise ValueError("size must be a positive integer")
+    if size > max_bytes:
+        raise ValueError(f"File too large; limit is {max_bytes} bytes")
+    chunk_size = max(COPY_BLOCK_SIZE, min(int(chunk_size), MAX_CHUNK_SIZE))
+
+    upload_id = uuid.uuid4().hex
+    # Sparse file: chunks are written in place at their offsets
+    with open(spool_path(upload_id), "wb") as f:
+        f.truncate(size)
+
+    session = {
+        "_id": upload_id,
+        "filename": filename,
+        "size": size,
+        "chunk_size": chunk_size,
+        "received": [],
+        "metadata": metadata,
+        "status": "open",
+        "created_at": datetime.utcnow()
+    }
+    mongo.db.upload_sessions.insert_one(session)
+    return session
+
+
+def get_session(upload_id):
+    return mongo.db.upload_sessions.find_one({"_id": upload_id})
+
+
+def merged_ranges(ranges):
+    """Merge [start, end) ranges into a sorted, non-overlapping list."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(session):
+    """Byte ranges [start, end) not yet received."""
+    missing = []
+    position = 0
+    for start, end in merged_ranges(session["received"]):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < session["size"]:
+        missing.append([position, session["size"]])
+    return missing
+
+
+def received_bytes(session):
+    return sum(end - start for start, end in merged_ranges(session["received"]))
+
+
+def parse_content_range(header):
+    """``(offset, length)`` of a ``bytes start-end/total`` header; ValueError if malformed."""
+    unit, _, spec = header.partition(" ")
+    span, _, _total = spec.partition("/")
+    start, _, end = span.partition("-")
+    if unit != "bytes":
+        raise ValueError("Malformed Content-Range header")
+    try:
+        return int(start), int(end) - int(start) + 1
+    except ValueError:
+        raise ValueError("Malformed Content-Range header")
+
+
+def write_chunk(session, offset, stream, length):
+    """Copy ``length`` bytes from ``stream`` into the spool file at ``offset``."""
+    if session["status"] != "open":
+        raise ValueError(f"Upload is {session['status']}")
+    if offset < 0 or length <= 0 or offset + length > session["size"]:
+        raise ValueError("Chunk lies outside the declared file size")
+    if length > MAX_CHUNK_SIZE:
+        raise ValueError(f"Chunks may not exceed {MAX_CHUNK_SIZE} bytes")
+
+    fd = os.open(spool_path(session["_id"]), os.O_WRONLY)
+    try:
+        position = offset
+        remaining = length
+        while remaining:
+            block = stream.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            view = memoryview(block)
+            while view:
+                written = os.pwrite(fd, view, position)
+                position += written
+                view = view[written:]
+            remaining -= len(block)
+    finally:
+        os.close(fd)
+    if remaining:
+        raise ValueError("Request body ended before the declared chunk length")
+
+    updated = mongo.db.upload_sessions.find_one_and_update(
+        {"_id": session["_id"], "status": "open"},
+        {"$push": {"received": [offset, offset + length]}},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        raise ValueError("Upload is no longer open")
+    return updated
+
+
+def begin_finalize(upload_id):
+    """Claim a complete session for finalizing; None if missing or not open."""
+    session = get_session(upload_id)
+    if not session or session["status"] != "open":
+        return session, False
+    if missing_ranges(session):
+        return session, False
+    claimed = mongo.db.upload_sessions.find_one_and_update(
+        {"_id": upload_id, "status": "open"},
+        {"$set": {"status": "finalizing"}},
+        return_document=ReturnDocument.AFTER
+    )
+    return claimed or session, claimed is not None
+
+
+def mark_finished(upload_id, status, **fields):
+    """Record the outcome of a session and drop its spool file."""
+    fields["status"] = status
+    mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": fields})
+    discard_spool(upload_id)
+
+
+def set_job(upload_id, job_id):
+    """Remember the upload job finalizing a session."""
+    mongo.db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"job_id": job_id}})
+
+
+def reopen(upload_id):
+    """Return a session to 'open' after a failed finalize so it can be retried."""
+    mongo.db.upload_sessions.update_one(
+        {"_id": upload_id, "status": "finalizing"}, {"$set": {"status": "open"}}
+    )
+
+
+def discard_spool(upload_id):
+    try:
+        os.remove(spool_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def sweep_spool(grace_seconds=SWEEP_GRACE_SECONDS):
+    """Delete spool files whose session expired or is no longer open; returns the count."""
+    cutoff = time.time() - grace_seconds
+    candidates = []
+    with os.scandir(spool_dir()) as entries:
+        for entry in entries:
+            if not entry.name.endswith(SPOOL_SUFFIX) or not entry.is_file():
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    candidates.append(entry.name[:-len(SPOOL_SUFFIX)])
+            except FileNotFoundError:
+                continue
+
+    removed = 0
+    for offset in range(0, len(candidates), SWEEP_BATCH_SIZE):
+        batch = candidates[offset:offset + SWEEP_BATCH_SIZE]
+        live = {
+            doc["_id"] for doc in mongo.db.upload_sessions.find(
+                {"_id": {"$in": batch}, "status": {"$in": ["open", "finalizing"]}},
+                {"_id": 1}
+            )
+        }
+        for upload_id in batch:
+            if upload_id not in live:
+                discard_spool(upload_id)
+                removed += 1
+    return removed
@@ -0,0 +1,172 @@
+"""
+Flask CLI maintenance commands (run with ``flask --app app <command>``).
+"""
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+import audio_analysis
+import chunked_upload
+import indexes
+import recommendations
+import search
+import similarity
+from database import mongo
+from models import Music, UserHistory
+from trending import trending_ranker
+
+# Tracks analysed between catalog stamps and checkpoints
+ANALYZE_BATCH_SIZE = 500
+ANALYZE_CHECKPOINT = "analyze-audio"
+
+indexes_cli = AppGroup("indexes", help="Provision and audit MongoDB indexes.")
+
+
+@indexes_cli.command("sync")
+def sync_indexes():
+    """Create missing declared indexes (idempotent, background builds)."""
+    created, conflicts = indexes.ensure_indexes()
+    for name in created:
+        click.echo(f"created {name}")
+    for name in conflicts:
+        click.echo(f"conflict {name}", err=True)
+    click.echo(f"{len(created)} created, {len(conflicts)} conflicting")
+    if conflicts:
+        raise SystemExit(1)
+
+
+@indexes_cli.command("report")
+def report_indexes():
+    """List missing, undeclared and unused indexes."""
+    for kind, names in indexes.index_report().items():
+        for name in names:
+            click.echo(f"{kind} {name}")
+
+
+@indexes_cli.command("check")
+def check_indexes():
+    """Sync indexes, then fail if any declared query shape needs a collection scan."""
+    _, conflicts = indexes.ensure_indexes()
+    unsupported = indexes.check_query_shapes()
+    for description in unsupported:
+        click.echo(f"COLLSCAN {description}", err=True)
+    if conflicts or unsupported:
+        raise SystemExit(1)
+    click.echo(f"All {len(indexes.QUERY_SHAPES)} query shapes are index-backed")
+
+
+def _save_analysis_progress(song_ids, last_id, force):
+    """Stamp analysed songs, then record ``last_id`` as the last track visited."""
+    if song_ids:
+        Music.mark_catalog_changed(song_ids)
+    if last_id is not None:
+        mongo.db.maintenance_checkpoints.update_one(
+            {"_id": ANALYZE_CHECKPOINT},
+            {"$set": {"last_id": last_id, "force": force, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the Flask CLI."""
+    app.cli.add_command(indexes_cli)
+
+    @app.cli.command("search-index")
+    @click.option("--batch-size", default=500, show_default=True,
+                  help="Documents per bulk write while backfilling tokens.")
+    def search_index(batch_size):
+        """Build the search indexes and backfill search tokens."""
+        indexes.ensure_indexes(["music"])
+        updated = search.backfill_search_tokens(batch_size=batch_size)
+        click.echo(f"Search indexes ready; {updated} music documents re-tokenized")
+
+    @app.cli.command("backfill-song-stats")
+    @click.option("--username", default=None,
+                  help="Rebuild a single user's aggregates instead of everyone's.")
+    def backfill_song_stats(username):
+        """Build user_song_stats from existing user_history."""
+        indexes.ensure_indexes(["user_song_stats"])
+        count = UserHistory.backfill_song_stats(username=username)
+        click.echo(f"user_song_stats now holds {count} rows")
+
+    @app.cli.command("sweep-uploads")
+    @click.option("--grace", default=chunked_upload.SWEEP_GRACE_SECONDS, show_default=True,
+                  help="Keep spool files modified less than this many seconds ago.")
+    def sweep_uploads(grace):
+        """Delete spool files of expired or finished chunked-upload sessions."""
+        removed = chunked_upload.sweep_spool(grace_seconds=grace)
+        click.echo(f"Removed {removed} spool files")
+
+    @app.cli.command("rebuild-trending")
+    def rebuild_trending():
+        """Recompute trending scores from the last five weeks of play history."""
+        count = trending_ranker.rebuild()
+        click.echo(f"trending_scores now holds {count} songs")
+
+    @app.cli.command("build-recommendations")
+    @click.option("--full", is_flag=True,
+                  help="Recompute every song instead of only recently played ones.")
+    @click.option("--k", default=similarity.DEFAULT_K, show_default=True,
+                  help="Neighbours stored per song.")
+    def build_recommendations(full, k):
+        """Build the item-item similarity index from play history."""
+        indexes.ensure_indexes(["user_history"])
+        stats = recommendations.build_index(k=k, full=full)
+        click.echo(f"Recommendation index built: {stats}")
+
+    @app.cli.command("analyze-audio")
+    @click.option("--force", is_flag=True,
+                  help="Re-analyse tracks that already have results.")
+    @click.option("--limit", default=0, help="Stop after this many tracks (0 = all).")
+    @click.option("--restart", is_flag=True,
+                  help="Ignore the checkpoint an interrupted run left behind.")
+    def analyze_audio(force, limit, restart):
+        """Backfill duration, loudness and waveform peaks for the catalog.
+
+        Tracks are walked newest first, a keyset page at a time. Every
+        ANALYZE_BATCH_SIZE tracks the analysed songs are stamped and the
+        last visited id checkpointed, so an interrupted or ``--limit`` run
+        resumes where it stopped.
+        """
+        query = {} if force else {"analysis": {"$exists": False}}
+        checkpoint = None
+        if not restart:
+            checkpoint = mongo.db.maintenance_checkpoints.find_one(
+                {"_id": ANALYZE_CHECKPOINT, "force": force}
+            )
+        if checkpoint:
+            query["_id"] = {"$lt": checkpoint["last_id"]}
+            click.echo(f"Resuming after {checkpoint['last_id']}")
+
+        analysed = []
+        total = failed = 0
+        last_id = None
+        finished = True
+        for song in Music.iter_music(query, fields=["cloudinary_url", "duration"]):
+            if limit and total + failed >= limit:
+                finished = False
+                break
+            if len(analysed) >= ANALYZE_BATCH_SIZE:
+                _save_analysis_progress(analysed, last_id, force)
+                analysed = []
+            source = song.get("cloudinary_url")
+            try:
+                result = audio_analysis.analyze(source)
+            except Exception as e:
+                failed += 1
+                click.echo(f"skipped {song['_id']}: {e}", err=True)
+            else:
+                update = {"analysis": audio_analysis.to_document(result)}
+                if not song.get("duration"):
+                    update["duration"] = result["duration"]
+                mongo.db.music.update_one({"_id": song["_id"]}, {"$set": update})
+                analysed.append(song["_id"])
+                total += 1
+            last_id = song["_id"]
+
+        if finished:
+            if analysed:
+                Music.mark_catalog_changed(analysed)
+            mongo.db.maintenance_checkpoints.delete_one({"_id": ANALYZE_CHECKPOINT})
+        else:
+            _save_analysis_progress(analysed, last_id, force)
+        click.echo(f"Analysed {total} tracks, {failed} failed")
@@ -1,3 +1,156 @@
+"""
+MongoDB client setup.
+
+``mongo`` is flask_pymongo's handle; ``init_db`` builds it from app
+config instead of driver defaults, so every worker process gets a bounded
+pool (``MONGO_MAX_POOL_SIZE`` is per process: total connections are that
+times the number of workers), a short wait-queue timeout instead of hung
+requests, wire compression where the codec is installed, and timeouts.
+
+``secondary_db()`` is the database with ``MONGO_SECONDARY_READ_PREFERENCE``
+(default ``secondaryPreferred``) for reads that tolerate replication lag:
+search, trending/similar/recommendation lookups and the analytics scans.
+Writes, and reads whose ETag or delta-sync revision must match the data
+they return (the catalog pages, song detail, history and snapshots), stay
+on the primary.
+
+``PoolMonitor`` counts connection pool events per server, so
+``/api/audio/db/pool/stats`` can show checked-out vs available connections.
+"""
+import threading
+from flask import current_app
 from flask_pymongo import PyMongo
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+mongo = PyMongo()
+
+# app.config key -> MongoClient keyword
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_CONNECTING": "maxConnecting",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_TIMEOUT_MS": "timeoutMS",
+    "MONGO_ZLIB_COMPRESSION_LEVEL": "zlibCompressionLevel",
+    "MONGO_APP_NAME": "appname",
+}
+# Compressor -> the module PyMongo needs for it
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def available_compressors(names):
+    """The requested compressors whose codec is importable, in order of preference."""
+    available = []
+    for name in names:
+        module = COMPRESSOR_MODULES.get(name)
+        if module is None:
+            raise ValueError(f"Unknown compressor: {name}")
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def client_options(config):
+    """MongoClient keyword arguments from app config (unset keys keep driver defaults)."""
+    options = {
+        option: config[key] for key, option in CLIENT_OPTIONS.items()
+        if config.get(key) is not None
+    }
+    compressors = available_compressors(config.get("MONGO_COMPRESSORS") or [])
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def secondary_read_preference(config):
+    mode = read_pref_mode_from_name(config.get("MONGO_SECONDARY_READ_PREFERENCE", "primary"))
+    staleness = config.get("MONGO_MAX_STALENESS_SECONDS") or -1
+    if mode == 0:
+        return make_read_preference(mode, None)
+    return make_read_preference(mode, None, max_staleness=staleness)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _bump(self, address, **deltas):
+        with self._lock:
+            pool = self._pools.setdefault(address, {
+                "open": 0, "checked_out": 0, "waiting": 0,
+                "checkouts": 0, "checkout_failures": 0, "cleared": 0,
+            })
+            for field, delta in deltas.items():
+                pool[field] += delta
+
+    def pool_created(self, event):
+        self._bump(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._bump(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._bump(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._bump(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._bump(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._bump(event.address, waiting=-1, checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._bump(event.address, checked_out=-1)
+
+    def stats(self, max_pool_size=None):
+        with self._lock:
+            pools = {address: dict(pool) for address, pool in self._pools.items()}
+        servers = []
+        for (host, port), pool in sorted(pools.items()):
+            pool["available"] = pool["open"] - pool["checked_out"]
+            servers.append(dict(pool, address=f"{host}:{port}"))
+        return {"max_pool_size": max_pool_size, "servers": servers}
+
+
+pool_monitor = PoolMonitor()
+
+
+def init_db(app):
+    """Create the client for an app from its MONGO_* config."""
+    options = client_options(app.config)
+    mongo.init_app(app, event_listeners=[pool_monitor], **options)
+    app.extensions["mongo_secondary"] = mongo.db.with_options(
+        read_preference=secondary_read_preference(app.config)
+    )
+    return options
+
 
-mongo = PyMongo()
\ No newline at end of file
+def secondary_db():
+    """The app database, reading with the lag-tolerant read preference."""
+    return current_app.extensions["mongo_secondary"]
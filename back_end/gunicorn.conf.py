@@ -0,0 +1,69 @@
+"""
+gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py
+
+One worker process per CPU core available to this process (override with
+``WEB_CONCURRENCY``), each with ``GUNICORN_THREADS`` request threads. Every
+worker has its own Mongo pool of ``MONGO_MAX_POOL_SIZE`` connections, so
+keep threads at or below that and budget ``workers * MONGO_MAX_POOL_SIZE``
+connections on the server.
+
+On SIGTERM a worker stops accepting requests, finishes the ones in flight
+(``GRACEFUL_TIMEOUT`` seconds) and then runs ``wsgi.shutdown``.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger("gunicorn.error")
+# Config is read before the app is preloaded, so this times the master's imports
+_loaded_at = time.perf_counter()
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+wsgi_app = "wsgi:application"
+bind = os.getenv("GUNICORN_BIND", f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv("WEB_CONCURRENCY", _cores()))
+worker_class = "gthread"
+threads = min(
+    int(os.getenv("GUNICORN_THREADS", 8)), int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+)
+# Import the code once in the master; workers build the app after forking
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then so slow leaks cannot accumulate (0 = never)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+
+
+def when_ready(server):
+    if os.getenv("ENSURE_INDEXES_ON_STARTUP", "False").lower() == "true":
+        import wsgi
+
+        wsgi.sync_indexes()
+    logger.info(
+        "Master ready in %.1f ms, starting %d workers x %d threads",
+        (time.perf_counter() - _loaded_at) * 1000, server.cfg.workers, server.cfg.threads
+    )
+
+
+def post_fork(server, worker):
+    import wsgi
+
+    wsgi.load()
+
+
+def worker_exit(server, worker):
+    import wsgi
+
+    wsgi.shutdown(timeout=server.cfg.graceful_timeout / 2)
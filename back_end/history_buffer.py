@@ -0,0 +1,190 @@
+"""
+Write-behind buffer for play-history events.
+
+``POST /history/record`` only enqueues the event; a background thread
+drains the queue in batches (on size or time thresholds) through a writer
+that resolves songs with one ``$in`` query and inserts with
+``insert_many(ordered=False)``. The queue is bounded: when it is full,
+producers wait briefly and then get ``BufferFull`` so the route can shed
+load instead of growing memory. A batch whose write raises (e.g. Mongo is
+unreachable) is written again after the next flush interval, up to
+``max_attempts`` writes, before its events are dropped. Pending events
+are flushed at exit.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from background import PerProcess, start_thread
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    """Raised when the buffer stays full past the enqueue timeout."""
+
+
+class HistoryWriteBuffer:
+    def __init__(self, max_events=10000, batch_size=500, flush_interval=1.0,
+                 enqueue_timeout=0.05, max_attempts=3):
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self._writer = None
+        self._app = None
+        self._events = deque()
+        # (batch, attempts so far) of a failed write, retried before new events
+        self._retry = None
+        self._cond = threading.Condition()
+        self._worker = PerProcess(self._start_worker)
+        self._stopping = False
+        self._atexit_registered = False
+        # Metrics
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_events = 0
+        self.failed_events = 0
+        self.retried_batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def init_app(self, app, writer):
+        """Bind to an app and the batch writer, which returns (inserted, errors)."""
+        self._app = app
+        self._writer = writer
+        self.max_events = app.config.get("HISTORY_BUFFER_MAX_EVENTS", self.max_events)
+        self.batch_size = app.config.get("HISTORY_FLUSH_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get("HISTORY_FLUSH_INTERVAL", self.flush_interval)
+        self.enqueue_timeout = app.config.get(
+            "HISTORY_ENQUEUE_TIMEOUT", self.enqueue_timeout
+        )
+        self.max_attempts = app.config.get("HISTORY_FLUSH_MAX_ATTEMPTS", self.max_attempts)
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+    def enqueue(self, event):
+        """Queue one event, waiting up to enqueue_timeout for space."""
+        with self._cond:
+            self._worker.ensure()
+            deadline = time.monotonic() + self.enqueue_timeout
+            while len(self._events) >= self.max_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise BufferFull("Play history buffer is full")
+                self._cond.wait(remaining)
+            self._events.append(event)
+            self.enqueued += 1
+            if len(self._events) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _start_worker(self):
+        self._stopping = False
+        return [start_thread(self._run, "history-write-buffer")]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._events) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, attempts = self._next_batch()
+                # Wake producers waiting for space
+                self._cond.notify_all()
+            if batch:
+                self._flush(batch, attempts)
+            with self._cond:
+                if self._stopping and not self._events and self._retry is None:
+                    return
+
+    def _next_batch(self):
+        """Pop the batch to write next, a failed one first; call with the lock held."""
+        if self._retry is not None:
+            retry, self._retry = self._retry, None
+            return retry
+        count = min(self.batch_size, len(self._events))
+        return [self._events.popleft() for _ in range(count)], 0
+
+    def _flush(self, batch, attempts=0):
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                inserted, errors = self._writer(batch)
+            self.flushed_events += inserted
+            self.failed_events += len(errors)
+        except Exception:
+            attempts += 1
+            if attempts < self.max_attempts:
+                self.retried_batches += 1
+                logger.warning(
+                    "Failed to flush %d play history events (attempt %d of %d), will retry",
+                    len(batch), attempts, self.max_attempts, exc_info=True
+                )
+                with self._cond:
+                    self._retry = (batch, attempts)
+            else:
+                self.failed_events += len(batch)
+                logger.exception(
+                    "Dropped %d play history events after %d failed flushes",
+                    len(batch), attempts
+                )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    def flush(self):
+        """Synchronously write everything currently queued."""
+        while True:
+            with self._cond:
+                batch, attempts = self._next_batch()
+                self._cond.notify_all()
+            if not batch:
+                return
+            self._flush(batch, attempts)
+
+    def stop(self, timeout=10.0):
+        """Stop the worker after it drains the queue; flush inline if it cannot."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._worker.started:
+            for thread in self._worker.threads:
+                thread.join(timeout)
+        if self._app is not None:
+            self.flush()
+
+    def stats(self):
+        """Return queue depth and flush metrics."""
+        with self._cond:
+            depth = len(self._events)
+        return {
+            "queued": depth,
+            "max_events": self.max_events,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events,
+            "failed_events": self.failed_events,
+            "retried_batches": self.retried_batches,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3)
+            if self.flushes else 0.0,
+        }
+
+
+play_history_buffer = HistoryWriteBuffer()
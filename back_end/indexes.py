@@ -0,0 +1,185 @@
+"""
+Declared MongoDB indexes and the query shapes they must support.
+
+``INDEXES`` is the single source of truth for every secondary index the
+models rely on. ``ensure_indexes`` reconciles the database with it
+idempotently (missing indexes are built in the background, conflicting
+ones are reported), ``index_report`` lists missing, undeclared and unused
+indexes, and ``check_query_shapes`` explains each query in ``QUERY_SHAPES``
+and flags any that would fall back to a collection scan, so CI can fail
+when a new query in models.py lands without an index.
+"""
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+from database import mongo
+import search
+
+
+class IndexSpec:
+    """One declared index: its collection, key pattern and create options."""
+
+    def __init__(self, collection, keys, **options):
+        self.collection = collection
+        self.keys = list(keys)
+        self.options = options
+        self.name = options.get("name") or "_".join(
+            f"{field}_{direction}" for field, direction in self.keys
+        )
+
+    def matches(self, info):
+        """Whether an existing index_information() entry has the same definition."""
+        if info.get("unique", False) != self.options.get("unique", False):
+            return False
+        if any(direction == TEXT for _, direction in self.keys):
+            # Text indexes are stored as _fts/_ftsx keys; compare weights instead
+            return set(info.get("weights", {})) == {f for f, _ in self.keys}
+        existing = [
+            (field, int(direction) if isinstance(direction, float) else direction)
+            for field, direction in info["key"]
+        ]
+        return existing == [
+            (field, direction) for field, direction in self.keys
+        ]
+
+
+INDEXES = [
+    IndexSpec("users", [("email", ASCENDING)], unique=True),
+    IndexSpec("user_history", [("username", ASCENDING), ("played_at", DESCENDING)]),
+    # Trending rebuilds scan the plays since a date
+    IndexSpec("user_history", [("played_at", DESCENDING)]),
+    # Catalog pages are keyset-paginated on _id (which encodes creation
+    # time), so the public listing needs (public, _id) rather than created_at
+    IndexSpec("music", [("public", ASCENDING), ("_id", DESCENDING)]),
+    IndexSpec("music", [("search_tokens", ASCENDING)], name=search.TOKEN_INDEX_NAME),
+    IndexSpec(
+        "music",
+        [(field, TEXT) for field in search.SEARCH_FIELDS],
+        name=search.TEXT_INDEX_NAME,
+        weights=search.FIELD_WEIGHTS,
+        default_language="none",
+    ),
+    IndexSpec(
+        "user_song_stats",
+        [("username", ASCENDING), ("song_id", ASCENDING)],
+        unique=True,
+    ),
+    IndexSpec("user_song_stats", [("username", ASCENDING), ("last_played", DESCENDING)]),
+    IndexSpec("user_song_stats", [("username", ASCENDING), ("play_count", DESCENDING)]),
+    # One song per file content, so rerunning an interrupted ingest is idempotent
+    IndexSpec("music", [("content_hash", ASCENDING)], unique=True, sparse=True),
+    # Makes the upsert that creates a song from an upload job idempotent
+    IndexSpec("music", [("upload_job_id", ASCENDING)], unique=True, sparse=True),
+    IndexSpec("upload_jobs", [("status", ASCENDING), ("lease_until", ASCENDING)]),
+    IndexSpec("upload_jobs", [("status", ASCENDING), ("updated_at", ASCENDING)]),
+    # Catalog snapshot deltas: songs and deletions since a revision
+    IndexSpec("music", [("catalog_rev", ASCENDING)], sparse=True),
+    IndexSpec("music_tombstones", [("catalog_rev", ASCENDING)]),
+    # Abandoned chunked-upload sessions expire after a day
+    IndexSpec("upload_sessions", [("created_at", ASCENDING)], expireAfterSeconds=86400),
+]
+
+# Representative reads from models.py: (description, collection, filter, sort)
+QUERY_SHAPES = [
+    ("User.find_by_email", "users", {"email": "a@example.com"}, None),
+    ("UserHistory.get_user_history", "user_history",
+     {"username": "user"}, [("played_at", DESCENDING)]),
+    ("Music.get_music_page", "music", {}, [("_id", DESCENDING)]),
+    ("Music.get_public_music", "music",
+     {"public": True, "_id": {"$lt": ObjectId()}}, [("_id", DESCENDING)]),
+    ("Music.get_music_by_id", "music", {"_id": ObjectId()}, None),
+    ("search_catalog (exact)", "music", {"search_tokens": {"$all": ["=lo"]}}, None),
+    ("search_catalog (prefix)", "music", {"search_tokens": {"$all": ["lo"]}}, None),
+    ("search_catalog (text)", "music", {"$text": {"$search": "love"}}, None),
+    ("UserHistory.get_recently_played", "user_song_stats",
+     {"username": "user"}, [("last_played", DESCENDING)]),
+    ("UserHistory.get_most_played", "user_song_stats",
+     {"username": "user"}, [("play_count", DESCENDING)]),
+    ("UserHistory.update_song_stats", "user_song_stats",
+     {"username": "user", "song_id": ObjectId()}, None),
+    ("recommendations.build_index (incremental)", "user_history",
+     {"_id": {"$gte": ObjectId.from_datetime(datetime.utcnow())}}, None),
+    ("TrendingRanker.rebuild", "user_history",
+     {"played_at": {"$gte": datetime.utcnow()}}, None),
+    ("catalog_snapshot (delta)", "music", {"catalog_rev": {"$gte": 1}}, None),
+    ("catalog_snapshot (deletions)", "music_tombstones", {"catalog_rev": {"$gte": 1}}, None),
+    ("process_upload_job", "music", {"upload_job_id": "job"}, None),
+    ("UploadJobQueue._recover", "upload_jobs",
+     {"status": "processing", "lease_until": {"$lt": datetime.utcnow()}}, None),
+]
+
+
+def _specs(collections=None):
+    return [s for s in INDEXES if not collections or s.collection in collections]
+
+
+def ensure_indexes(collections=None):
+    """Create any missing declared indexes; returns (created, conflicts) lists."""
+    created = []
+    conflicts = []
+    for spec in _specs(collections):
+        existing = mongo.db[spec.collection].index_information()
+        info = existing.get(spec.name)
+        if info is None:
+            try:
+                mongo.db[spec.collection].create_index(
+                    spec.keys, background=True, **dict(spec.options, name=spec.name)
+                )
+            except OperationFailure as e:
+                # e.g. duplicate values blocking a unique index
+                conflicts.append(f"{spec.collection}.{spec.name}: {e}")
+                continue
+            created.append(f"{spec.collection}.{spec.name}")
+        elif not spec.matches(info):
+            conflicts.append(f"{spec.collection}.{spec.name}")
+    return created, conflicts
+
+
+def index_report():
+    """Report declared-but-missing, undeclared and never-used indexes."""
+    declared = {}
+    for spec in INDEXES:
+        declared.setdefault(spec.collection, set()).add(spec.name)
+
+    report = {"missing": [], "undeclared": [], "unused": []}
+    for collection in sorted(declared):
+        existing = mongo.db[collection].index_information()
+        for name in sorted(declared[collection] - set(existing)):
+            report["missing"].append(f"{collection}.{name}")
+        for name in sorted(set(existing) - declared[collection] - {"_id_"}):
+            report["undeclared"].append(f"{collection}.{name}")
+        try:
+            # Access counters reset on server restart, so "unused" means
+            # unused since the mongod process started
+            for stat in mongo.db[collection].aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                    report["unused"].append(f"{collection}.{stat['name']}")
+        except OperationFailure:
+            pass
+    return report
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def check_query_shapes():
+    """Explain every declared query shape; returns the ones that scan the collection."""
+    unsupported = []
+    for description, collection, query, sort in QUERY_SHAPES:
+        cursor = mongo.db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.limit(10).explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_plan_stages(plan)):
+            unsupported.append(description)
+    return unsupported
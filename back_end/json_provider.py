@@ -0,0 +1,68 @@
+"""
+Flask JSON provider backed by orjson.
+
+orjson serializes dicts and lists in C, several times faster than the
+stdlib encoder, and ``response`` hands its bytes straight to the response
+without a str round trip. ObjectIds are written as hex strings, so views
+can return documents straight from the driver. Datetimes keep Flask's
+HTTP-date format so existing clients see the same values. When orjson is
+not installed, the same conversions run on top of Flask's default provider.
+"""
+from datetime import date
+from bson.objectid import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, date):
+        return http_date(value)
+    return DefaultJSONProvider.default(value)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """Default provider that also understands ObjectId."""
+
+    default = staticmethod(_default)
+
+    def dumps_bytes(self, obj):
+        """Encoded response body, for servers outside Flask (asgi.py)."""
+        return self.dumps(obj).encode("utf-8")
+
+
+class OrjsonProvider(MongoJSONProvider):
+    # Key order carries no meaning in this API; sorting costs time
+    sort_keys = False
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=_default, option=self._options())
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the fastest available JSON provider on the app."""
+    provider = OrjsonProvider if orjson is not None else MongoJSONProvider
+    app.json = provider(app)
+    return app.json
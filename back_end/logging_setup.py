@@ -0,0 +1,201 @@
+"""
+Application logging: per-logger levels and sampling, text or JSON lines,
+written by a background thread.
+
+Request threads only filter a record and put it on a bounded queue; a
+``QueueListener`` thread formats it and does the I/O. Messages are
+formatted there too, so call loggers with ``%`` arguments (never
+f-strings) and pass plain values, not request-bound objects. When the
+queue is full, records are dropped and counted rather than blocking the
+request.
+
+Configuration (environment variables read in ``create_app``):
+
+* ``LOG_LEVEL`` - root level, default ``INFO``;
+* ``LOG_LEVELS`` - per-logger levels, e.g. ``routes.audio=WARNING,pymongo=ERROR``;
+* ``LOG_SAMPLING`` - keep this fraction of records below WARNING, keyed by
+  logger name or by route template, e.g. ``routes.audio=0.1,/api/audio/search=0.01``;
+  the route wins over the logger, and warnings and errors are never sampled;
+* ``LOG_FORMAT`` - ``text`` (default) or ``json``;
+* ``LOG_FILE`` - write here instead of stderr;
+* ``LOG_QUEUE_SIZE`` - records buffered before new ones are dropped.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from background import PerProcess
+
+TEXT_FORMAT = "[%(asctime)s] %(levelname)s in %(name)s: %(message)s"
+# Attributes every LogRecord has; anything else came in through ``extra=``
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"
+}
+
+
+def parse_spec(spec, convert):
+    """``"a=1,b=2"`` -> ``{"a": convert("1"), "b": convert("2")}``."""
+    parsed = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=value in logging spec, got {item!r}")
+        parsed[key.strip()] = convert(value.strip())
+    return parsed
+
+
+def _level(value):
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+    return level
+
+
+def _current_route():
+    from flask import has_request_context, request
+
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return None
+
+
+class SamplingFilter(logging.Filter):
+    """Tags records with their route and drops a share of low-level ones."""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+        self._logger_rates = {}
+
+    def _rate_for_logger(self, name):
+        rate = self._logger_rates.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._logger_rates[name] = rate
+        return rate
+
+    def filter(self, record):
+        # The listener thread has no request context, so capture the route now
+        record.route = route = _current_route()
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(route) if route is not None else None
+        if rate is None:
+            rate = self._rate_for_logger(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra=`` fields at the top level."""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing when stopped with a full queue
+        self.queue.put(self._sentinel)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Non-blocking queue handler whose listener thread starts lazily per process."""
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.targets = handlers
+        self.dropped = 0
+        self._listener = None
+        self._process = PerProcess(self._start)
+
+    def prepare(self, record):
+        # Formatting happens in the listener thread, not here
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._process.ensure()
+        super().emit(record)
+
+    def _start(self):
+        # A forked child inherits the queue but not the listener thread
+        self.queue = queue.Queue(self.maxsize)
+        self._listener = _Listener(self.queue, *self.targets, respect_handler_level=True)
+        self._listener.start()
+
+    def _stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+
+    def stop(self):
+        """Drain the queue and stop this process's listener."""
+        self._process.reset(self._stop)
+        self._listener = None
+
+    def close(self):
+        self.stop()
+        for handler in self.targets:
+            handler.close()
+        super().close()
+
+
+_installed = None
+
+
+def init_logging(app):
+    """Route all logging through one background queue handler, configured from app.config."""
+    global _installed
+    config = app.config
+    if config.get("LOG_FILE"):
+        target = logging.FileHandler(config["LOG_FILE"])
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    if config.get("LOG_FORMAT", "text") == "json":
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    handler = BackgroundQueueHandler([target], maxsize=config.get("LOG_QUEUE_SIZE", 10000))
+    handler.addFilter(SamplingFilter(parse_spec(config.get("LOG_SAMPLING"), float)))
+
+    root = logging.getLogger()
+    if _installed is not None:
+        root.removeHandler(_installed)
+        _installed.close()
+    else:
+        atexit.register(lambda: _installed and _installed.stop())
+    root.addHandler(handler)
+    root.setLevel(_level(config.get("LOG_LEVEL", "INFO")))
+    for name, level in parse_spec(config.get("LOG_LEVELS"), _level).items():
+        logging.getLogger(name).setLevel(level)
+    _installed = handler
+    return handler
@@ -0,0 +1,321 @@
+"""
+Request latency instrumentation, exposed in the Prometheus text format.
+
+Each request is timed by route template (``/api/audio/music/<song_id>``,
+never the raw path, to keep label cardinality bounded), and the time it
+spends inside MongoDB and outbound storage calls is tallied alongside:
+
+* a PyMongo ``CommandListener`` adds each command's driver-measured
+  duration to the current request and to a per-command histogram;
+* ``storage_timer`` wraps uploads to Cloudinary or local storage.
+
+The tally lives in a ContextVar, so it follows the request through the
+sync Flask app and the async ASGI routes alike; commands issued outside a
+request (background flushes, upload jobs, CLI) only feed the histograms.
+
+``GET /metrics`` serves everything this process recorded; every worker
+process keeps its own numbers, so scrape each worker (or sum them). With
+``SLOW_REQUEST_MS`` set, requests slower than that are logged with their
+DB/storage breakdown.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            for labels, value in items:
+                lines.extend(self._render_series(labels, value))
+        return lines
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, labels, series):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            label_str = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+        label_str = _format_labels(self.labelnames, labels, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{label_str} {count}")
+        plain = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+        lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route")
+))
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "Requests by route and status.", ("method", "route", "status")
+))
+IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ("method", "route")
+))
+REQUEST_SIZE = registry.register(Histogram(
+    "http_request_size_bytes", "Request body sizes by route.", ("method", "route"),
+    buckets=SIZE_BUCKETS
+))
+RESPONSE_SIZE = registry.register(Histogram(
+    "http_response_size_bytes", "Response body sizes by route (streamed bodies excluded).",
+    ("method", "route"), buckets=SIZE_BUCKETS
+))
+REQUEST_DB_TIME = registry.register(Histogram(
+    "http_request_db_seconds", "MongoDB time per request by route.", ("method", "route")
+))
+REQUEST_DB_OPS = registry.register(Histogram(
+    "http_request_db_operations", "MongoDB commands per request by route.",
+    ("method", "route"), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+))
+MONGO_COMMANDS = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency as measured by the driver.",
+    ("command", "outcome")
+))
+STORAGE_CALLS = registry.register(Histogram(
+    "storage_call_duration_seconds", "Outbound media storage call latency.",
+    ("backend", "operation", "outcome")
+))
+
+
+class RequestStats:
+    """Time and operation tally for the request in progress."""
+
+    __slots__ = ("method", "route", "started", "db_seconds", "db_ops",
+                 "storage_seconds", "storage_calls", "status", "response_bytes")
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.db_ops = 0
+        self.storage_seconds = 0.0
+        self.storage_calls = 0
+        self.status = None
+        self.response_bytes = None
+
+
+current_request = ContextVar("current_request", default=None)
+slow_request_ms = 0
+
+
+def begin_request(method, route, request_bytes=None):
+    """Start timing a request; returns ``(stats, token)`` for ``end_request``."""
+    stats = RequestStats(method, route)
+    IN_FLIGHT.inc(method, route)
+    if request_bytes:
+        REQUEST_SIZE.observe(request_bytes, method, route)
+    return stats, current_request.set(stats)
+
+
+def end_request(stats, token):
+    """Record a finished request (``stats.status`` unset means it raised)."""
+    elapsed = time.perf_counter() - stats.started
+    current_request.reset(token)
+    method, route = stats.method, stats.route
+    IN_FLIGHT.dec(method, route)
+    REQUEST_LATENCY.observe(elapsed, method, route)
+    REQUESTS.inc(method, route, stats.status or 500)
+    REQUEST_DB_TIME.observe(stats.db_seconds, method, route)
+    REQUEST_DB_OPS.observe(stats.db_ops, method, route)
+    if stats.response_bytes is not None:
+        RESPONSE_SIZE.observe(stats.response_bytes, method, route)
+    if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+        logger.warning(
+            "Slow request %s %s -> %s: %.1f ms (db %.1f ms in %d ops, "
+            "storage %.1f ms in %d calls, other %.1f ms, %s bytes)",
+            method, route, stats.status, elapsed * 1000,
+            stats.db_seconds * 1000, stats.db_ops,
+            stats.storage_seconds * 1000, stats.storage_calls,
+            (elapsed - stats.db_seconds - stats.storage_seconds) * 1000,
+            stats.response_bytes if stats.response_bytes is not None else "streamed"
+        )
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Feeds driver-measured command durations into the current request."""
+
+    def started(self, event):
+        pass
+
+    def _record(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMANDS.observe(seconds, event.command_name, outcome)
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_seconds += seconds
+            stats.db_ops += 1
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+
+command_timer = CommandTimer()
+_listener_registered = False
+
+
+def register_command_listener():
+    """Install the listener for every client created afterwards (idempotent)."""
+    global _listener_registered
+    if not _listener_registered:
+        monitoring.register(command_timer)
+        _listener_registered = True
+
+
+@contextmanager
+def storage_timer(backend, operation):
+    """Time an outbound storage call."""
+    started = time.perf_counter()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        seconds = time.perf_counter() - started
+        STORAGE_CALLS.observe(seconds, backend, operation, outcome)
+        stats = current_request.get()
+        if stats is not None:
+            stats.storage_seconds += seconds
+            stats.storage_calls += 1
+
+
+def init_metrics(app):
+    """Time every request of a Flask app and serve ``/metrics``.
+
+    Must run before the Mongo client is created, so the command listener
+    is attached to it.
+    """
+    from flask import Response, g, request
+
+    global slow_request_ms
+    slow_request_ms = app.config.get("SLOW_REQUEST_MS", 0)
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    register_command_listener()
+
+    @app.before_request
+    def start_request_timer():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g._request_stats = begin_request(request.method, route, request.content_length)
+
+    @app.after_request
+    def record_response(response):
+        started = g.get("_request_stats")
+        if started is not None:
+            stats = started[0]
+            stats.status = response.status_code
+            if not response.is_streamed:
+                stats.response_bytes = response.content_length
+        return response
+
+    @app.teardown_request
+    def stop_request_timer(exc):
+        started = g.pop("_request_stats", None)
+        if started is not None:
+            end_request(*started)
+
+    def metrics_endpoint():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
@@ -1,9 +1,26 @@
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from database import mongo
+from search import INTERNAL_PROJECTION, SEARCH_FIELDS, build_search_tokens, search_catalog
+from cache import SongMeta, catalog_cache, identity_cache, song_meta_cache
+from revisions import CATALOG_REVISION, bump_revision, history_revision
+from history_buffer import play_history_buffer
+from trending import trending_ranker
+import base64
+import binascii
+import logging
 import re
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
 class User:
     @staticmethod
     def validate_email(email):
@@ -59,21 +76,180 @@ class User:
         # Create user
         user = {
             "email": email,
-            "password": generate_password_hash(password),
+            "password": User.hash_password(password),
             "username": username
         }
-        return mongo.db.users.insert_one(user)
+        result = mongo.db.users.insert_one(user)
+        identity_cache.invalidate(email)
+        return result
     
     @staticmethod
     def find_by_email(email):
         return mongo.db.users.find_one({"email": email})
-    
+
+    @staticmethod
+    def identity(user):
+        """The public {id, email, username} record of a user document."""
+        return {"id": str(user["_id"]), "email": user["email"], "username": user["username"]}
+
+    @staticmethod
+    def get_identity(email):
+        """Cached identity for an email, or None if there is no such user."""
+        identity = identity_cache.get(email)
+        if identity is None:
+            user = mongo.db.users.find_one({"email": email}, {"email": 1, "username": 1})
+            if not user:
+                return None
+            identity = User.identity(user)
+            identity_cache.set(email, identity)
+        return identity
+
+    @staticmethod
+    def hash_password(password):
+        """Hash with the configured method and salt length."""
+        return generate_password_hash(
+            password,
+            method=current_app.config["PASSWORD_HASH_METHOD"],
+            salt_length=current_app.config["PASSWORD_SALT_LENGTH"]
+        )
+
+    @staticmethod
+    def hash_parameters(password_hash):
+        """(full method string, salt length) a werkzeug hash was made with."""
+        method, salt, _ = password_hash.split("$", 2)
+        return method, len(salt)
+
+    @staticmethod
+    def needs_rehash(user):
+        """True if the stored hash was made with other parameters than configured."""
+        return User.hash_parameters(user["password"]) != current_app.config["PASSWORD_HASH_PARAMS"]
+
     @staticmethod
     def check_password(user, password):
-        return check_password_hash(user["password"], password)
+        """Verify a password, upgrading the stored hash if its parameters are stale."""
+        if not check_password_hash(user["password"], password):
+            return False
+        if User.needs_rehash(user):
+            # Only replace the hash that was verified, in case of a concurrent change
+            mongo.db.users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": User.hash_password(password)}}
+            )
+        return True
 
 
 class Music:
+    # Fields a client may ask for through a projection
+    PROJECTABLE_FIELDS = {
+        "title", "artist", "album", "genre", "description", "cloudinary_url",
+        "duration", "file_size", "format", "uploaded_by", "created_at",
+        "cover_url", "play_count", "likes", "public"
+    }
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
+    @staticmethod
+    def encode_cursor(music_id):
+        """Turn the last ObjectId of a page into an opaque cursor string."""
+        return base64.urlsafe_b64encode(music_id.binary).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Turn an opaque cursor string back into an ObjectId."""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            return ObjectId(base64.urlsafe_b64decode(padded.encode("ascii")))
+        except (binascii.Error, InvalidId, TypeError, ValueError, UnicodeEncodeError):
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def build_projection(fields):
+        """Build a Mongo projection from requested field names (None = all fields)."""
+        if not fields:
+            # Internal bookkeeping fields never leave the server
+            return dict(INTERNAL_PROJECTION)
+        unknown = [f for f in fields if f not in Music.PROJECTABLE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return {field: 1 for field in fields}
+
+    @staticmethod
+    def mark_catalog_changed(song_ids=None, deleted=False):
+        """Invalidate cached catalog responses and advance the catalog revision.
+
+        Songs written (or, with ``deleted``, removed) are stamped with the
+        new revision so catalog snapshots can send deltas; call this after
+        the write.
+        """
+        catalog_cache.clear()
+        revision = bump_revision(CATALOG_REVISION)
+        if song_ids:
+            song_ids = list(song_ids)
+            if deleted:
+                mongo.db.music_tombstones.bulk_write([
+                    UpdateOne(
+                        {"_id": song_id},
+                        {"$set": {"catalog_rev": revision, "deleted_at": datetime.utcnow()}},
+                        upsert=True
+                    )
+                    for song_id in song_ids
+                ], ordered=False)
+            else:
+                mongo.db.music.update_many(
+                    {"_id": {"$in": song_ids}}, {"$set": {"catalog_rev": revision}}
+                )
+        return revision
+
+    @staticmethod
+    def get_music_page(query=None, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None,
+                       projection=None):
+        """Return one keyset page of music records and the cursor for the next page.
+
+        Pages are ordered newest first by ``_id``; an ObjectId embeds its
+        creation time, so this is creation order without a separate sort key.
+        An explicit ``projection`` (e.g. a serializer view) overrides ``fields``.
+        """
+        limit = max(1, int(limit))
+        # Fetch one extra document to know whether another page exists
+        docs = list(
+            mongo.db.music.find(
+                Music.page_filter(query, cursor),
+                projection or Music.build_projection(fields)
+            )
+            .sort("_id", -1)
+            .limit(limit + 1)
+        )
+        return Music.split_page(docs, limit)
+
+    @staticmethod
+    def page_filter(query, cursor):
+        """Filter for the page after ``cursor`` (shared with the async repository)."""
+        filters = dict(query or {})
+        if cursor:
+            filters["_id"] = {"$lt": Music.decode_cursor(cursor)}
+        return filters
+
+    @staticmethod
+    def split_page(docs, limit):
+        """Trim a limit + 1 fetch to one page and compute its next cursor."""
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = Music.encode_cursor(docs[-1]["_id"])
+        return docs, next_cursor
+
+    @staticmethod
+    def iter_music(query=None, batch_size=500, fields=None):
+        """Yield music records page by page so callers never hold the whole collection."""
+        cursor = None
+        while True:
+            docs, cursor = Music.get_music_page(
+                query, limit=batch_size, cursor=cursor, fields=fields
+            )
+            yield from docs
+            if not cursor:
+                break
+
     @staticmethod
     def create_music(title, artist, cloudinary_url, album=None, genre=None, 
                     description=None, duration=0, file_size=0, format="mp3",
@@ -97,12 +273,15 @@ class Music:
             "likes": likes,
             "public": public
         }
-        return mongo.db.music.insert_one(music).inserted_id
+        music["search_tokens"] = build_search_tokens(music)
+        inserted_id = mongo.db.music.insert_one(music).inserted_id
+        Music.mark_catalog_changed([inserted_id])
+        return inserted_id
 
     @staticmethod
-    def get_all_music():
-        """Retrieve all music records with all fields."""
-        return list(mongo.db.music.find({}))
+    def get_all_music(batch_size=500, fields=None):
+        """Iterate over all music records, fetched in keyset-paginated batches."""
+        return Music.iter_music({}, batch_size=batch_size, fields=fields)
 
     @staticmethod
     def get_music_by_id(music_id):
@@ -112,7 +291,10 @@ class Music:
     @staticmethod
     def delete_music(music_id):
         """Delete a music record by its ID."""
-        return mongo.db.music.delete_one({"_id": music_id})
+        result = mongo.db.music.delete_one({"_id": music_id})
+        song_meta_cache.invalidate(music_id)
+        Music.mark_catalog_changed([music_id], deleted=True)
+        return result
 
     @staticmethod
     def update_music(music_id, **kwargs):
@@ -129,53 +311,258 @@ class Music:
                 update_fields[field] = value
                 
         if update_fields:
-            return mongo.db.music.update_one({"_id": music_id}, {"$set": update_fields})
+            if any(field in update_fields for field in SEARCH_FIELDS):
+                current = mongo.db.music.find_one(
+                    {"_id": music_id}, {field: 1 for field in SEARCH_FIELDS}
+                ) or {}
+                current.update(update_fields)
+                update_fields["search_tokens"] = build_search_tokens(current)
+            result = mongo.db.music.update_one({"_id": music_id}, {"$set": update_fields})
+            song_meta_cache.invalidate(music_id)
+            Music.mark_catalog_changed([music_id])
+            return result
         return None
 
     @staticmethod
-    def get_public_music():
-        """Retrieve only public music records."""
-        return list(mongo.db.music.find({"public": True}))
+    def get_public_music(batch_size=500, fields=None):
+        """Iterate over public music records, fetched in keyset-paginated batches."""
+        return Music.iter_music({"public": True}, batch_size=batch_size, fields=fields)
 
     @staticmethod
-    def search_music(query):
-        """Search music by title, artist, album, or genre."""
-        search_pattern = {"$regex": query, "$options": "i"}
-        return list(mongo.db.music.find({
-            "$or": [
-                {"title": search_pattern},
-                {"artist": search_pattern},
-                {"album": search_pattern},
-                {"genre": search_pattern}
-            ]
-        }))
+    def search_music(query, limit=20, offset=0, projection=None):
+        """Search music by title, artist, album, or genre, best matches first."""
+        return search_catalog(query, limit=limit, offset=offset, projection=projection)
 
 
 class UserHistory:
+    SONG_FIELDS = {"title": 1, "artist": 1, "duration": 1}
+
     @staticmethod
-    def record_play(username, song_id, duration_played):
-        """Record a song play in user history."""
-        try:
-            # Get song details
-            song = mongo.db.music.find_one({"_id": ObjectId(song_id)})
+    def build_entry(username, song_id, song, duration_played, played_at=None):
+        """Build a user_history document from a play and its song details."""
+        return {
+            "username": username,
+            "song_id": song_id,
+            "song_title": song.get("title", "Unknown"),
+            "artist": song.get("artist", "Unknown"),
+            "duration_played": duration_played,  # in seconds
+            "played_at": played_at or datetime.utcnow(),
+            "completed": duration_played >= (song.get("duration", 0) * 0.9)  # Consider it complete if 90% played
+        }
+
+    @staticmethod
+    def get_song_meta(song_ids):
+        """Return {ObjectId: SongMeta} for the given ids, reading only cache misses from Mongo."""
+        found, missing = song_meta_cache.get_many(song_ids)
+        if missing:
+            for song in mongo.db.music.find(
+                {"_id": {"$in": missing}}, UserHistory.SONG_FIELDS
+            ):
+                meta = SongMeta.from_doc(song)
+                song_meta_cache.set(song["_id"], meta)
+                found[song["_id"]] = meta
+        return found
+
+    @staticmethod
+    def enqueue_play(username, song_id, duration_played, played_at=None):
+        """Queue a play for the write-behind buffer; raises BufferFull when saturated."""
+        play_history_buffer.enqueue({
+            # Fixed here so a retried flush cannot insert the play twice
+            "_id": ObjectId(),
+            "username": username,
+            "song_id": song_id,
+            "duration_played": duration_played,
+            "played_at": played_at or datetime.utcnow()
+        })
+
+    @staticmethod
+    def write_play_events(events):
+        """Persist a batch of play events with one song lookup and one bulk insert.
+
+        Returns ``(inserted_count, errors)`` where each error carries the
+        index of the offending event in ``events``. Safe to call again with
+        the same events after it raised: events carrying an ``_id`` keep it,
+        rows already inserted count as written, and each event is marked
+        once its song stats and trending play are recorded, so a retry only
+        redoes the stages that did not finish.
+        """
+        errors = []
+        song_ids = set()
+        for event in events:
+            if ObjectId.is_valid(event["song_id"]):
+                song_ids.add(ObjectId(event["song_id"]))
+        songs = UserHistory.get_song_meta(list(song_ids)) if song_ids else {}
+
+        entries = []
+        positions = []
+        for index, event in enumerate(events):
+            song_id = ObjectId(event["song_id"]) if ObjectId.is_valid(event["song_id"]) else None
+            song = songs.get(song_id)
             if not song:
-                raise ValueError("Song not found")
-
-            history_entry = {
-                "username": username,
-                "song_id": ObjectId(song_id),
-                "song_title": song.get("title", "Unknown"),
-                "artist": song.get("artist", "Unknown"),
-                "duration_played": duration_played,  # in seconds
-                "played_at": datetime.utcnow(),
-                "completed": duration_played >= (song.get("duration", 0) * 0.9)  # Consider it complete if 90% played
-            }
-            
-            result = mongo.db.user_history.insert_one(history_entry)
-            return str(result.inserted_id)
-        except Exception as e:
-            print(f"Error recording play history: {str(e)}")
-            return None
+                errors.append({"index": index, "error": "Song not found"})
+                continue
+            entry = UserHistory.build_entry(
+                event["username"], song_id, song,
+                event["duration_played"], event.get("played_at")
+            )
+            if "_id" in event:
+                entry["_id"] = event["_id"]
+            entries.append(entry)
+            positions.append(index)
+
+        if entries:
+            new = [i for i, position in enumerate(positions)
+                   if not events[position].get("_inserted")]
+            failed = set()
+            if new:
+                try:
+                    mongo.db.user_history.insert_many(
+                        [entries[i] for i in new], ordered=False
+                    )
+                except BulkWriteError as bwe:
+                    for write_error in bwe.details.get("writeErrors", []):
+                        if write_error.get("code") == DUPLICATE_KEY:
+                            continue  # inserted by an earlier attempt
+                        failed.add(new[write_error["index"]])
+                        errors.append({
+                            "index": positions[new[write_error["index"]]],
+                            "error": write_error.get("errmsg", "Write failed")
+                        })
+                for i in new:
+                    if i not in failed:
+                        events[positions[i]]["_inserted"] = True
+
+            unrecorded = [
+                i for i in range(len(entries))
+                if i not in failed and not events[positions[i]].get("_recorded")
+            ]
+            if unrecorded:
+                UserHistory.update_song_stats([entries[i] for i in unrecorded])
+                # In memory, so it cannot fail after the stats are written
+                trending_ranker.record([entries[i] for i in unrecorded])
+                for i in unrecorded:
+                    events[positions[i]]["_recorded"] = True
+            inserted = len(entries) - len(failed)
+        else:
+            inserted = 0
+
+        for username in {entry["username"] for entry in entries}:
+            bump_revision(history_revision(username))
+        return inserted, errors
+
+    @staticmethod
+    def update_song_stats(entries):
+        """Fold history entries into the per-user user_song_stats aggregates.
+
+        Plays of the same song by the same user within one batch are
+        coalesced into a single upsert.
+        """
+        totals = {}
+        for entry in entries:
+            key = (entry["username"], entry["song_id"])
+            current = totals.get(key)
+            if current is None:
+                totals[key] = {
+                    "song_title": entry["song_title"],
+                    "artist": entry["artist"],
+                    "play_count": 1,
+                    "total_duration": entry["duration_played"],
+                    "last_played": entry["played_at"]
+                }
+            else:
+                current["play_count"] += 1
+                current["total_duration"] += entry["duration_played"]
+                if entry["played_at"] > current["last_played"]:
+                    current["last_played"] = entry["played_at"]
+                    current["song_title"] = entry["song_title"]
+                    current["artist"] = entry["artist"]
+        if not totals:
+            return
+
+        ops = [
+            UpdateOne(
+                {"username": username, "song_id": song_id},
+                {
+                    "$inc": {
+                        "play_count": total["play_count"],
+                        "total_duration": total["total_duration"]
+                    },
+                    "$max": {"last_played": total["last_played"]},
+                    "$set": {
+                        "song_title": total["song_title"],
+                        "artist": total["artist"]
+                    }
+                },
+                upsert=True
+            )
+            for (username, song_id), total in totals.items()
+        ]
+        try:
+            mongo.db.user_song_stats.bulk_write(ops, ordered=False)
+        except BulkWriteError as bwe:
+            # Two writers racing to create the same row: the loser's upsert
+            # hits the unique index and succeeds as an update on retry
+            retry = [
+                ops[error["index"]] for error in bwe.details.get("writeErrors", [])
+                if error.get("code") == 11000
+            ]
+            if len(retry) != len(bwe.details.get("writeErrors", [])):
+                raise
+            mongo.db.user_song_stats.bulk_write(retry, ordered=False)
+
+    @staticmethod
+    def backfill_song_stats(username=None):
+        """Rebuild user_song_stats from user_history (all users or one).
+
+        Rows are replaced, not incremented, so run it while play recording
+        is paused or accept that plays recorded mid-run may be counted from
+        history only.
+        """
+        pipeline = []
+        if username:
+            pipeline.append({"$match": {"username": username}})
+        pipeline += [
+            {"$sort": {"played_at": -1}},
+            {"$group": {
+                "_id": {"username": "$username", "song_id": "$song_id"},
+                "song_title": {"$first": "$song_title"},
+                "artist": {"$first": "$artist"},
+                "play_count": {"$sum": 1},
+                "total_duration": {"$sum": "$duration_played"},
+                "last_played": {"$max": "$played_at"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "username": "$_id.username",
+                "song_id": "$_id.song_id",
+                "song_title": 1,
+                "artist": 1,
+                "play_count": 1,
+                "total_duration": 1,
+                "last_played": 1
+            }},
+            {"$merge": {
+                "into": "user_song_stats",
+                "on": ["username", "song_id"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        mongo.db.user_history.aggregate(pipeline, allowDiskUse=True)
+        query = {"username": username} if username else {}
+        return mongo.db.user_song_stats.count_documents(query)
+
+    @staticmethod
+    def _top_song_stats(username, sort_field, limit):
+        """Indexed top-N read from user_song_stats, shaped like the old aggregation output."""
+        rows = list(mongo.db.user_song_stats.find(
+            {"username": username},
+            {"_id": 0, "username": 0}
+        ).sort(sort_field, -1).limit(limit))
+        for row in rows:
+            row["song_id"] = str(row["song_id"])
+            row["_id"] = row["song_id"]
+        return rows
 
     @staticmethod
     def get_user_history(username, limit=50):
@@ -193,66 +580,23 @@ class UserHistory:
             
             return history
         except Exception as e:
-            print(f"Error fetching play history: {str(e)}")
+            logger.error("Error fetching play history: %s", e)
             return []
 
     @staticmethod
     def get_recently_played(username, limit=10):
         """Get user's recently played unique songs."""
         try:
-            # Get unique songs by taking the last play of each song
-            pipeline = [
-                {"$match": {"username": username}},
-                {"$sort": {"played_at": -1}},
-                {"$group": {
-                    "_id": "$song_id",
-                    "last_played": {"$first": "$played_at"},
-                    "song_title": {"$first": "$song_title"},
-                    "artist": {"$first": "$artist"},
-                    "play_count": {"$sum": 1}
-                }},
-                {"$sort": {"last_played": -1}},
-                {"$limit": limit}
-            ]
-            
-            recent = list(mongo.db.user_history.aggregate(pipeline))
-            
-            # Convert ObjectId to string
-            for entry in recent:
-                entry["song_id"] = str(entry["_id"])
-                entry["_id"] = str(entry["_id"])
-            
-            return recent
+            return UserHistory._top_song_stats(username, "last_played", limit)
         except Exception as e:
-            print(f"Error fetching recent plays: {str(e)}")
+            logger.error("Error fetching recent plays: %s", e)
             return []
 
     @staticmethod
     def get_most_played(username, limit=10):
         """Get user's most played songs."""
         try:
-            pipeline = [
-                {"$match": {"username": username}},
-                {"$group": {
-                    "_id": "$song_id",
-                    "song_title": {"$first": "$song_title"},
-                    "artist": {"$first": "$artist"},
-                    "play_count": {"$sum": 1},
-                    "last_played": {"$max": "$played_at"},
-                    "total_duration": {"$sum": "$duration_played"}
-                }},
-                {"$sort": {"play_count": -1}},
-                {"$limit": limit}
-            ]
-            
-            most_played = list(mongo.db.user_history.aggregate(pipeline))
-            
-            # Convert ObjectId to string
-            for entry in most_played:
-                entry["song_id"] = str(entry["_id"])
-                entry["_id"] = str(entry["_id"])
-            
-            return most_played
+            return UserHistory._top_song_stats(username, "play_count", limit)
         except Exception as e:
-            print(f"Error fetching most played: {str(e)}")
+            logger.error("Error fetching most played: %s", e)
             return []
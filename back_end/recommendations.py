@@ -0,0 +1,158 @@
+"""
+Precomputed item-item recommendations.
+
+``build_index`` turns ``user_history`` into a sparse user x song matrix
+(a completed play counts 1, a partial play 0.25, summed per pair and
+log-damped), computes cosine neighbours with similarity.py and stores the
+top K per song in ``song_neighbors``. A full build recomputes every song;
+an incremental build recomputes the songs with plays recorded since the
+previous build (selected by history ``_id``, when the play reached the
+server, not ``played_at``, so late uploads of offline plays count) and
+every song co-listened with them, the only ones whose neighbour lists can
+have changed, so its output matches a full build.
+Reads never touch the matrix:
+
+* ``similar_songs`` is one ``_id`` lookup in ``song_neighbors``;
+* ``recommend_for_user`` takes the user's recent songs from
+  ``user_song_stats`` and sums their neighbour lists, weighted by how
+  often the user played each seed.
+"""
+import math
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+from database import mongo, secondary_db
+import similarity
+
+STATE_ID = "item_item"
+# Songs from the user's history used as seeds for their recommendations
+SEED_SONGS = 50
+WRITE_BATCH_SIZE = 1000
+# History _ids are made when a play is queued, a little before it is
+# inserted; incremental builds look back this much further to not miss them
+INCREMENTAL_OVERLAP = timedelta(minutes=10)
+
+
+def load_interactions(batch_size=10000):
+    """Aggregate history per (user, song) into index arrays.
+
+    Returns ``(user_idx, item_idx, weights, song_ids)`` where
+    ``song_ids[i]`` is the ObjectId of matrix column i.
+    """
+    cursor = mongo.db.user_history.aggregate([
+        {"$group": {
+            "_id": {"username": "$username", "song_id": "$song_id"},
+            "weight": {"$sum": {"$cond": ["$completed", 1.0, 0.25]}}
+        }}
+    ], allowDiskUse=True, batchSize=batch_size)
+
+    users = {}
+    songs = {}
+    user_idx = []
+    item_idx = []
+    weights = []
+    for row in cursor:
+        key = row["_id"]
+        user_idx.append(users.setdefault(key["username"], len(users)))
+        item_idx.append(songs.setdefault(key["song_id"], len(songs)))
+        weights.append(row["weight"])
+    song_ids = [None] * len(songs)
+    for song_id, index in songs.items():
+        song_ids[index] = song_id
+    return (np.asarray(user_idx, dtype=np.int32), np.asarray(item_idx, dtype=np.int32),
+            np.asarray(weights, dtype=np.float32), song_ids)
+
+
+def get_state():
+    return mongo.db.recommender_state.find_one({"_id": STATE_ID})
+
+
+def build_index(k=similarity.DEFAULT_K, full=False, batch_size=similarity.DEFAULT_BATCH_SIZE):
+    """Rebuild song_neighbors from user_history; returns build statistics."""
+    started = datetime.utcnow()
+    timer = time.perf_counter()
+    state = None if full else get_state()
+
+    user_idx, item_idx, weights, song_ids = load_interactions()
+    loaded_s = time.perf_counter() - timer
+    if not song_ids:
+        return {"songs": 0, "users": 0, "recomputed": 0}
+    matrix = similarity.interaction_matrix(
+        user_idx, item_idx, weights,
+        shape=(int(user_idx.max()) + 1, len(song_ids))
+    )
+
+    items = None
+    if state:
+        # Songs with plays recorded since the last build, and their co-listened songs
+        since = ObjectId.from_datetime(state["built_at"] - INCREMENTAL_OVERLAP)
+        touched = set(mongo.db.user_history.distinct(
+            "song_id", {"_id": {"$gte": since}}
+        ))
+        items = similarity.co_occurring(
+            matrix, [i for i, song_id in enumerate(song_ids) if song_id in touched]
+        )
+    items, neighbors, scores = similarity.top_k_neighbors(
+        matrix, k=k, items=items, batch_size=batch_size
+    )
+    computed_s = time.perf_counter() - timer - loaded_s
+
+    ops = []
+    for row, item in enumerate(items):
+        valid = neighbors[row] >= 0
+        ops.append(ReplaceOne({"_id": song_ids[item]}, {
+            "neighbors": [song_ids[i] for i in neighbors[row][valid]],
+            "scores": [round(float(s), 5) for s in scores[row][valid]],
+            "updated_at": started
+        }, upsert=True))
+        if len(ops) >= WRITE_BATCH_SIZE:
+            mongo.db.song_neighbors.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        mongo.db.song_neighbors.bulk_write(ops, ordered=False)
+
+    stats = {
+        "songs": matrix.shape[1],
+        "users": matrix.shape[0],
+        "interactions": int(matrix.nnz),
+        "recomputed": len(items),
+        "incremental": state is not None,
+        "load_s": round(loaded_s, 3),
+        "compute_s": round(computed_s, 3),
+        "total_s": round(time.perf_counter() - timer, 3)
+    }
+    mongo.db.recommender_state.update_one(
+        {"_id": STATE_ID}, {"$set": dict(stats, built_at=started, k=k)}, upsert=True
+    )
+    return stats
+
+
+def similar_songs(song_id, limit):
+    """Precomputed (song_id, score) neighbours of one song."""
+    doc = secondary_db().song_neighbors.find_one({"_id": song_id})
+    if not doc:
+        return []
+    return list(zip(doc["neighbors"], doc["scores"]))[:limit]
+
+
+def recommend_for_user(username, limit):
+    """Songs similar to what the user has been playing, excluding the seeds."""
+    db = secondary_db()
+    seeds = {
+        row["song_id"]: math.log1p(row.get("play_count", 1))
+        for row in db.user_song_stats.find(
+            {"username": username}, {"song_id": 1, "play_count": 1}
+        ).sort("last_played", -1).limit(SEED_SONGS)
+    }
+    if not seeds:
+        return []
+    totals = {}
+    for doc in db.song_neighbors.find({"_id": {"$in": list(seeds)}}):
+        weight = seeds[doc["_id"]]
+        for neighbor, score in zip(doc["neighbors"], doc["scores"]):
+            if neighbor not in seeds:
+                totals[neighbor] = totals.get(neighbor, 0.0) + weight * score
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:limit]
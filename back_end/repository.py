@@ -0,0 +1,101 @@
+"""
+Catalog reads behind one interface, with a sync and an async driver.
+
+``MusicRepository`` runs on PyMongo through flask_pymongo and backs the
+WSGI app; ``AsyncMusicRepository`` has the same methods as coroutines on
+PyMongo's async client and backs the ASGI app (asgi.py). ``get_many`` and
+``search`` read through the lag-tolerant read preference (database.py);
+the others back ETag'd views and read from the primary. Query building,
+cursors, search ranking and revision parsing all live in models.py,
+search.py and revisions.py and are shared, so both apps return the same
+documents and ETags. The repositories only issue the queries.
+"""
+from pymongo.errors import OperationFailure
+from database import mongo, secondary_db
+from models import Music
+from revisions import revision_from_doc
+from search import CANDIDATE_CAP, TEXT_SORT, SearchPlan, search_catalog
+
+
+class MusicRepository:
+    def __init__(self, db=None, reads=None):
+        """``db``/``reads`` default to the current app's primary/secondary-read databases."""
+        self._db = db
+        self._reads = reads
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else mongo.db
+
+    @property
+    def reads(self):
+        return self._reads if self._reads is not None else secondary_db()
+
+    def page(self, query=None, limit=Music.DEFAULT_PAGE_SIZE, cursor=None, projection=None):
+        return Music.get_music_page(query, limit=limit, cursor=cursor, projection=projection)
+
+    def get(self, song_id, projection=None):
+        return self.db.music.find_one({"_id": song_id}, projection)
+
+    def get_many(self, song_ids, projection=None, query=None):
+        """{_id: document} for the given ids (missing ids are absent)."""
+        filters = dict(query or {}, _id={"$in": list(song_ids)})
+        return {doc["_id"]: doc for doc in self.reads.music.find(filters, projection)}
+
+    def search(self, query, limit=20, offset=0, projection=None):
+        return search_catalog(query, limit=limit, offset=offset, projection=projection)
+
+    def revision(self, scope):
+        return revision_from_doc(self.db.revisions.find_one({"_id": scope}))
+
+
+class AsyncMusicRepository:
+    def __init__(self, db, reads=None):
+        """``db`` is a database from ``pymongo.AsyncMongoClient``; ``reads`` the same with
+        the lag-tolerant read preference."""
+        self.db = db
+        self.reads = reads if reads is not None else db
+
+    async def page(self, query=None, limit=Music.DEFAULT_PAGE_SIZE, cursor=None,
+                   projection=None):
+        limit = max(1, int(limit))
+        docs = await self.db.music.find(
+            Music.page_filter(query, cursor), projection or Music.build_projection(None)
+        ).sort("_id", -1).limit(limit + 1).to_list()
+        return Music.split_page(docs, limit)
+
+    async def get(self, song_id, projection=None):
+        return await self.db.music.find_one({"_id": song_id}, projection)
+
+    async def get_many(self, song_ids, projection=None, query=None):
+        filters = dict(query or {}, _id={"$in": list(song_ids)})
+        return {doc["_id"]: doc async for doc in self.reads.music.find(filters, projection)}
+
+    async def search(self, query, limit=20, offset=0, projection=None):
+        plan = SearchPlan(query, limit, offset, projection)
+        if not plan.words:
+            return []
+        music = self.reads.music
+        candidates = await music.find(
+            plan.exact_filter(), plan.projection
+        ).limit(CANDIDATE_CAP).to_list()
+        if len(candidates) < CANDIDATE_CAP:
+            candidates.extend(await music.find(
+                plan.prefix_filter(candidates), plan.projection
+            ).limit(CANDIDATE_CAP - len(candidates)).to_list())
+        plan.rank(candidates)
+        shortfall = plan.text_shortfall(candidates)
+        if shortfall:
+            try:
+                candidates.extend(await music.find(
+                    plan.text_filter(candidates), plan.text_projection()
+                ).sort(TEXT_SORT).limit(shortfall).to_list())
+            except OperationFailure:
+                pass
+        return plan.page(candidates)
+
+    async def revision(self, scope):
+        return revision_from_doc(await self.db.revisions.find_one({"_id": scope}))
+
+
+music_repository = MusicRepository()
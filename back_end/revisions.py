@@ -0,0 +1,134 @@
+"""
+Collection revisions and conditional GET support.
+
+A small ``revisions`` collection holds a monotonically increasing counter
+per scope: one for the catalog, bumped on every music write, and one per
+user for their play history. Read routes derive a strong ETag from the
+scope's revision and the request URL, so an ``If-None-Match`` hit is
+answered with 304 without querying or serializing any documents.
+
+Revisions are read through ``revision_cache``, so a worker sees another
+worker's bump up to ``REVISION_CACHE_TTL`` (about a second) late, and its
+own bumps immediately.
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import current_app, g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from pymongo import ReturnDocument
+from werkzeug.http import http_date, quote_etag
+from cache import revision_cache
+from database import mongo
+
+CATALOG_REVISION = "catalog"
+
+
+def history_revision(username):
+    """Revision scope for one user's play history."""
+    return f"history:{username}"
+
+
+def get_revision(scope):
+    """Return (revision, updated_at) for a scope; (0, None) if never written."""
+    cached = revision_cache.get(scope)
+    if cached is None:
+        cached = revision_from_doc(mongo.db.revisions.find_one({"_id": scope}))
+        revision_cache.set(scope, cached)
+    return cached
+
+
+def revision_from_doc(doc):
+    """(revision, updated_at) from a revisions document, or (0, None)."""
+    if not doc:
+        return 0, None
+    return doc.get("revision", 0), doc.get("updated_at")
+
+
+def make_etag(scope, revision, full_path, variant=""):
+    """Strong ETag for a URL at a scope's revision."""
+    return hashlib.sha1(
+        f"{scope}:{revision}:{full_path}:{variant}".encode("utf-8")
+    ).hexdigest()
+
+
+def validators(scope, revision, updated_at, full_path, variant=""):
+    """(etag, last_modified) of a URL at a scope's revision."""
+    if updated_at is not None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+    return make_etag(scope, revision, full_path, variant), updated_at
+
+
+def is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """Whether a request's validators still match; If-None-Match wins when sent.
+
+    ``if_none_match`` is a parsed ``werkzeug.datastructures.ETags`` and
+    ``if_modified_since`` a datetime or None.
+    """
+    if if_none_match:
+        return if_none_match.contains(etag)
+    return bool(if_modified_since and last_modified and last_modified <= if_modified_since)
+
+
+def cache_headers(etag, last_modified, private=False, max_age=0):
+    """ETag, Last-Modified and Cache-Control for a conditional response."""
+    headers = {
+        "ETag": quote_etag(etag),
+        "Cache-Control": f"{'private' if private else 'public'}, max-age={max_age}, must-revalidate",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def bump_revision(scope):
+    """Advance a scope's revision after a write and return the new value."""
+    doc = mongo.db.revisions.find_one_and_update(
+        {"_id": scope},
+        {"$inc": {"revision": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    revision_cache.set(scope, revision_from_doc(doc))
+    return doc["revision"]
+
+
+def current_user_history_scope():
+    """Scope resolver for routes guarded by jwt_required."""
+    return history_revision(get_jwt_identity())
+
+
+def conditional(scope, private=False, max_age=0, vary=()):
+    """Serve ETag/Last-Modified/Cache-Control and answer 304 when unchanged.
+
+    ``scope`` is a revision scope name or a callable returning one; it is
+    resolved inside the request so it can depend on the JWT identity.
+    ``vary`` names request headers that select the representation (e.g.
+    Accept-Encoding); they are folded into the ETag and sent as Vary.
+    The revision is left in ``g.revision`` for the view's cache key.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            name = scope() if callable(scope) else scope
+            revision, updated_at = get_revision(name)
+            g.revision = revision
+            variant = "|".join(request.headers.get(header, "") for header in vary)
+            etag, last_modified = validators(
+                name, revision, updated_at, request.full_path, variant
+            )
+
+            if is_not_modified(etag, last_modified,
+                               request.if_none_match, request.if_modified_since):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.headers.update(cache_headers(etag, last_modified, private, max_age))
+            for header in vary:
+                response.vary.add(header)
+            return response
+        return wrapper
+    return decorator
@@ -1,127 +1,282 @@
-from flask import Blueprint, jsonify, request
-from database import mongo
-from flask import current_app
-import cloudinary
-import cloudinary.uploader
+from flask import Blueprint, jsonify, redirect, request, send_file
+from database import mongo, pool_monitor
+from flask import current_app, g
+import logging
+import mimetypes
+import mmap
 import os
-from datetime import datetime
-from dotenv import load_dotenv
+import uuid
+from datetime import datetime, timedelta, timezone
 from models import UserHistory, Music
+from search import MAX_RESULTS, build_search_tokens
+from cache import (
+    SongMeta, cache_key, catalog_cache, identity_cache, revision_cache, song_meta_cache
+)
+from revisions import CATALOG_REVISION, conditional, current_user_history_scope
+from history_buffer import BufferFull, play_history_buffer
+import audio_analysis
+import catalog_snapshot
+import chunked_upload
+import recommendations
+import serializers
+from repository import music_repository
+from storage import get_storage
+from trending import DEFAULT_WINDOW, trending_ranker
+from upload_jobs import QueueFull, run_concurrently, upload_queue
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
 
-# Load environment variables
-load_dotenv()
-
 audio_bp = Blueprint("audio", __name__)
+logger = logging.getLogger(__name__)
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+# Upper bound on events accepted by /history/record/batch
+MAX_HISTORY_BATCH = 500
+# Accepted played_at range for batched plays: a little client clock skew
+# ahead of now, and far enough back for plays a device kept while offline
+MAX_PLAY_CLOCK_SKEW = timedelta(minutes=5)
+MAX_PLAY_AGE = timedelta(days=365)
+
+ALLOWED_AUDIO_EXTENSIONS = {'.mp3', '.wav', '.flac', '.m4a', '.aac'}
 
-# Debug: Log Cloudinary configuration status
-cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME')
-api_key = os.getenv('CLOUDINARY_API_KEY')
-api_secret = os.getenv('CLOUDINARY_API_SECRET')
+# Upper bound on /similar and /recommendations page sizes
+MAX_SIMILAR = 100
 
-print(f"🔧 Cloudinary Config - Cloud Name: {cloud_name}")
-api_key_display = f"{api_key[:10]}..." if api_key else "None"
-print(f"🔧 Cloudinary Config - API Key: {api_key_display}")
-secret_status = "Set" if api_secret else "Not Set"
-print(f"🔧 Cloudinary Config - API Secret: {secret_status}")
+# Bytes per chunk when streaming a Range response out of an mmap
+STREAM_BLOCK_SIZE = 256 * 1024
 
 
 @audio_bp.route("/music", methods=["GET"])
+@conditional(CATALOG_REVISION)
 def get_music():
+    """List the catalog one keyset page at a time.
+
+    Query args: ``limit`` (page size, capped at Music.MAX_PAGE_SIZE),
+    ``cursor`` (the ``next_cursor`` of the previous page) and ``fields``
+    (comma-separated list of fields to return).
+    """
     try:
-        music_files = list(mongo.db.music.find({}))
-        for doc in music_files:
-            doc['_id'] = str(doc['_id'])
-            doc['url'] = doc.get('cloudinary_url', '')
-            doc['artist'] = doc.get('artist', 'Unknown Artist')
-            doc['cover_url'] = doc.get('cover_url', None)
-        return jsonify(music_files)
+        key = cache_key("get_music", request.args, revision=g.revision)
+        payload = catalog_cache.get(key)
+        if payload is not None:
+            return jsonify(payload)
+
+        try:
+            limit = int(request.args.get("limit", Music.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, Music.MAX_PAGE_SIZE))
+
+        fields = {
+            f.strip() for f in request.args.get("fields", "").split(",") if f.strip()
+        }
+        try:
+            music_files, next_cursor = music_repository.page(
+                limit=limit,
+                cursor=request.args.get("cursor"),
+                projection=serializers.LIST.projection(fields)
+            )
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        payload = {
+            "items": music_files,
+            "next_cursor": next_cursor,
+            "count": len(music_files)
+        }
+        catalog_cache.set(key, payload)
+        return jsonify(payload)
     except Exception as e:
-        current_app.logger.error("Database error: %s", str(e))
+        logger.error("Database error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @audio_bp.route("/music/<song_id>", methods=["GET"])
+@conditional(CATALOG_REVISION)
 def get_song_by_id(song_id):
     """Get individual song details by ID."""
     try:
         # Validate ObjectId format
         if not ObjectId.is_valid(song_id):
             return jsonify({"error": "Invalid song ID format"}), 400
-            
-        song = mongo.db.music.find_one({"_id": ObjectId(song_id)})
+
+        key = cache_key("get_song_by_id", {"song_id": song_id}, revision=g.revision)
+        cached = catalog_cache.get(key)
+        if cached is not None:
+            return jsonify(cached), 200
+
+        song = music_repository.get(ObjectId(song_id), serializers.DETAIL.projection())
         
         if not song:
             return jsonify({"error": "Song not found"}), 404
             
-        # Format the response
-        song['_id'] = str(song['_id'])
-        song['url'] = song.get('cloudinary_url', '')
-        song['artist'] = song.get('artist', 'Unknown Artist')
-        song['title'] = song.get('title', 'Unknown Title')
-        song['album'] = song.get('album', '')
-        song['genre'] = song.get('genre', '')
-        song['description'] = song.get('description', '')
-        song['cover_url'] = song.get('cover_url', None)
-        song['duration'] = song.get('duration', 0)
-        song['created_at'] = song.get('created_at', '')
-        song['uploaded_by'] = song.get('uploaded_by', 'Anonymous')
-        song['play_count'] = song.get('play_count', 0)
-        song['likes'] = song.get('likes', 0)
-        
-        current_app.logger.info(f"🎵 Retrieved song: {song.get('title')} by {song.get('artist')}")
-        
+        # Warm the metadata cache play-history writes read from
+        song_meta_cache.set(song['_id'], SongMeta.from_doc(song))
+
+        catalog_cache.set(key, song)
         return jsonify(song), 200
         
     except Exception as e:
-        current_app.logger.error(f"💥 Error fetching song: {str(e)}")
+        logger.error("Error fetching song %s: %s", song_id, e)
         return jsonify({"error": f"Failed to fetch song: {str(e)}"}), 500
 
 
+@audio_bp.route("/music/<song_id>/plays", methods=["GET"])
+def get_song_plays(song_id):
+    """A song's play count, kept out of the catalog-revision views.
+
+    Counts are persisted by the trending flush, so responses may be cached
+    for one refresh interval.
+    """
+    if not ObjectId.is_valid(song_id):
+        return jsonify({"error": "Invalid song ID format"}), 400
+    song = mongo.db.music.find_one({"_id": ObjectId(song_id)}, {"play_count": 1})
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+    response = jsonify({"song_id": song_id, "play_count": song.get("play_count", 0)})
+    response.cache_control.public = True
+    response.cache_control.max_age = int(trending_ranker.refresh_interval)
+    return response
+
+
+def build_music_entry(fields, result, cover_url=None, analysis=None):
+    """Build the music document for an uploaded track from its form fields and storage result."""
+    music_entry = {
+        "title": fields["title"],
+        "artist": fields["artist"],
+        "album": fields.get("album") or None,
+        "genre": fields.get("genre") or None,
+        "description": fields.get("description") or None,
+        "cloudinary_url": result["secure_url"],
+        "duration": result.get("duration", 0),  # Duration in seconds
+        "file_size": result.get("bytes", 0),
+        "format": result.get("format", "mp3"),
+        "uploaded_by": fields.get("uploaded_by") or "Anonymous",
+        "created_at": datetime.utcnow().isoformat(),
+        "cover_url": cover_url,
+        "play_count": 0,
+        "likes": 0,
+        "public": fields.get("public", True),
+        "storage_backend": result.get("storage_backend", "cloudinary"),
+        "storage_key": result.get("storage_key")
+    }
+    if analysis:
+        music_entry["analysis"] = audio_analysis.to_document(analysis)
+        # Locally decoded duration beats a missing storage-reported one
+        music_entry["duration"] = music_entry["duration"] or analysis["duration"]
+    music_entry["search_tokens"] = build_search_tokens(music_entry)
+    return music_entry
+
+
+def analyze_or_none(source):
+    """Run local audio analysis, logging and returning None if it is unavailable."""
+    try:
+        return audio_analysis.analyze(source)
+    except Exception as e:
+        logger.warning("Audio analysis skipped for %s: %s", source, e)
+        return None
+
+
+@audio_bp.route("/music/<song_id>/waveform", methods=["GET"])
+@conditional(CATALOG_REVISION, max_age=86400)
+def get_song_waveform(song_id):
+    """Raw uint8 waveform peaks (0-255, evenly spaced) for the player scrubber."""
+    if not ObjectId.is_valid(song_id):
+        return jsonify({"error": "Invalid song ID format"}), 400
+    song = mongo.db.music.find_one(
+        {"_id": ObjectId(song_id)}, {"analysis.waveform": 1}
+    )
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+    waveform = song.get("analysis", {}).get("waveform")
+    if not waveform:
+        return jsonify({"error": "Waveform not available"}), 404
+    response = current_app.response_class(bytes(waveform), mimetype="application/octet-stream")
+    response.headers["X-Waveform-Points"] = str(len(waveform))
+    return response
+
+
+@audio_bp.route("/media/<path:key>", methods=["GET"])
+def get_media(key):
+    """Serve a locally stored file (audio or cover) with Range support."""
+    storage = get_storage()
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        return jsonify({"error": "Not found"}), 404
+    if not path or not os.path.isfile(path):
+        return jsonify({"error": "Not found"}), 404
+    return send_file(path, conditional=True, max_age=86400)
+
+
+@audio_bp.route("/stream/<song_id>", methods=["GET"])
+def stream_song(song_id):
+    """Stream a song's audio, honouring HTTP Range so the player can seek.
+
+    Whole-file responses go through send_file, which hands the file to the
+    server's wsgi.file_wrapper (sendfile where available); byte ranges are
+    sliced from an mmap of the file. Remotely stored songs redirect to
+    their storage URL.
+    """
+    if not ObjectId.is_valid(song_id):
+        return jsonify({"error": "Invalid song ID format"}), 400
+    song = mongo.db.music.find_one(
+        {"_id": ObjectId(song_id)},
+        {"cloudinary_url": 1, "storage_backend": 1, "storage_key": 1, "format": 1}
+    )
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+
+    storage = get_storage()
+    path = None
+    if song.get("storage_backend") == storage.name and song.get("storage_key"):
+        path = storage.local_path(song["storage_key"])
+    if not path:
+        if not song.get("cloudinary_url"):
+            return jsonify({"error": "Audio not available"}), 404
+        return redirect(song["cloudinary_url"], code=302)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Audio not available"}), 404
+
+    size = os.path.getsize(path)
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    byte_range = request.range
+    if not byte_range or byte_range.units != "bytes" or len(byte_range.ranges) != 1 or not size:
+        response = send_file(path, mimetype=mimetype, conditional=False, max_age=86400)
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    span = byte_range.range_for_length(size)
+    if span is None:
+        response = current_app.response_class(status=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+    start, stop = span
+
+    def generate():
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, stop, STREAM_BLOCK_SIZE):
+                yield mapped[offset:min(offset + STREAM_BLOCK_SIZE, stop)]
+
+    response = current_app.response_class(generate(), status=206, mimetype=mimetype)
+    response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    response.headers["Content-Length"] = str(stop - start)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
+
+
 @audio_bp.route("/upload", methods=["POST"])
 def upload_audio():
     try:
-        current_app.logger.info("🚀 Upload request received")
-        current_app.logger.info(
-            f"📂 Files in request: {list(request.files.keys())}"
-        )
-        current_app.logger.info(f"📝 Form data: {dict(request.form)}")
-        
-        # Debug: Check Cloudinary configuration
-        config = cloudinary.config()
-        current_app.logger.info(f"☁️ Cloudinary cloud_name: {config.cloud_name}")
-        api_key_log = f"{config.api_key[:10]}..." if config.api_key else "None"
-        current_app.logger.info(f"☁️ Cloudinary api_key: {api_key_log}")
-       
         # Check if file is present
         if 'audio' not in request.files:
-            current_app.logger.error("❌ No audio file in request")
             return jsonify({"error": "No audio file provided"}), 400
        
         file = request.files['audio']
         cover_file = request.files.get('cover')  # Optional cover image
         
-        current_app.logger.info(
-            f"📁 File received: {file.filename}, "
-            f"size: {file.content_length}"
-        )
-        
-        if cover_file:
-            current_app.logger.info(
-                f"🖼️ Cover image received: {cover_file.filename}, "
-                f"size: {cover_file.content_length}"
-            )
-        
         if file.filename == '':
-            current_app.logger.error("❌ Empty filename")
             return jsonify({"error": "No file selected"}), 400
         
         # Get form data
@@ -131,134 +286,352 @@ def upload_audio():
         genre = request.form.get('genre', '').strip()
         description = request.form.get('description', '').strip()
         
-        current_app.logger.info(
-            f"📋 Parsed form data - Title: {title}, Artist: {artist}, "
-            f"Album: {album}, Genre: {genre}"
-        )
-        
         # Validate required fields
         if not title or not artist:
-            current_app.logger.error("❌ Missing required fields")
             return jsonify({"error": "Title and artist are required"}), 400
         
         # Check file type
-        allowed_extensions = {'.mp3', '.wav', '.flac', '.m4a', '.aac'}
+        allowed_extensions = ALLOWED_AUDIO_EXTENSIONS
         file_ext = os.path.splitext(file.filename)[1].lower()
-        current_app.logger.info(f"🔍 File extension: {file_ext}")
         
         if file_ext not in allowed_extensions:
             error_msg = (
                 f"Unsupported file type. "
                 f"Allowed: {', '.join(allowed_extensions)}"
             )
-            current_app.logger.error(f"❌ {error_msg}")
             return jsonify({"error": error_msg}), 400
         
-        # Upload to Cloudinary
-        current_app.logger.info(
-            f"☁️ Starting Cloudinary upload for {file.filename}..."
-        )
-        
-        result = cloudinary.uploader.upload(
-            file,
-            resource_type="video",  # Use video for audio streaming
-            folder="music_sphere",
-            transformation=[{"format": "mp3", "audio_codec": "mp3"}],
-            use_filename=True,
-            unique_filename=False
-        )
-        
-        current_app.logger.info(
-            f"✅ Cloudinary upload successful: {result.get('secure_url')}"
-        )
-        current_app.logger.info(
-            f"📊 Cloudinary result: Duration={result.get('duration')}, "
-            f"Size={result.get('bytes')}, Format={result.get('format')}"
-        )
-        
-        cloudinary_url = result["secure_url"]
-        duration = result.get("duration", 0)  # Duration in seconds
-        
-        # Upload cover image if provided
-        cover_url = None
+        # Validate cover image file type
+        allowed_image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+        cover_ext = None
         if cover_file and cover_file.filename:
-            current_app.logger.info(f"🖼️ Starting cover image upload...")
-            
-            # Validate cover image file type
-            allowed_image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
             cover_ext = os.path.splitext(cover_file.filename)[1].lower()
-            
             if cover_ext not in allowed_image_extensions:
-                current_app.logger.warning(f"⚠️ Invalid cover image type: {cover_ext}")
-            else:
-                try:
-                    cover_result = cloudinary.uploader.upload(
-                        cover_file,
-                        resource_type="image",
-                        folder="music_sphere/covers",
-                        transformation=[
-                            {"width": 500, "height": 500, "crop": "fill"},
-                            {"quality": "auto"}
-                        ],
-                        use_filename=True,
-                        unique_filename=False
-                    )
-                    cover_url = cover_result["secure_url"]
-                    current_app.logger.info(f"✅ Cover image upload successful: {cover_url}")
-                except Exception as cover_error:
-                    current_app.logger.error(f"⚠️ Cover upload failed: {str(cover_error)}")
-                    # Continue without cover image - don't fail the whole upload
-        
-        # Create music entry with all properties
-        music_entry = {
-            "title": title,
-            "artist": artist,
-            "album": album if album else None,
-            "genre": genre if genre else None,
-            "description": description if description else None,
-            "cloudinary_url": cloudinary_url,
-            "duration": duration,
-            "file_size": result.get("bytes", 0),
-            "format": result.get("format", "mp3"),
-            "uploaded_by": request.form.get('uploaded_by', 'Anonymous'),
-            "created_at": datetime.utcnow().isoformat(),
-            "cover_url": cover_url,
-            "play_count": 0,
-            "likes": 0,
-            "public": request.form.get('public', 'true').lower() == 'true'
-        }
-        
-        current_app.logger.info(f"💾 Inserting to MongoDB: {music_entry}")
-        
-        # Insert into MongoDB
-        result_db = mongo.db.music.insert_one(music_entry)
-        music_entry['_id'] = str(result_db.inserted_id)
-        
-        current_app.logger.info(
-            f"✅ MongoDB insert successful: ID={result_db.inserted_id}"
-        )
-        
-        response_data = {
-            "message": "Song uploaded successfully",
-            "song": {
-                "id": str(result_db.inserted_id),
+                logger.warning("Ignoring cover image of type %s", cover_ext)
+                cover_ext = None
+
+        # Spool files to disk; a worker uploads them after we respond
+        job_id = uuid.uuid4().hex
+        spool_dir = chunked_upload.spool_dir()
+        audio_path = os.path.join(spool_dir, f"{job_id}{file_ext}")
+        file.save(audio_path)
+        cover_path = None
+        if cover_ext:
+            cover_path = os.path.join(spool_dir, f"{job_id}_cover{cover_ext}")
+            cover_file.save(cover_path)
+
+        job = {
+            "_id": job_id,
+            "filename": file.filename,
+            "audio_path": audio_path,
+            "cover_filename": cover_file.filename if cover_ext else None,
+            "cover_path": cover_path,
+            "fields": {
                 "title": title,
                 "artist": artist,
                 "album": album,
                 "genre": genre,
-                "url": cloudinary_url,
-                "duration": duration
+                "description": description,
+                "uploaded_by": request.form.get('uploaded_by', 'Anonymous'),
+                "public": request.form.get('public', 'true').lower() == 'true'
             }
         }
-        
-        current_app.logger.info(f"🎉 Upload complete: {title} by {artist}")
-        return jsonify(response_data), 201
-        
+        try:
+            upload_queue.submit(job)
+        except QueueFull:
+            discard_spooled(job)
+            response = jsonify({"error": "Upload queue is full, retry shortly"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+
+        logger.info("Upload queued: job %s", job_id)
+        return jsonify({
+            "message": "Upload accepted",
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"{request.script_root}/api/audio/upload/{job_id}"
+        }), 202
+
     except Exception as e:
-        current_app.logger.error(f"💥 Upload error: {str(e)}")
-        current_app.logger.error(f"💥 Error type: {type(e).__name__}")
-        import traceback
-        current_app.logger.error(f"💥 Traceback: {traceback.format_exc()}")
+        logger.exception("Upload error")
+        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+
+
+def process_upload_job(job):
+    """Upload a queued job's audio and cover concurrently, then create the song.
+
+    Jobs finalizing a chunked upload carry its ``upload_id``: the audio is
+    sent with a chunked transfer, and the session is completed with the
+    song (or reopened for another finalize if the upload fails). Other
+    failed jobs drop their spooled files, since a failed job is not retried.
+    """
+    upload_id = job.get("upload_id")
+    try:
+        song = _store_upload_job(job)
+    except Exception:
+        if upload_id:
+            chunked_upload.reopen(upload_id)
+        else:
+            discard_spooled(job)
+        raise
+    if upload_id:
+        chunked_upload.mark_finished(upload_id, "complete", song_id=song["id"])
+    return song
+
+
+def _store_upload_job(job):
+    job_id = job["_id"]
+    upload_queue.set_stage(job_id, "uploading", 10)
+
+    storage = get_storage()
+
+    def upload_audio_file():
+        return storage.upload_audio(
+            job["audio_path"], job["filename"], chunk_size=job.get("chunk_size")
+        )
+
+    def upload_cover_file():
+        if not job.get("cover_path"):
+            return None
+        try:
+            cover_result = storage.upload_image(job["cover_path"], job["cover_filename"])
+            return cover_result["secure_url"]
+        except Exception as cover_error:
+            # Continue without cover image - don't fail the whole upload
+            logger.warning("Cover upload failed for job %s: %s", job_id, cover_error)
+            return None
+
+    result, cover_url, analysis = run_concurrently(
+        upload_audio_file, upload_cover_file,
+        lambda: analyze_or_none(job["audio_path"])
+    )
+    upload_queue.set_stage(job_id, "saving", 80)
+
+    music_entry = build_music_entry(job["fields"], result, cover_url, analysis)
+    music_entry["upload_job_id"] = job_id
+    # Upsert on the job id so a resumed job never creates the song twice
+    mongo.db.music.update_one(
+        {"upload_job_id": job_id}, {"$setOnInsert": music_entry}, upsert=True
+    )
+    song_id = mongo.db.music.find_one({"upload_job_id": job_id}, {"_id": 1})["_id"]
+    Music.mark_catalog_changed([song_id])
+    discard_spooled(job)
+
+    return {
+        "id": str(song_id),
+        "title": music_entry["title"],
+        "artist": music_entry["artist"],
+        "album": music_entry["album"],
+        "genre": music_entry["genre"],
+        "url": music_entry["cloudinary_url"],
+        "duration": music_entry["duration"]
+    }
+
+
+def discard_spooled(job):
+    """Delete a job's spooled audio and cover files."""
+    for path in (job["audio_path"], job.get("cover_path")):
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@audio_bp.route("/upload/<job_id>", methods=["GET"])
+def get_upload_job(job_id):
+    """Poll an upload job for progress or its final song."""
+    job = upload_queue.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Upload job not found"}), 404
+    response = {
+        "job_id": job_id,
+        "status": job["status"],
+        "stage": job.get("stage"),
+        "progress": job.get("progress", 0),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat()
+    }
+    if job["status"] == "complete":
+        response["message"] = "Song uploaded successfully"
+        response["song"] = job.get("song")
+    elif job["status"] == "failed":
+        response["error"] = job.get("error")
+    return jsonify(response), 200
+
+
+@audio_bp.route("/upload/chunked", methods=["POST"])
+def init_chunked_upload():
+    """Open a resumable chunked upload session.
+
+    Body: ``{filename, size, title, artist, album?, genre?, description?,
+    uploaded_by?, public?, chunk_size?}``. Chunks are then PUT to
+    ``/upload/chunked/<upload_id>`` with a ``Content-Range`` header.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = str(data.get("filename", "")).strip()
+        title = str(data.get("title", "")).strip()
+        artist = str(data.get("artist", "")).strip()
+
+        if not filename or not title or not artist:
+            return jsonify({"error": "filename, title and artist are required"}), 400
+        if os.path.splitext(filename)[1].lower() not in ALLOWED_AUDIO_EXTENSIONS:
+            return jsonify({
+                "error": f"Unsupported file type. Allowed: {', '.join(ALLOWED_AUDIO_EXTENSIONS)}"
+            }), 400
+
+        metadata = {
+            "title": title,
+            "artist": artist,
+            "album": str(data.get("album", "")).strip(),
+            "genre": str(data.get("genre", "")).strip(),
+            "description": str(data.get("description", "")).strip(),
+            "uploaded_by": data.get("uploaded_by", "Anonymous"),
+            "public": bool(data.get("public", True))
+        }
+        try:
+            session = chunked_upload.create_session(
+                filename,
+                data.get("size"),
+                metadata,
+                data.get("chunk_size", chunked_upload.DEFAULT_CHUNK_SIZE)
+            )
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        return jsonify({
+            "upload_id": session["_id"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"]
+        }), 201
+
+    except Exception as e:
+        logger.error("Chunked upload init error: %s", e)
+        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+
+
+@audio_bp.route("/upload/chunked/<upload_id>", methods=["PUT"])
+def put_upload_chunk(upload_id):
+    """Store one chunk. The range comes from ``Content-Range: bytes start-end/total``
+    or an ``offset`` query arg with the body length as the chunk size."""
+    try:
+        session = chunked_upload.get_session(upload_id)
+        if not session:
+            return jsonify({"error": "Upload not found"}), 404
+
+        content_range = request.headers.get("Content-Range")
+        if content_range:
+            try:
+                offset, length = chunked_upload.parse_content_range(content_range)
+            except ValueError as ve:
+                return jsonify({"error": str(ve)}), 400
+        else:
+            try:
+                offset = int(request.args.get("offset", ""))
+            except ValueError:
+                return jsonify({"error": "Content-Range header or offset is required"}), 400
+            length = request.content_length or 0
+
+        if request.content_length is not None and request.content_length != length:
+            return jsonify({"error": "Body length does not match the chunk range"}), 400
+
+        try:
+            session = chunked_upload.write_chunk(session, offset, request.stream, length)
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+        return jsonify({
+            "upload_id": upload_id,
+            "received_bytes": chunked_upload.received_bytes(session),
+            "missing": chunked_upload.missing_ranges(session)
+        }), 200
+
+    except Exception as e:
+        logger.error("Chunk upload error: %s", e)
+        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+
+
+@audio_bp.route("/upload/chunked/<upload_id>", methods=["GET"])
+def get_chunked_upload(upload_id):
+    """Report a session's progress so an interrupted client can resume."""
+    session = chunked_upload.get_session(upload_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify({
+        "upload_id": upload_id,
+        "status": session["status"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "received_bytes": chunked_upload.received_bytes(session),
+        "missing": chunked_upload.missing_ranges(session),
+        "job_id": session.get("job_id"),
+        "song_id": session.get("song_id")
+    }), 200
+
+
+@audio_bp.route("/upload/chunked/<upload_id>", methods=["DELETE"])
+def abort_chunked_upload(upload_id):
+    """Abandon a session and delete its spooled bytes."""
+    session = chunked_upload.get_session(upload_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    if session["status"] != "open":
+        return jsonify({"error": f"Upload is {session['status']}"}), 409
+    chunked_upload.mark_finished(upload_id, "aborted")
+    return jsonify({"message": "Upload aborted"}), 200
+
+
+@audio_bp.route("/upload/chunked/<upload_id>/complete", methods=["POST"])
+def complete_chunked_upload(upload_id):
+    """Queue the assembled file for upload; poll the returned job like ``/upload``."""
+    try:
+        session, claimed = chunked_upload.begin_finalize(upload_id)
+        if not session:
+            return jsonify({"error": "Upload not found"}), 404
+        if not claimed:
+            if session["status"] == "open":
+                return jsonify({
+                    "error": "Upload is incomplete",
+                    "missing": chunked_upload.missing_ranges(session)
+                }), 409
+            return jsonify({"error": f"Upload is {session['status']}"}), 409
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "_id": job_id,
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "audio_path": chunked_upload.spool_path(upload_id),
+            # Chunked transfer so the backend never needs the whole body at once
+            "chunk_size": session["chunk_size"],
+            "cover_filename": None,
+            "cover_path": None,
+            "fields": session["metadata"]
+        }
+        try:
+            upload_queue.submit(job)
+        except QueueFull:
+            chunked_upload.reopen(upload_id)
+            response = jsonify({"error": "Upload queue is full, retry shortly"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+        except Exception:
+            chunked_upload.reopen(upload_id)
+            raise
+        chunked_upload.set_job(upload_id, job_id)
+
+        logger.info("Chunked upload %s queued: job %s", upload_id, job_id)
+        return jsonify({
+            "message": "Upload accepted",
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"{request.script_root}/api/audio/upload/{job_id}"
+        }), 202
+
+    except Exception as e:
+        logger.error("Chunked upload finalize error: %s", e)
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
 
@@ -272,28 +645,127 @@ def record_play():
         
         if not data or not all(k in data for k in ["song_id", "duration_played"]):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        history_id = UserHistory.record_play(
-            username=username,
-            song_id=data["song_id"],
-            duration_played=data["duration_played"]
-        )
-        
-        if not history_id:
-            return jsonify({"error": "Failed to record play history"}), 500
-            
+
+        if not ObjectId.is_valid(data["song_id"]):
+            return jsonify({"error": "Invalid song ID format"}), 400
+        duration = data["duration_played"]
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+            return jsonify({"error": "duration_played must be a number"}), 400
+
+        # The write-behind buffer persists the play; we only enqueue it here
+        try:
+            UserHistory.enqueue_play(
+                username=username,
+                song_id=data["song_id"],
+                duration_played=data["duration_played"]
+            )
+        except BufferFull:
+            response = jsonify({"error": "Play history is busy, retry shortly"})
+            response.headers["Retry-After"] = "1"
+            return response, 503
+
+        return jsonify({"message": "Play history queued"}), 202
+
+    except Exception as e:
+        logger.error("Error recording play history: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@audio_bp.route("/history/record/batch", methods=["POST"])
+@jwt_required()
+def record_play_batch():
+    """Record many song plays in one request with per-item error reporting.
+
+    Body: a JSON array (or ``{"events": [...]}``) of
+    ``{song_id, duration_played, played_at}`` objects; ``played_at`` is an
+    optional ISO-8601 timestamp and defaults to the time of the request.
+    Timestamps in the future (beyond MAX_PLAY_CLOCK_SKEW) or older than
+    MAX_PLAY_AGE are rejected per item.
+    """
+    try:
+        username = get_jwt_identity()
+        data = request.get_json(silent=True)
+        events = data.get("events") if isinstance(data, dict) else data
+
+        if not isinstance(events, list) or not events:
+            return jsonify({"error": "A non-empty list of events is required"}), 400
+        if len(events) > MAX_HISTORY_BATCH:
+            return jsonify({
+                "error": f"At most {MAX_HISTORY_BATCH} events per batch"
+            }), 400
+
+        errors = []
+        valid_events = []
+        positions = []
+        now = datetime.utcnow()
+        for index, event in enumerate(events):
+            if not isinstance(event, dict) or not all(
+                k in event for k in ["song_id", "duration_played"]
+            ):
+                errors.append({"index": index, "error": "Missing required fields"})
+                continue
+            if not ObjectId.is_valid(event["song_id"]):
+                errors.append({"index": index, "error": "Invalid song ID format"})
+                continue
+            duration = event["duration_played"]
+            if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+                errors.append({"index": index, "error": "duration_played must be a number"})
+                continue
+            played_at = None
+            if event.get("played_at"):
+                try:
+                    played_at = datetime.fromisoformat(
+                        str(event["played_at"]).replace("Z", "+00:00")
+                    )
+                except ValueError:
+                    errors.append({"index": index, "error": "Invalid played_at timestamp"})
+                    continue
+                if played_at.tzinfo is not None:
+                    played_at = played_at.astimezone(timezone.utc).replace(tzinfo=None)
+                if played_at > now + MAX_PLAY_CLOCK_SKEW:
+                    errors.append({"index": index, "error": "played_at is in the future"})
+                    continue
+                if played_at < now - MAX_PLAY_AGE:
+                    errors.append({"index": index, "error": "played_at is too old"})
+                    continue
+            valid_events.append({
+                "username": username,
+                "song_id": event["song_id"],
+                "duration_played": event["duration_played"],
+                "played_at": played_at
+            })
+            positions.append(index)
+
+        inserted = 0
+        if valid_events:
+            inserted, write_errors = UserHistory.write_play_events(valid_events)
+            for write_error in write_errors:
+                write_error["index"] = positions[write_error["index"]]
+                errors.append(write_error)
+
+        errors.sort(key=lambda e: e["index"])
         return jsonify({
-            "message": "Play history recorded",
-            "history_id": history_id
-        }), 201
-        
+            "message": "Play history batch processed",
+            "inserted": inserted,
+            "failed": len(errors),
+            "errors": errors
+        }), 200 if not errors else 207
+
     except Exception as e:
-        current_app.logger.error(f"Error recording play history: {str(e)}")
+        logger.error("Error recording play history batch: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+@audio_bp.route("/history/buffer/stats", methods=["GET"])
+@jwt_required()
+def get_history_buffer_stats():
+    """Report play-history write buffer depth and flush latency."""
+    return jsonify(play_history_buffer.stats()), 200
+
+
 @audio_bp.route("/history", methods=["GET"])
 @jwt_required()
+@conditional(current_user_history_scope, private=True)
 def get_history():
     """Get user's play history."""
     try:
@@ -304,12 +776,13 @@ def get_history():
         return jsonify(history)
         
     except Exception as e:
-        current_app.logger.error(f"Error fetching play history: {str(e)}")
+        logger.error("Error fetching play history: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @audio_bp.route("/history/recent", methods=["GET"])
 @jwt_required()
+@conditional(current_user_history_scope, private=True)
 def get_recent_plays():
     """Get user's recently played songs."""
     try:
@@ -320,12 +793,13 @@ def get_recent_plays():
         return jsonify(recent)
         
     except Exception as e:
-        current_app.logger.error(f"Error fetching recent plays: {str(e)}")
+        logger.error("Error fetching recent plays: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @audio_bp.route("/history/most-played", methods=["GET"])
 @jwt_required()
+@conditional(current_user_history_scope, private=True)
 def get_most_played():
     """Get user's most played songs."""
     try:
@@ -336,10 +810,151 @@ def get_most_played():
         return jsonify(most_played)
         
     except Exception as e:
-        current_app.logger.error(f"Error fetching most played: {str(e)}")
+        logger.error("Error fetching most played: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+def ranked_songs(ranked, score_field):
+    """Public song documents for ranked (song_id, score) pairs, in rank order."""
+    songs = music_repository.get_many(
+        [song_id for song_id, _ in ranked],
+        serializers.LIST.projection(),
+        query={"public": {"$ne": False}}
+    )
+    items = []
+    for song_id, score in ranked:
+        song = songs.get(song_id)
+        if song is None:
+            continue
+        song[score_field] = round(score, 4)
+        items.append(song)
+    return items
+
+
+def parse_limit(default, maximum):
+    """Read ``limit`` from the query string, clamped to [1, maximum]."""
+    limit = int(request.args.get("limit", default))
+    return max(1, min(limit, maximum))
+
+
+@audio_bp.route("/trending", methods=["GET"])
+def get_trending():
+    """Top songs by time-decayed play count.
+
+    Query args: ``window`` (hour, day or week) and ``limit``. Served from
+    the ranker's precomputed lists, so no aggregation runs per request.
+    """
+    window = request.args.get("window", DEFAULT_WINDOW)
+    try:
+        limit = parse_limit(20, trending_ranker.top_size)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        ranked = trending_ranker.top(window, limit)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        items = ranked_songs(ranked, "trending_score")
+    except Exception as e:
+        logger.error("Trending lookup failed: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+    response = jsonify({
+        "window": window,
+        "items": items,
+        "count": len(items),
+        "as_of": trending_ranker.refreshed_at.isoformat() + "Z"
+    })
+    # Rankings only change on refresh
+    response.cache_control.public = True
+    response.cache_control.max_age = int(trending_ranker.refresh_interval)
+    return response
+
+
+@audio_bp.route("/music/<song_id>/similar", methods=["GET"])
+def get_similar_songs(song_id):
+    """Songs most often co-listened with this one, from the precomputed index."""
+    if not ObjectId.is_valid(song_id):
+        return jsonify({"error": "Invalid song ID format"}), 400
+    try:
+        limit = parse_limit(20, MAX_SIMILAR)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    key = cache_key("get_similar_songs", {"song_id": song_id, "limit": limit})
+    payload = catalog_cache.get(key)
+    if payload is None:
+        try:
+            items = ranked_songs(
+                recommendations.similar_songs(ObjectId(song_id), limit), "similarity"
+            )
+        except Exception as e:
+            logger.error("Similar songs lookup failed: %s", e)
+            return jsonify({"error": str(e)}), 500
+        payload = {"items": items, "count": len(items)}
+        catalog_cache.set(key, payload)
+    return jsonify(payload), 200
+
+
+@audio_bp.route("/recommendations", methods=["GET"])
+@jwt_required()
+def get_recommendations():
+    """Personal recommendations from the songs the user has been playing.
+
+    Falls back to the day's trending songs for users without history.
+    """
+    try:
+        limit = parse_limit(20, MAX_SIMILAR)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        ranked = recommendations.recommend_for_user(get_jwt_identity(), limit)
+        source = "history"
+        if not ranked:
+            ranked = trending_ranker.top(DEFAULT_WINDOW, limit)
+            source = "trending"
+        items = ranked_songs(ranked, "score")
+    except Exception as e:
+        logger.error("Recommendations failed: %s", e)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"items": items, "count": len(items), "source": source}), 200
+
+
+@audio_bp.route("/catalog/snapshot", methods=["GET"])
+@conditional(CATALOG_REVISION, vary=("Accept-Encoding",))
+def get_catalog_snapshot():
+    """Whole catalog as compressed columnar JSON, or the delta ``since`` a revision."""
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since must be an integer revision"}), 400
+
+    encoding = catalog_snapshot.choose_encoding(
+        request.headers.get("Accept-Encoding", "")
+    )
+    key = cache_key(
+        "catalog_snapshot", {"since": since, "encoding": encoding}, revision=g.revision
+    )
+    body = catalog_cache.get(key)
+    if body is None:
+        try:
+            body = catalog_snapshot.encode_snapshot(
+                catalog_snapshot.build_snapshot(since), encoding
+            )
+        except Exception as e:
+            logger.error("Catalog snapshot failed: %s", e)
+            return jsonify({"error": str(e)}), 500
+        catalog_cache.set(key, body)
+
+    response = current_app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
 @audio_bp.route("/search", methods=["GET"])
 def search_music():
     """Search for music by title, artist, album, or genre."""
@@ -351,30 +966,57 @@ def search_music():
             
         if len(query) < 1:
             return jsonify({"error": "Search query must be at least 1 character"}), 400
-            
+
+        try:
+            limit = int(request.args.get('limit', 20))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({"error": "limit and offset must be integers"}), 400
+        if limit < 1 or offset < 0:
+            return jsonify({"error": "limit must be positive and offset non-negative"}), 400
+        if offset + limit > MAX_RESULTS:
+            return jsonify({"error": f"offset + limit may not exceed {MAX_RESULTS}"}), 400
+
+        key = cache_key("search_music", {"q": query, "limit": limit, "offset": offset})
+        cached = catalog_cache.get(key)
+        if cached is not None:
+            return jsonify(cached), 200
+
         # Use the Music model's search method
-        results = Music.search_music(query)
-        
-        # Convert ObjectId to string and ensure proper formatting
-        for doc in results:
-            doc['_id'] = str(doc['_id'])
-            doc['url'] = doc.get('cloudinary_url', '')
-            doc['artist'] = doc.get('artist', 'Unknown Artist')
-            doc['title'] = doc.get('title', 'Unknown Title')
-            doc['album'] = doc.get('album', '')
-            doc['genre'] = doc.get('genre', '')
-            doc['duration'] = doc.get('duration', 0)
-            doc['cover_url'] = doc.get('cover_url', None)
-            
-        current_app.logger.info(f"🔍 Search for '{query}' returned {len(results)} results")
-        
-        return jsonify({
+        results = music_repository.search(
+            query, limit=limit, offset=offset,
+            projection=serializers.SEARCH_HIT.projection()
+        )
+
+        payload = {
             "query": query,
             "results": results,
-            "count": len(results)
-        }), 200
+            "count": len(results),
+            "limit": limit,
+            "offset": offset
+        }
+        catalog_cache.set(key, payload)
+        return jsonify(payload), 200
         
     except Exception as e:
-        current_app.logger.error(f"💥 Search error: {str(e)}")
+        logger.error("Search error: %s", e)
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
-    
\ No newline at end of file
+
+
+@audio_bp.route("/db/pool/stats", methods=["GET"])
+@jwt_required()
+def get_db_pool_stats():
+    """Checked-out vs available MongoDB connections per server, for this worker."""
+    return jsonify(pool_monitor.stats(current_app.config.get("MONGO_MAX_POOL_SIZE"))), 200
+
+
+@audio_bp.route("/cache/stats", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    """Report hit/miss/eviction counters for the catalog, song metadata, identity and revision caches."""
+    return jsonify({
+        "catalog": catalog_cache.stats(),
+        "song_metadata": song_meta_cache.stats(),
+        "identity": identity_cache.stats(),
+        "revision": revision_cache.stats()
+    }), 200
@@ -4,19 +4,34 @@ from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     jwt_required,
+    get_jwt,
     get_jwt_identity,
     set_access_cookies,
     set_refresh_cookies,
     unset_jwt_cookies,
     verify_jwt_in_request
 )
-from flask import current_app
+import logging
 
 
 # Ensure two blank lines before first route
 
 
 auth_bp = Blueprint("auth", __name__)
+logger = logging.getLogger(__name__)
+
+
+def identity_claims(identity):
+    """JWT claims that let /check answer without reading the users collection."""
+    return {"uid": identity["id"], "username": identity["username"]}
+
+
+def claimed_identity():
+    """The identity carried by the verified token, if it has the claims."""
+    claims = get_jwt()
+    if "username" not in claims:
+        return None
+    return {"id": claims.get("uid"), "email": get_jwt_identity(), "username": claims["username"]}
 
 
 @auth_bp.route("/register", methods=["POST"])
@@ -38,12 +53,14 @@ def register():
             }), 400
 
         try:
-            # Create the user. We don't need the returned insert result.
-            _ = User.create(email, password, username)
+            result = User.create(email, password, username)
+            claims = identity_claims(
+                {"id": str(result.inserted_id), "username": username}
+            )
 
             # Create tokens
-            access_token = create_access_token(identity=email)
-            refresh_token = create_refresh_token(identity=email)
+            access_token = create_access_token(identity=email, additional_claims=claims)
+            refresh_token = create_refresh_token(identity=email, additional_claims=claims)
             
             response = jsonify(
                 {
@@ -62,7 +79,7 @@ def register():
             return jsonify({"error": str(ve)}), 400
             
     except Exception as e:
-        current_app.logger.error("Registration error: %s", str(e))
+        logger.error("Registration error: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
@@ -86,8 +103,9 @@ def login():
             }), 401
 
         # Create tokens
-        access_token = create_access_token(identity=email)
-        refresh_token = create_refresh_token(identity=email)
+        claims = identity_claims(User.identity(user))
+        access_token = create_access_token(identity=email, additional_claims=claims)
+        refresh_token = create_refresh_token(identity=email, additional_claims=claims)
 
         response = jsonify(
             {
@@ -106,7 +124,7 @@ def login():
         return response
         
     except Exception as e:
-        current_app.logger.error("Login error: %s", str(e))
+        logger.error("Login error: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
@@ -123,6 +141,8 @@ def check_auth():
 
     We verify JWT if present but don't require it, so missing/invalid tokens
     result in a graceful `authenticated: false` response instead of HTTP 401.
+    Tokens carry the username claim, so this doesn't touch Mongo; tokens
+    issued before the claim existed fall back to the cached user lookup.
     """
     try:
         # Validate JWT if present, but don't require it.
@@ -131,7 +151,7 @@ def check_auth():
 
         user = None
         if current_user:
-            user = User.find_by_email(current_user)
+            user = claimed_identity() or User.get_identity(current_user)
 
         if user:
             return (
@@ -151,7 +171,7 @@ def check_auth():
         return jsonify({"authenticated": False}), 200
 
     except Exception as e:
-        current_app.logger.error("Auth check error: %s", str(e))
+        logger.error("Auth check error: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 
@@ -160,13 +180,17 @@ def check_auth():
 def refresh():
     try:
         current_user = get_jwt_identity()
-        user = User.find_by_email(current_user)
+        # Still checks the user exists (through the identity cache) so
+        # deleted accounts stop getting new access tokens
+        user = User.get_identity(current_user)
 
         if not user:
             return jsonify({"error": "User not found"}), 404
             
         # Create new access token
-            access_token = create_access_token(identity=current_user)
+        access_token = create_access_token(
+            identity=current_user, additional_claims=identity_claims(user)
+        )
 
         response = jsonify(
             {
@@ -184,5 +208,5 @@ def refresh():
         return response
         
     except Exception as e:
-        current_app.logger.error("Token refresh error: %s", str(e))
+        logger.error("Token refresh error: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
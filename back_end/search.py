@@ -0,0 +1,185 @@
+"""
+Catalog search.
+
+Every music document carries a ``search_tokens`` array holding the edge
+prefixes of each word in its title, artist, album and genre, plus each
+whole word marked with ``EXACT_MARKER``. A multikey index on that array
+answers type-ahead queries ("marsh", "leave bef") with index lookups
+instead of a regex scan. Songs matching every query word exactly are
+fetched first and prefix matches fill the rest of the candidate cap, so a
+short query ("lo") on a large catalog still ranks the exact hits rather
+than an arbitrary sample of prefix hits. A Mongo text index over the same
+fields supplements the results with any-word matches.
+
+Documents tokenized before exact tokens existed are still found by
+prefix; ``flask search-index`` re-tokenizes them.
+"""
+import re
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from database import mongo, secondary_db
+
+SEARCH_FIELDS = ("title", "artist", "album", "genre")
+FIELD_WEIGHTS = {"title": 10, "artist": 6, "album": 3, "genre": 1}
+
+# Longest prefix stored per word; longer query words are truncated to match
+MAX_PREFIX_LENGTH = 20
+# Upper bound on documents pulled from the token index before ranking
+CANDIDATE_CAP = 500
+# Prefixed to whole-word tokens; never part of a \w+ word
+EXACT_MARKER = "="
+# Upper bound on offset + limit for a single search request
+MAX_RESULTS = 200
+
+# Server-side bookkeeping fields that are never returned to clients
+INTERNAL_PROJECTION = {
+    "search_tokens": 0, "content_hash": 0, "upload_job_id": 0, "catalog_rev": 0,
+    # Binary waveform peaks are served separately by /music/<id>/waveform
+    "analysis.waveform": 0
+}
+
+# Index names; the indexes themselves are declared in indexes.py
+TOKEN_INDEX_NAME = "music_search_tokens"
+TEXT_INDEX_NAME = "music_text_search"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase words."""
+    if not text:
+        return []
+    return _WORD_RE.findall(str(text).lower())
+
+
+def build_search_tokens(doc):
+    """Return the sorted edge-prefix and whole-word tokens for a music document."""
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        for word in tokenize(doc.get(field)):
+            word = word[:MAX_PREFIX_LENGTH]
+            tokens.add(EXACT_MARKER + word)
+            for end in range(1, len(word) + 1):
+                tokens.add(word[:end])
+    return sorted(tokens)
+
+
+def _score(doc, words, phrase):
+    """Rank a candidate: exact word hits beat prefix hits, title beats genre."""
+    score = 0
+    for field, weight in FIELD_WEIGHTS.items():
+        value = (doc.get(field) or "")
+        if not value:
+            continue
+        field_words = tokenize(value)
+        if str(value).lower() == phrase:
+            score += weight * 3
+        for word in words:
+            if word in field_words:
+                score += weight * 2
+            elif any(w.startswith(word) for w in field_words):
+                score += weight
+    return score
+
+
+class SearchPlan:
+    """The queries and ranking for one search, independent of the driver.
+
+    search_catalog runs it with PyMongo; the async repository runs the
+    same plan with the async driver.
+    """
+
+    def __init__(self, query, limit=20, offset=0, projection=None):
+        self.query = query
+        self.offset = offset
+        self.projection = projection or INTERNAL_PROJECTION
+        self.words = tokenize(query)
+        self.wanted = min(offset + limit, MAX_RESULTS)
+        self.phrase = " ".join(self.words)
+
+    def exact_filter(self):
+        words = sorted({EXACT_MARKER + w[:MAX_PREFIX_LENGTH] for w in self.words})
+        return {"search_tokens": {"$all": words}}
+
+    def prefix_filter(self, exact=()):
+        """Prefix matches, leaving out the ``exact`` candidates already fetched."""
+        prefixes = sorted({w[:MAX_PREFIX_LENGTH] for w in self.words})
+        query = {"search_tokens": {"$all": prefixes}}
+        if exact:
+            query["_id"] = {"$nin": [d["_id"] for d in exact]}
+        return query
+
+    def rank(self, candidates):
+        candidates.sort(
+            key=lambda d: (-_score(d, self.words, self.phrase), (d.get("title") or "").lower())
+        )
+        return candidates
+
+    def text_shortfall(self, candidates):
+        """How many whole-word text matches are needed to fill the page."""
+        return max(0, self.wanted - len(candidates))
+
+    def text_filter(self, candidates):
+        seen = [d["_id"] for d in candidates]
+        return {"$text": {"$search": self.query}, "_id": {"$nin": seen}}
+
+    def text_projection(self):
+        return dict(self.projection, score={"$meta": "textScore"})
+
+    def page(self, candidates):
+        for doc in candidates:
+            doc.pop("score", None)
+        return candidates[self.offset:self.wanted]
+
+
+TEXT_SORT = [("score", {"$meta": "textScore"})]
+
+
+def search_catalog(query, limit=20, offset=0, projection=None):
+    """Search the catalog and return one ranked page of music documents.
+
+    ``projection`` must keep the searched fields; it defaults to the full
+    document minus internal fields.
+    """
+    plan = SearchPlan(query, limit, offset, projection)
+    if not plan.words:
+        return []
+
+    music = secondary_db().music
+    candidates = list(music.find(plan.exact_filter(), plan.projection).limit(CANDIDATE_CAP))
+    if len(candidates) < CANDIDATE_CAP:
+        candidates.extend(music.find(
+            plan.prefix_filter(candidates), plan.projection
+        ).limit(CANDIDATE_CAP - len(candidates)))
+    plan.rank(candidates)
+
+    # Top up with whole-word text matches when type-ahead finds too few
+    shortfall = plan.text_shortfall(candidates)
+    if shortfall:
+        try:
+            candidates.extend(music.find(
+                plan.text_filter(candidates), plan.text_projection()
+            ).sort(TEXT_SORT).limit(shortfall))
+        except OperationFailure:
+            # Text index not built yet; prefix results alone are still valid
+            pass
+
+    return plan.page(candidates)
+
+
+def backfill_search_tokens(batch_size=500):
+    """Compute search_tokens for every music document; returns the count updated."""
+    updated = 0
+    ops = []
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    for doc in mongo.db.music.find({}, projection):
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"search_tokens": build_search_tokens(doc)}}
+        ))
+        if len(ops) >= batch_size:
+            updated += mongo.db.music.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += mongo.db.music.bulk_write(ops, ordered=False).modified_count
+    return updated
@@ -0,0 +1,80 @@
+"""
+Per-view response schemas for music documents.
+
+Each view declares exactly the fields it returns and their defaults, and
+turns that into a Mongo projection: defaults become ``$ifNull``
+expressions and renamed fields (``url`` from ``cloudinary_url``) are
+computed server-side, so documents come back from the driver already in
+response shape and routes never loop over them. ``_id`` stays an
+ObjectId, because keyset cursors and ``$nin`` filters need it; the app's
+JSON provider writes it as a hex string.
+"""
+
+
+class View:
+    def __init__(self, name, fields):
+        """``fields`` maps output name -> (source field, default or None)."""
+        self.name = name
+        self.fields = fields
+
+    def projection(self, only=None):
+        """Mongo projection emitting this view's fields (or the subset ``only``)."""
+        if only:
+            unknown = [f for f in only if f not in self.fields]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        projection = {}
+        for output, (source, default) in self.fields.items():
+            if only and output not in only:
+                continue
+            if isinstance(source, dict):
+                # Nested inclusion, e.g. a subset of the analysis sub-document
+                projection.update({f"{output}.{field}": 1 for field in source})
+            else:
+                # Missing fields come back as the default (or null), never absent
+                projection[output] = {"$ifNull": [f"${source}", default]}
+        return projection
+
+
+# Catalog pages, trending and recommendations. ``play_count`` changes on
+# every trending flush, so it is served by GET /music/<id>/plays instead of
+# the catalog-revision views.
+LIST = View("list", {
+    "title": ("title", "Unknown Title"),
+    "artist": ("artist", "Unknown Artist"),
+    "album": ("album", None),
+    "genre": ("genre", None),
+    "duration": ("duration", 0),
+    "url": ("cloudinary_url", ""),
+    "cover_url": ("cover_url", None),
+    "uploaded_by": ("uploaded_by", "Anonymous"),
+    "created_at": ("created_at", None),
+    "format": ("format", None),
+    "likes": ("likes", 0),
+    "public": ("public", True),
+})
+
+# The song page
+DETAIL = View("detail", dict(LIST.fields, **{
+    "album": ("album", ""),
+    "genre": ("genre", ""),
+    "description": ("description", ""),
+    "created_at": ("created_at", ""),
+    "cloudinary_url": ("cloudinary_url", ""),
+    "file_size": ("file_size", 0),
+    "analysis": ({
+        "duration": 1, "sample_rate": 1, "channels": 1, "codec": 1, "bitrate": 1,
+        "loudness_lufs": 1, "sample_peak_db": 1, "waveform_points": 1,
+    }, None),
+}))
+
+# Search results
+SEARCH_HIT = View("search_hit", {
+    "title": ("title", "Unknown Title"),
+    "artist": ("artist", "Unknown Artist"),
+    "album": ("album", ""),
+    "genre": ("genre", ""),
+    "duration": ("duration", 0),
+    "url": ("cloudinary_url", ""),
+    "cover_url": ("cover_url", None),
+})
@@ -0,0 +1,142 @@
+"""
+Pluggable media storage.
+
+``STORAGE_BACKEND`` selects where uploaded audio and cover images go:
+
+* ``cloudinary`` (default) - the hosted service, as before;
+* ``local`` - files under ``LOCAL_STORAGE_DIR``, served by this app with
+  HTTP Range support, so the stack runs fully offline.
+
+Backends return a Cloudinary-shaped result (``secure_url``, ``bytes``,
+``duration``, ``format``) plus ``storage_backend``/``storage_key``, so
+callers build music documents the same way for either.
+"""
+import os
+import shutil
+import uuid
+from flask import current_app
+from metrics import storage_timer
+
+
+class StorageBackend:
+    name = None
+
+    def upload_audio(self, source, filename, chunk_size=None):
+        """Store an audio file (a path or file object); ``chunk_size`` requests a chunked transfer."""
+        raise NotImplementedError
+
+    def upload_image(self, source, filename):
+        """Store a cover image (a path or file object)."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path for a stored key, or None if the backend is remote."""
+        return None
+
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def upload_audio(self, source, filename, chunk_size=None):
+        import cloudinary.uploader
+
+        options = dict(
+            resource_type="video",  # Use video for audio streaming
+            folder="music_sphere",
+            transformation=[{"format": "mp3", "audio_codec": "mp3"}],
+            filename_override=filename,
+            use_filename=True,
+            unique_filename=False
+        )
+        with storage_timer(self.name, "upload_audio"):
+            if chunk_size:
+                # upload_large sends the file in chunks instead of one body
+                result = cloudinary.uploader.upload_large(
+                    source, chunk_size=chunk_size, **options
+                )
+            else:
+                result = cloudinary.uploader.upload(source, **options)
+        result["storage_backend"] = self.name
+        result["storage_key"] = result.get("public_id")
+        return result
+
+    def upload_image(self, source, filename):
+        import cloudinary.uploader
+
+        with storage_timer(self.name, "upload_image"):
+            result = cloudinary.uploader.upload(
+                source,
+                resource_type="image",
+                folder="music_sphere/covers",
+                transformation=[
+                    {"width": 500, "height": 500, "crop": "fill"},
+                    {"quality": "auto"}
+                ],
+                filename_override=filename,
+                use_filename=True,
+                unique_filename=False
+            )
+        result["storage_backend"] = self.name
+        result["storage_key"] = result.get("public_id")
+        return result
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root, base_url):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _store(self, source, folder, filename):
+        ext = os.path.splitext(filename)[1].lower()
+        key = f"{folder}/{uuid.uuid4().hex}{ext}"
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with storage_timer(self.name, f"upload_{folder}"):
+            if isinstance(source, (str, os.PathLike)):
+                # copyfile uses sendfile/copy_file_range where the OS has them
+                shutil.copyfile(source, path)
+            else:
+                with open(path, "wb") as out:
+                    shutil.copyfileobj(source, out, 1024 * 1024)
+        return {
+            "secure_url": f"{self.base_url}/api/audio/media/{key}",
+            "bytes": os.path.getsize(path),
+            # Duration comes from local audio analysis for this backend
+            "duration": 0,
+            "format": ext.lstrip("."),
+            "storage_backend": self.name,
+            "storage_key": key
+        }
+
+    def upload_audio(self, source, filename, chunk_size=None):
+        return self._store(source, "audio", filename)
+
+    def upload_image(self, source, filename):
+        return self._store(source, "covers", filename)
+
+    def local_path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError("Invalid storage key")
+        return path
+
+
+def init_storage(app):
+    """Build the configured backend and attach it to the app."""
+    backend = app.config.get("STORAGE_BACKEND", "cloudinary")
+    if backend == "local":
+        storage = LocalStorage(
+            app.config["LOCAL_STORAGE_DIR"], app.config["PUBLIC_BASE_URL"]
+        )
+    elif backend == "cloudinary":
+        storage = CloudinaryStorage()
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    app.extensions["storage"] = storage
+    return storage
+
+
+def get_storage():
+    return current_app.extensions["storage"]
@@ -0,0 +1,81 @@
+"""TTLCache eviction, expiry and keys against a fake clock."""
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import cache
+from cache import TTLCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    lru = TTLCache(maxsize=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+
+    # Reading "a" makes "b" the least recently used
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    assert lru.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = TTLCache(maxsize=10, ttl=5)
+    lru.set("a", 1)
+
+    clock[0] += 4.9
+    assert lru.get("a") == 1
+    clock[0] += 0.1
+    assert lru.get("a") is None
+
+    stats = lru.stats()
+    assert (stats["size"], stats["expirations"]) == (0, 1)
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_set_restarts_the_ttl(clock):
+    lru = TTLCache(maxsize=10, ttl=5)
+    lru.set("a", 1)
+    clock[0] += 4
+    lru.set("a", 2)
+    clock[0] += 4
+
+    assert lru.get("a") == 2
+
+
+def test_zero_maxsize_disables_the_cache(clock):
+    lru = TTLCache(maxsize=0)
+    lru.set("a", 1)
+
+    assert lru.get("a") is None
+    assert lru.stats()["size"] == 0
+
+
+def test_invalidate_and_clear_drop_entries(clock):
+    lru = TTLCache()
+    lru.set("a", 1)
+    lru.set("b", 2)
+
+    lru.invalidate("a")
+    lru.invalidate("missing")
+    assert lru.get("a") is None
+    lru.clear()
+    assert lru.get("b") is None
+    assert lru.stats()["invalidations"] == 2
+
+
+def test_cache_key_ignores_arg_order_but_not_revision():
+    first = cache_key("music", MultiDict([("limit", "5"), ("fields", "title")]), revision=3)
+    second = cache_key("music", MultiDict([("fields", "title"), ("limit", "5")]), revision=3)
+
+    assert first == second
+    assert first != cache_key("music", MultiDict([("limit", "5"), ("fields", "title")]), revision=4)
+    assert cache_key("music", {"q": "a"}) == cache_key("music", MultiDict([("q", "a")]))
@@ -0,0 +1,124 @@
+"""Catalog snapshots, deltas and tombstones against stub collections: no database."""
+import gzip
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import build_snapshot, choose_encoding, encode_snapshot
+
+
+class StubCursor(list):
+    def sort(self, key, direction):
+        return StubCursor(sorted(self, key=lambda doc: doc[key], reverse=direction < 0))
+
+
+class StubCollection:
+    """``find`` with an optional ``catalog_rev: {"$gte": n}`` filter and a projection."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection):
+        since = query.get("catalog_rev", {}).get("$gte", 0)
+        return StubCursor(
+            {field: doc[field] for field in projection if field in doc}
+            for doc in self.docs.values() if doc.get("catalog_rev", 0) >= since
+        )
+
+
+class Catalog:
+    """The writes Music.mark_catalog_changed makes, applied to stub collections."""
+
+    def __init__(self, monkeypatch):
+        self.revision = 0
+        self.music = StubCollection()
+        self.tombstones = StubCollection()
+        db = SimpleNamespace(music=self.music, music_tombstones=self.tombstones)
+        monkeypatch.setattr(catalog_snapshot, "mongo", SimpleNamespace(db=db))
+        monkeypatch.setattr(catalog_snapshot, "get_revision", lambda scope: (self.revision, None))
+
+    def write(self, song_id, **fields):
+        self.revision += 1
+        doc = self.music.docs.setdefault(song_id, {"_id": song_id})
+        doc.update(fields, catalog_rev=self.revision)
+
+    def delete(self, song_id):
+        self.revision += 1
+        del self.music.docs[song_id]
+        self.tombstones.docs[song_id] = {"_id": song_id, "catalog_rev": self.revision}
+
+
+def merge(songs, snapshot):
+    """Apply a snapshot to a client's copy the way useMusic.getAllSongs does."""
+    by_id = {} if snapshot["full"] else dict(songs)
+    for song_id in snapshot["deleted"]:
+        by_id.pop(song_id, None)
+    for row in range(snapshot["count"]):
+        song = {field: snapshot["columns"][field][row] for field in snapshot["fields"]}
+        by_id[song["_id"]] = song
+    return by_id
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = Catalog(monkeypatch)
+    for n in range(1, 4):
+        catalog.write(f"song{n}", title=f"Song {n}", created_at=datetime(2024, 1, n))
+    return catalog
+
+
+def test_full_snapshot_is_columnar(catalog):
+    snapshot = build_snapshot()
+
+    assert snapshot["full"] and snapshot["since"] is None
+    assert (snapshot["revision"], snapshot["count"]) == (3, 3)
+    assert snapshot["columns"]["_id"] == ["song1", "song2", "song3"]
+    assert snapshot["columns"]["title"] == ["Song 1", "Song 2", "Song 3"]
+    assert snapshot["columns"]["created_at"][0] == "2024-01-01T00:00:00"
+    assert snapshot["columns"]["album"] == [None, None, None]
+    assert snapshot["deleted"] == []
+
+
+def test_delta_carries_writes_and_deletions_since_a_revision(catalog):
+    catalog.write("song2", title="Song 2 (Remastered)")
+    catalog.delete("song3")
+    catalog.write("song4", title="Song 4")
+
+    delta = build_snapshot(since=4)
+
+    assert not delta["full"] and delta["since"] == 4
+    assert delta["columns"]["_id"] == ["song2", "song4"]
+    assert delta["deleted"] == ["song3"]
+
+
+def test_merged_deltas_match_a_full_snapshot(catalog):
+    songs = merge({}, build_snapshot())
+    catalog.write("song1", title="Renamed")
+    catalog.delete("song2")
+    songs = merge(songs, build_snapshot(since=3))
+    catalog.write("song5", title="Song 5")
+    catalog.delete("song5")
+    catalog.write("song6", title="Song 6")
+
+    songs = merge(songs, build_snapshot(since=5))
+
+    assert songs == merge({}, build_snapshot())
+    assert sorted(songs) == ["song1", "song3", "song6"]
+
+
+def test_revision_from_the_future_forces_a_full_snapshot(catalog):
+    snapshot = build_snapshot(since=99)
+
+    assert snapshot["full"] and snapshot["count"] == 3
+
+
+def test_encoding_negotiation_and_gzip_round_trip(catalog):
+    snapshot = build_snapshot()
+
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert json.loads(gzip.decompress(encode_snapshot(snapshot, "gzip"))) == snapshot
+    assert json.loads(encode_snapshot(snapshot, None)) == snapshot
@@ -0,0 +1,125 @@
+"""Chunked-upload range bookkeeping against a stub sessions collection and a temp spool."""
+import io
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+import chunked_upload
+from chunked_upload import merged_ranges, missing_ranges, parse_content_range, received_bytes
+
+
+class StubSessions:
+    """The ``upload_sessions`` calls chunked_upload makes, kept in a dict."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def insert_one(self, doc):
+        self.docs[doc["_id"]] = doc
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def find_one_and_update(self, query, update, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc["status"] != query.get("status", doc["status"]):
+            return None
+        for field, value in update.get("$push", {}).items():
+            doc[field] = doc[field] + [value]
+        doc.update(update.get("$set", {}))
+        return dict(doc)
+
+
+@pytest.fixture
+def sessions(monkeypatch, tmp_path):
+    stub = StubSessions()
+    db = SimpleNamespace(upload_sessions=stub)
+    monkeypatch.setattr(chunked_upload, "mongo", SimpleNamespace(db=db))
+    app = Flask(__name__)
+    app.config["UPLOAD_SPOOL_DIR"] = str(tmp_path)
+    with app.app_context():
+        yield stub
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes 0-99/1000", (0, 100)),
+    ("bytes 900-999/1000", (900, 100)),
+    ("bytes 5-5/*", (5, 1)),
+])
+def test_content_range_gives_offset_and_length(header, expected):
+    assert parse_content_range(header) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "items 0-9/10", "bytes", "bytes a-9/10", "bytes 0/10", "0-9/10",
+])
+def test_malformed_content_range_is_rejected(header):
+    with pytest.raises(ValueError, match="Malformed Content-Range"):
+        parse_content_range(header)
+
+
+def test_ranges_merge_when_they_overlap_or_touch():
+    ranges = [[10, 20], [0, 5], [5, 8], [15, 30], [40, 50]]
+
+    assert merged_ranges(ranges) == [[0, 8], [10, 30], [40, 50]]
+
+
+def test_missing_ranges_and_received_bytes():
+    session = {"size": 100, "received": [[20, 40], [0, 10], [30, 50]]}
+
+    assert missing_ranges(session) == [[10, 20], [50, 100]]
+    assert received_bytes(session) == 40
+    assert missing_ranges({"size": 10, "received": []}) == [[0, 10]]
+
+
+def test_chunks_in_any_order_assemble_the_file(sessions):
+    data = bytes(range(256)) * 40
+    session = chunked_upload.create_session("song.mp3", len(data), {}, chunk_size=4096)
+
+    for start, end in [(4096, 8192), (8192, len(data)), (0, 4096)]:
+        assert missing_ranges(session) != []
+        chunk = io.BytesIO(data[start:end])
+        session = chunked_upload.write_chunk(session, start, chunk, end - start)
+
+    assert missing_ranges(session) == []
+    assert received_bytes(session) == len(data)
+    with open(chunked_upload.spool_path(session["_id"]), "rb") as f:
+        assert f.read() == data
+
+
+def test_resent_chunk_is_counted_once(sessions):
+    session = chunked_upload.create_session("song.mp3", 10, {})
+
+    for _ in range(2):
+        session = chunked_upload.write_chunk(session, 0, io.BytesIO(b"x" * 6), 6)
+
+    assert received_bytes(session) == 6
+    assert missing_ranges(session) == [[6, 10]]
+
+
+@pytest.mark.parametrize("offset, body, length, error", [
+    (8, b"xxxx", 4, "outside the declared file size"),
+    (-1, b"x", 1, "outside the declared file size"),
+    (0, b"xx", 4, "ended before the declared chunk length"),
+])
+def test_bad_chunks_are_rejected_without_being_recorded(sessions, offset, body, length, error):
+    session = chunked_upload.create_session("song.mp3", 10, {})
+
+    with pytest.raises(ValueError, match=error):
+        chunked_upload.write_chunk(session, offset, io.BytesIO(body), length)
+
+    assert chunked_upload.get_session(session["_id"])["received"] == []
+
+
+def test_only_complete_sessions_can_be_finalized(sessions):
+    session = chunked_upload.create_session("song.mp3", 10, {})
+    chunked_upload.write_chunk(session, 0, io.BytesIO(b"x" * 5), 5)
+
+    assert chunked_upload.begin_finalize(session["_id"])[1] is False
+    chunked_upload.write_chunk(session, 5, io.BytesIO(b"x" * 5), 5)
+    claimed, ok = chunked_upload.begin_finalize(session["_id"])
+
+    assert ok and claimed["status"] == "finalizing"
+    with pytest.raises(ValueError, match="finalizing"):
+        chunked_upload.write_chunk(claimed, 0, io.BytesIO(b"x"), 1)
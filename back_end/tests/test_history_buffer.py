@@ -0,0 +1,51 @@
+"""HistoryWriteBuffer against a stub writer: no database, no worker thread."""
+from flask import Flask
+
+from history_buffer import HistoryWriteBuffer
+
+
+class FlakyWriter:
+    """Raises for the first ``failures`` calls, then accepts every event."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, batch):
+        self.calls.append(list(batch))
+        if len(self.calls) <= self.failures:
+            raise ConnectionError("mongo unavailable")
+        return len(batch), []
+
+
+def make_buffer(writer, **options):
+    buffer = HistoryWriteBuffer(batch_size=2, **options)
+    buffer.init_app(Flask(__name__), writer)
+    # Queued directly, so no worker thread starts
+    buffer._events.extend({"song_id": str(n)} for n in range(3))
+    return buffer
+
+
+def test_failed_batch_is_written_again():
+    writer = FlakyWriter(failures=1)
+    buffer = make_buffer(writer, max_attempts=3)
+
+    buffer.flush()
+
+    assert writer.calls[0] == writer.calls[1]
+    assert buffer.stats()["flushed_events"] == 3
+    assert buffer.stats()["failed_events"] == 0
+    assert buffer.stats()["retried_batches"] == 1
+
+
+def test_batch_is_dropped_after_max_attempts():
+    writer = FlakyWriter(failures=10)
+    buffer = make_buffer(writer, max_attempts=2)
+
+    buffer.flush()
+
+    # Both batches get two attempts each
+    assert len(writer.calls) == 4
+    assert buffer.stats()["flushed_events"] == 0
+    assert buffer.stats()["failed_events"] == 3
+    assert buffer.stats()["queued"] == 0
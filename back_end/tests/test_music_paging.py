@@ -0,0 +1,60 @@
+"""Keyset paging helpers on Music against an in-memory list: no database."""
+import pytest
+from bson import ObjectId
+
+from models import Music
+
+
+def fetch(docs, query, limit):
+    """What ``music.find(query).sort("_id", -1).limit(limit)`` returns for ``docs``."""
+    before = query.get("_id", {}).get("$lt")
+    matching = [doc for doc in docs if before is None or doc["_id"] < before]
+    return sorted(matching, key=lambda doc: doc["_id"], reverse=True)[:limit]
+
+
+def test_cursor_round_trips_and_is_url_safe():
+    music_id = ObjectId()
+
+    cursor = Music.encode_cursor(music_id)
+
+    assert Music.decode_cursor(cursor) == music_id
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "not a cursor!", "é", "AAAA"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        Music.decode_cursor(cursor)
+
+
+def test_page_filter_keeps_the_query_and_adds_the_cursor():
+    music_id = ObjectId()
+    query = {"genre": "jazz"}
+
+    filters = Music.page_filter(query, Music.encode_cursor(music_id))
+
+    assert filters == {"genre": "jazz", "_id": {"$lt": music_id}}
+    assert query == {"genre": "jazz"}
+    assert Music.page_filter(query, None) == query
+
+
+def test_split_page_only_sets_a_cursor_when_another_page_exists():
+    docs = [{"_id": ObjectId()} for _ in range(3)]
+
+    assert Music.split_page(docs, 3) == (docs, None)
+    page, cursor = Music.split_page(docs, 2)
+    assert page == docs[:2]
+    assert Music.decode_cursor(cursor) == docs[1]["_id"]
+
+
+def test_pages_cover_the_catalog_newest_first_without_repeats():
+    docs = [{"_id": ObjectId()} for _ in range(7)]
+    seen, cursor = [], None
+
+    while True:
+        page, cursor = Music.split_page(fetch(docs, Music.page_filter({}, cursor), 3 + 1), 3)
+        seen.extend(doc["_id"] for doc in page)
+        if not cursor:
+            break
+
+    assert seen == sorted((doc["_id"] for doc in docs), reverse=True)
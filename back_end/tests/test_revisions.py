@@ -0,0 +1,105 @@
+"""ETag validators and the conditional decorator against stub revisions: no database."""
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask, g
+from werkzeug.http import http_date, parse_etags
+
+import revisions
+from revisions import cache_headers, conditional, is_not_modified, validators
+
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, 15, 123456)
+
+
+@pytest.fixture
+def state(monkeypatch):
+    current = {"revision": 3, "updated_at": UPDATED_AT, "views": 0}
+    monkeypatch.setattr(revisions, "get_revision",
+                        lambda scope: (current["revision"], current["updated_at"]))
+    return current
+
+
+@pytest.fixture
+def client(state):
+    app = Flask(__name__)
+
+    @app.route("/music")
+    @conditional("catalog", max_age=30, vary=("Accept-Encoding",))
+    def music():
+        state["views"] += 1
+        return {"revision": g.revision}
+
+    @app.route("/missing")
+    @conditional("catalog")
+    def missing():
+        return {"error": "not found"}, 404
+
+    return app.test_client()
+
+
+def test_etag_depends_on_scope_revision_url_and_variant():
+    etag, last_modified = validators("catalog", 3, UPDATED_AT, "/music?")
+
+    assert etag == validators("catalog", 3, None, "/music?")[0]
+    for scope, revision, full_path, variant in (
+        ("history:a", 3, "/music?", ""), ("catalog", 4, "/music?", ""),
+        ("catalog", 3, "/music?limit=5", ""), ("catalog", 3, "/music?", "gzip"),
+    ):
+        assert validators(scope, revision, UPDATED_AT, full_path, variant)[0] != etag
+    # HTTP dates have whole seconds; a sub-second part would never compare equal
+    assert last_modified == datetime(2024, 5, 1, 12, 30, 15, tzinfo=timezone.utc)
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    etag, last_modified = validators("catalog", 3, UPDATED_AT, "/music?")
+
+    assert is_not_modified(etag, last_modified, parse_etags(f'"{etag}"'), None)
+    assert is_not_modified(etag, last_modified, parse_etags("*"), None)
+    assert not is_not_modified(etag, last_modified, parse_etags('"stale"'), last_modified)
+    assert is_not_modified(etag, last_modified, parse_etags(None), last_modified)
+    assert not is_not_modified(etag, None, parse_etags(None), last_modified)
+
+
+def test_cache_headers():
+    headers = cache_headers("abc", None, private=True, max_age=5)
+
+    assert headers == {"ETag": '"abc"', "Cache-Control": "private, max-age=5, must-revalidate"}
+    assert cache_headers("abc", UPDATED_AT)["Last-Modified"] == http_date(UPDATED_AT)
+
+
+def test_matching_etag_is_answered_with_304_without_running_the_view(client, state):
+    first = client.get("/music")
+    etag = first.headers["ETag"]
+
+    second = client.get("/music", headers={"If-None-Match": etag})
+
+    assert first.status_code == 200 and first.json == {"revision": 3}
+    assert second.status_code == 304 and second.data == b""
+    assert second.headers["ETag"] == etag
+    assert first.headers["Cache-Control"] == "public, max-age=30, must-revalidate"
+    assert "Accept-Encoding" in second.headers["Vary"]
+    assert state["views"] == 1
+
+
+def test_new_revision_serves_a_fresh_body(client, state):
+    etag = client.get("/music").headers["ETag"]
+    state["revision"] = 4
+
+    response = client.get("/music", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json == {"revision": 4}
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since_is_honoured(client):
+    last_modified = client.get("/music").headers["Last-Modified"]
+
+    assert client.get("/music", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+
+def test_errors_are_not_given_validators(client):
+    response = client.get("/missing")
+
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
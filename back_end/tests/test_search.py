@@ -0,0 +1,111 @@
+"""Search tokens, SearchPlan and search_catalog against a stub collection: no database."""
+from types import SimpleNamespace
+
+from pymongo.errors import OperationFailure
+
+import search
+from search import EXACT_MARKER, MAX_RESULTS, SearchPlan, build_search_tokens
+
+
+class StubCursor(list):
+    def limit(self, n):
+        return StubCursor(self[:n])
+
+    def sort(self, key):
+        return self
+
+
+class StubMusic:
+    """Answers the token ``$all``/``$nin`` filters; has no text index."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.filters = []
+
+    def find(self, query, projection=None):
+        self.filters.append(query)
+        if "$text" in query:
+            raise OperationFailure("text index required for $text query")
+        wanted = set(query["search_tokens"]["$all"])
+        skipped = query.get("_id", {}).get("$nin", [])
+        return StubCursor(
+            dict(doc) for doc in self.docs
+            if wanted <= set(doc["search_tokens"]) and doc["_id"] not in skipped
+        )
+
+
+def song(n, title, artist="", genre=""):
+    doc = {"_id": n, "title": title, "artist": artist, "genre": genre}
+    doc["search_tokens"] = build_search_tokens(doc)
+    return doc
+
+
+def test_tokens_hold_every_prefix_and_the_whole_word():
+    tokens = build_search_tokens({"title": "Blue Sky", "genre": None})
+
+    assert tokens == sorted(tokens)
+    assert {"b", "bl", "blu", "blue", "s", "sk", "sky"} <= set(tokens)
+    assert {EXACT_MARKER + "blue", EXACT_MARKER + "sky"} <= set(tokens)
+    assert EXACT_MARKER + "blu" not in tokens
+
+
+def test_long_words_are_truncated_on_both_sides():
+    word = "x" * (search.MAX_PREFIX_LENGTH + 5)
+    plan = SearchPlan(word)
+
+    tokens = build_search_tokens({"title": word})
+
+    assert plan.prefix_filter()["search_tokens"]["$all"][0] in tokens
+    assert plan.exact_filter()["search_tokens"]["$all"][0] in tokens
+
+
+def test_prefix_filter_leaves_out_exact_candidates():
+    plan = SearchPlan("Leave bef")
+
+    query = plan.prefix_filter([{"_id": 1}, {"_id": 2}])
+
+    assert query == {"search_tokens": {"$all": ["bef", "leave"]}, "_id": {"$nin": [1, 2]}}
+    assert plan.exact_filter() == {"search_tokens": {"$all": ["=bef", "=leave"]}}
+
+
+def test_rank_puts_exact_title_hits_before_prefix_and_genre_hits():
+    plan = SearchPlan("love")
+    docs = [
+        {"title": "Lovely Day"},
+        {"title": "Something", "genre": "love"},
+        {"title": "Love"},
+        {"title": "Endless Love"},
+    ]
+
+    ranked = [doc["title"] for doc in plan.rank(docs)]
+
+    assert ranked == ["Love", "Endless Love", "Lovely Day", "Something"]
+
+
+def test_page_applies_offset_and_caps_results():
+    plan = SearchPlan("a", limit=3, offset=2)
+    assert plan.page([{"n": n, "score": 1.0} for n in range(10)]) == [{"n": 2}, {"n": 3}, {"n": 4}]
+    assert SearchPlan("a", limit=MAX_RESULTS, offset=50).wanted == MAX_RESULTS
+
+
+def test_search_catalog_ranks_exact_then_prefix_without_a_text_index(monkeypatch):
+    music = StubMusic([
+        song(1, "Midnight City"),
+        song(2, "Mid Air", artist="Neon"),
+        song(3, "Daylight"),
+        song(4, "Mid"),
+    ])
+    monkeypatch.setattr(search, "secondary_db", lambda: SimpleNamespace(music=music))
+
+    results = search.search_catalog("mid")
+
+    assert [doc["_id"] for doc in results] == [4, 2, 1]
+    # Exact, then prefix without the exact hits, then the failing text top-up
+    assert music.filters[1]["_id"] == {"$nin": [2, 4]}
+    assert "$text" in music.filters[2]
+
+
+def test_blank_query_does_not_touch_the_database(monkeypatch):
+    monkeypatch.setattr(search, "secondary_db", lambda: None)
+
+    assert search.search_catalog("  !! ") == []
@@ -0,0 +1,81 @@
+"""Cosine top-K neighbours checked against a dense NumPy reference."""
+import numpy as np
+import pytest
+
+import similarity
+
+
+def random_matrix(seed=7, users=60, items=40, plays=400):
+    rng = np.random.default_rng(seed)
+    return similarity.interaction_matrix(
+        rng.integers(0, users, plays), rng.integers(0, items, plays), rng.random(plays) + 0.5,
+        shape=(users, items)
+    )
+
+
+def dense_cosine(matrix):
+    dense = matrix.toarray().astype(np.float64)
+    norms = np.linalg.norm(dense, axis=0)
+    norms[norms == 0] = 1
+    unit = dense / norms
+    sims = unit.T @ unit
+    np.fill_diagonal(sims, 0)
+    return sims
+
+
+def test_interaction_matrix_sums_duplicates_then_log_damps():
+    matrix = similarity.interaction_matrix([0, 0, 1], [2, 2, 0], [1.0, 2.0, 1.0])
+
+    assert matrix.shape == (2, 3)
+    assert matrix[0, 2] == pytest.approx(np.log1p(3.0))
+    assert matrix[1, 0] == pytest.approx(np.log1p(1.0))
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 256])
+def test_top_k_matches_brute_force(batch_size):
+    matrix = random_matrix()
+    expected = dense_cosine(matrix)
+
+    items, neighbors, scores = similarity.top_k_neighbors(matrix, k=5, batch_size=batch_size)
+
+    assert list(items) == list(range(40))
+    for item in items:
+        best = np.sort(expected[item][expected[item] > 0])[::-1][:5]
+        found = neighbors[item][neighbors[item] >= 0]
+        assert scores[item][:len(best)] == pytest.approx(best, rel=1e-4)
+        assert scores[item] == pytest.approx(sorted(scores[item], reverse=True))
+        assert item not in found
+        assert expected[item, found] == pytest.approx(scores[item][:len(found)], rel=1e-4)
+
+
+def test_short_neighbour_lists_are_padded():
+    # Song 2 shares no listener with anything; song 0 and 1 only with each other
+    matrix = similarity.interaction_matrix([0, 0, 1], [0, 1, 2], [1.0, 1.0, 1.0])
+
+    _, neighbors, scores = similarity.top_k_neighbors(matrix, k=3)
+
+    assert neighbors.tolist() == [[1, -1, -1], [0, -1, -1], [-1, -1, -1]]
+    assert scores[0].tolist() == pytest.approx([1.0, 0.0, 0.0])
+
+
+def test_co_occurring_songs_share_a_listener():
+    matrix = similarity.interaction_matrix([0, 0, 1, 1, 2], [0, 1, 1, 2, 3], [1.0] * 5)
+
+    assert similarity.co_occurring(matrix, [0]).tolist() == [0, 1]
+    assert similarity.co_occurring(matrix, [2]).tolist() == [1, 2]
+    assert similarity.co_occurring(matrix, []).tolist() == []
+
+
+def test_recomputing_co_occurring_songs_matches_a_full_build():
+    before = random_matrix(users=200, items=300, plays=3000)
+    _, neighbors, scores = similarity.top_k_neighbors(before, k=10)
+    # New plays of songs 10 and 42 by three listeners
+    after = before + similarity.interaction_matrix([5, 7, 9], [10, 10, 42], [1.0] * 3,
+                                                   shape=before.shape)
+
+    items = similarity.co_occurring(after, [10, 42])
+    _, neighbors[items], scores[items] = similarity.top_k_neighbors(after, k=10, items=items)
+
+    _, full_neighbors, full_scores = similarity.top_k_neighbors(after, k=10)
+    assert scores == pytest.approx(full_scores, rel=1e-5)
+    assert (neighbors == full_neighbors).all()
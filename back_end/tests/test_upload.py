@@ -0,0 +1,127 @@
+"""IngestionPipeline against a stubbed uploader and a list sink: no network, no database."""
+import threading
+
+import pytest
+
+import upload
+from upload import IngestionPipeline
+
+
+class StubUploader:
+    """Fails the first ``failures`` calls per file, then returns a canned result."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        with self._lock:
+            self.calls.append(path)
+            attempt = self._attempts[path] = self._attempts.get(path, 0) + 1
+        if attempt <= self.failures:
+            raise ConnectionError("storage unavailable")
+        return {"secure_url": f"https://res.invalid/{len(self.calls)}.mp3", "bytes": 3}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(upload.time, "sleep", delays.append)
+    return delays
+
+
+def write_files(folder, contents):
+    for name, data in contents.items():
+        (folder / name).write_bytes(data)
+
+
+def make_pipeline(sink, uploader, manifest, **options):
+    options.setdefault("analyzer", None)
+    return IngestionPipeline(sink.extend, uploader=uploader,
+                             manifest_path=str(manifest), **options)
+
+
+def test_retries_with_exponential_backoff(tmp_path, sleeps):
+    write_files(tmp_path, {"a-song.mp3": b"aaa"})
+    sink = []
+    uploader = StubUploader(failures=2)
+
+    summary = make_pipeline(sink, uploader, tmp_path / "m.jsonl",
+                            max_retries=3, backoff=1.0).run(str(tmp_path))
+
+    assert summary["uploaded"] == 1
+    assert summary["retries"] == 2
+    assert len(uploader.calls) == 3
+    assert len(sleeps) == 2
+    assert 1.0 <= sleeps[0] <= 1.1
+    assert 2.0 <= sleeps[1] <= 2.2
+    assert [doc["artist"] for doc in sink] == ["a"]
+
+
+def test_gives_up_after_max_retries(tmp_path, sleeps):
+    write_files(tmp_path, {"a.mp3": b"aaa", "b.mp3": b"bbb"})
+    sink = []
+    uploader = StubUploader(failures=10)
+
+    summary = make_pipeline(sink, uploader, tmp_path / "m.jsonl",
+                            max_retries=2).run(str(tmp_path))
+
+    assert summary["failed"] == 2
+    assert summary["uploaded"] == 0
+    assert len(uploader.calls) == 6
+    assert sink == []
+
+
+def test_resumes_from_manifest(tmp_path, sleeps):
+    music = tmp_path / "music"
+    music.mkdir()
+    manifest = tmp_path / "m.jsonl"
+    write_files(music, {"a.mp3": b"aaa", "b.mp3": b"bbb"})
+    first = []
+    make_pipeline(first, StubUploader(), manifest, batch_size=1).run(str(music))
+    assert len(first) == 2
+
+    write_files(music, {"c.mp3": b"ccc"})
+    second = []
+    uploader = StubUploader()
+    summary = make_pipeline(second, uploader, manifest).run(str(music))
+
+    assert summary["skipped"] == 2
+    assert summary["uploaded"] == 1
+    assert uploader.calls == [str(music / "c.mp3")]
+    assert [doc["title"] for doc in second] == ["c.mp3"]
+
+
+def test_skips_duplicate_content(tmp_path, sleeps):
+    write_files(tmp_path, {"a.mp3": b"same", "b.mp3": b"same", "c.flac": b"other"})
+    sink = []
+    uploader = StubUploader()
+
+    summary = make_pipeline(sink, uploader, tmp_path / "m.jsonl",
+                            concurrency=3).run(str(tmp_path))
+
+    assert summary["uploaded"] == 2
+    assert summary["skipped"] == 1
+    assert len(uploader.calls) == 2
+    assert len({doc["content_hash"] for doc in sink}) == 2
+
+
+def test_sink_failure_leaves_files_for_the_next_run(tmp_path, sleeps):
+    music = tmp_path / "music"
+    music.mkdir()
+    manifest = tmp_path / "m.jsonl"
+    write_files(music, {"a.mp3": b"aaa"})
+
+    def broken_sink(docs):
+        raise RuntimeError("database unavailable")
+
+    summary = IngestionPipeline(broken_sink, uploader=StubUploader(), analyzer=None,
+                                manifest_path=str(manifest)).run(str(music))
+    assert summary["failed"] == 1
+
+    sink = []
+    summary = make_pipeline(sink, StubUploader(), manifest).run(str(music))
+    assert summary["uploaded"] == 1
+    assert len(sink) == 1
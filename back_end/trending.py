@@ -0,0 +1,248 @@
+"""
+Time-decayed trending rankings.
+
+Each recorded play adds weight 1 to a song's score in every window, and
+scores decay exponentially with the window's length as time constant, so
+a play an hour old counts ``1/e`` in the hour window and almost fully in
+the week window. Nothing is rescanned at read time:
+
+* plays are folded into a small per-process pending map (song id ->
+  play count and decayed weight per window);
+* a background thread periodically persists the pending weights to the
+  ``trending_scores`` collection (one document per song, decayed and
+  incremented in a single pipeline update, so several processes can
+  write concurrently) and bumps ``music.play_count``. Counts are not a
+  catalog change: they are served by ``GET /music/<id>/plays``, so the
+  catalog revision, ETags and snapshot deltas do not churn with plays;
+  pending plays whose write fails are kept for the next flush;
+* the same thread then reloads the scores, decays them to "now", and
+  keeps the top ``TRENDING_TOP_SIZE`` per window as a sorted list.
+
+``top(window, n)`` therefore is a slice of a precomputed list. Songs whose
+week score has decayed to nothing are pruned on refresh, which keeps the
+collection to the songs played in the last few weeks.
+"""
+import atexit
+import heapq
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from background import PerProcess, start_thread
+from database import mongo
+
+logger = logging.getLogger(__name__)
+
+# Window name -> decay time constant in seconds
+WINDOWS = {
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+}
+DEFAULT_WINDOW = "day"
+# Week scores below this are dropped from trending_scores
+MIN_SCORE = 0.01
+
+
+def _epoch(moment):
+    """Seconds since the epoch for a naive-UTC or aware datetime."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def decay_expression(field, now, tau):
+    """Aggregation expression for ``field`` decayed from updated_at to ``now``."""
+    age_ms = {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}
+    return {"$multiply": [
+        {"$ifNull": [f"${field}", 0]},
+        {"$exp": {"$divide": [age_ms, -tau * 1000.0]}}
+    ]}
+
+
+class TrendingRanker:
+    def __init__(self, refresh_interval=30.0, top_size=200):
+        self.refresh_interval = refresh_interval
+        self.top_size = top_size
+        self._app = None
+        self._lock = threading.Lock()
+        # song_id -> [play_count, weight per window at self._anchor]
+        self._pending = {}
+        self._anchor = time.time()
+        # window -> [(song_id, score)] sorted by score, as of _refreshed_at
+        self._top = {window: [] for window in WINDOWS}
+        self._refreshed_at = None
+        self._worker = PerProcess(self._start_worker)
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self._app = app
+        self.refresh_interval = app.config.get(
+            "TRENDING_REFRESH_INTERVAL", self.refresh_interval
+        )
+        self.top_size = app.config.get("TRENDING_TOP_SIZE", self.top_size)
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+    def record(self, entries):
+        """Count plays from history entries (``song_id`` and ``played_at``)."""
+        if not entries:
+            return
+        with self._lock:
+            self._worker.ensure()
+            now = time.time()
+            # Pending weights are kept as of the anchor (the last flush)
+            lead = max(0.0, now - self._anchor)
+            for entry in entries:
+                # A play stamped in the future counts as played now, never more
+                age = max(0.0, now - _epoch(entry["played_at"]))
+                pending = self._pending.get(entry["song_id"])
+                if pending is None:
+                    pending = self._pending[entry["song_id"]] = [0] + [0.0] * len(WINDOWS)
+                pending[0] += 1
+                for i, tau in enumerate(WINDOWS.values(), start=1):
+                    pending[i] += math.exp((lead - age) / tau)
+
+    def _start_worker(self):
+        self._stopping = False
+        return [start_thread(self._run, "trending-ranker")]
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+                    self.refresh()
+            except Exception:
+                logger.exception("Trending refresh failed")
+
+    def flush(self):
+        """Persist pending plays to trending_scores and music.play_count."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            anchor, self._anchor = self._anchor, time.time()
+        if not pending:
+            return 0
+
+        now = datetime.utcnow()
+        shift = anchor - _epoch(now)
+        score_ops = []
+        count_ops = []
+        for song_id, (count, *weights) in pending.items():
+            update = {
+                window: {"$add": [
+                    decay_expression(window, now, tau),
+                    weight * math.exp(shift / tau)
+                ]}
+                for (window, tau), weight in zip(WINDOWS.items(), weights)
+            }
+            update["updated_at"] = now
+            score_ops.append(UpdateOne({"_id": song_id}, [{"$set": update}], upsert=True))
+            count_ops.append(UpdateOne({"_id": song_id}, {"$inc": {"play_count": count}}))
+        try:
+            mongo.db.trending_scores.bulk_write(score_ops, ordered=False)
+        except Exception:
+            self._restore(pending, anchor)
+            raise
+        try:
+            mongo.db.music.bulk_write(count_ops, ordered=False)
+        except Exception:
+            # Scores are written; only the counts are owed
+            self._restore({
+                song_id: [count] + [0.0] * len(WINDOWS)
+                for song_id, (count, *_) in pending.items()
+            }, anchor)
+            raise
+        return len(pending)
+
+    def _restore(self, pending, anchor):
+        """Fold plays from a failed flush back into the pending map."""
+        with self._lock:
+            for song_id, (count, *weights) in pending.items():
+                current = self._pending.get(song_id)
+                if current is None:
+                    current = self._pending[song_id] = [0] + [0.0] * len(WINDOWS)
+                current[0] += count
+                for i, (tau, weight) in enumerate(zip(WINDOWS.values(), weights), start=1):
+                    # Weights are kept as of the anchor; move them to the current one
+                    current[i] += weight * math.exp((anchor - self._anchor) / tau)
+
+    def refresh(self):
+        """Recompute the per-window top lists from trending_scores."""
+        now = datetime.utcnow()
+        now_ts = _epoch(now)
+        scored = {window: [] for window in WINDOWS}
+        stale = []
+        for doc in mongo.db.trending_scores.find({}):
+            age = now_ts - _epoch(doc.get("updated_at") or now)
+            for window, tau in WINDOWS.items():
+                scored[window].append(
+                    (doc.get(window, 0.0) * math.exp(-age / tau), doc["_id"])
+                )
+            if scored["week"][-1][0] < MIN_SCORE:
+                stale.append(doc["_id"])
+        if stale:
+            mongo.db.trending_scores.delete_many({
+                "_id": {"$in": stale}, "updated_at": {"$lte": now}
+            })
+
+        top = {}
+        for window, rows in scored.items():
+            best = heapq.nlargest(self.top_size, rows, key=lambda row: row[0])
+            top[window] = [(song_id, score) for score, song_id in best if score >= MIN_SCORE]
+        self._top = top
+        self._refreshed_at = now
+        return now
+
+    def top(self, window, limit):
+        """The precomputed top ``limit`` (song_id, score) pairs for a window."""
+        if window not in WINDOWS:
+            raise ValueError(f"window must be one of: {', '.join(WINDOWS)}")
+        with self._lock:
+            self._worker.ensure()
+        if self._refreshed_at is None:
+            self.refresh()
+        return self._top[window][:limit]
+
+    @property
+    def refreshed_at(self):
+        return self._refreshed_at
+
+    def stop(self):
+        """Stop the refresh thread and persist pending plays."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._app is not None:
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception("Failed to persist pending trending plays")
+
+    def rebuild(self, since=None):
+        """Recompute trending_scores from user_history (plays since ``since``)."""
+        now = datetime.utcnow()
+        since = since or datetime.utcfromtimestamp(_epoch(now) - 5 * WINDOWS["week"])
+        age_ms = {"$subtract": [now, "$played_at"]}
+        group = {"_id": "$song_id"}
+        for window, tau in WINDOWS.items():
+            group[window] = {"$sum": {"$exp": {"$divide": [age_ms, -tau * 1000.0]}}}
+        mongo.db.trending_scores.delete_many({})
+        mongo.db.user_history.aggregate([
+            {"$match": {"played_at": {"$gte": since}}},
+            {"$group": group},
+            {"$set": {"updated_at": now}},
+            {"$merge": {"into": "trending_scores", "whenMatched": "replace"}}
+        ], allowDiskUse=True)
+        self.refresh()
+        return mongo.db.trending_scores.count_documents({})
+
+
+trending_ranker = TrendingRanker()
@@ -1,61 +1,342 @@
+"""
+Bulk ingestion of a local music folder into media storage and MongoDB.
+
+    python upload.py [folder] [--concurrency 8] [--batch-size 100]
+
+Files are uploaded by a bounded thread pool with retries and exponential
+backoff; their metadata is written with batched ``insert_many`` calls. A
+JSON-lines manifest keyed by content hash records every ingested file, so
+an interrupted run can be restarted and will skip what is already done.
+``music.content_hash`` is unique too, so a batch written just before a
+crash (and so missing from the manifest) is not inserted twice on rerun.
+The uploader and the sink are injectable, so the pipeline can be run
+against stubs without network or database access.
+"""
+import argparse
+import hashlib
+import json
+import logging
 import os
-import cloudinary
-import cloudinary.uploader
-from dotenv import load_dotenv
-from database import mongo
-from app import app
-
-# Load environment variables
-load_dotenv()
-
-with app.app_context():
-    # Configure Cloudinary
-    cloudinary.config(
-        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-        api_key=os.getenv("CLOUDINARY_API_KEY"),
-        api_secret=os.getenv("CLOUDINARY_API_SECRET")
-    )
-
-    folder_path = os.path.abspath("uploads")
-
-    # Upload all audio files from a folder
-    def upload_music_and_save(folder_path):
-        # Process each file in the folder
-        # Initialize list to store uploaded files
-        uploaded_files = []
-
-        for filename in os.listdir(folder_path):
-            if filename.endswith((".mp3", ".wav", ".flac")):
-                file_path = os.path.join(folder_path, filename)
-                app.logger.info(f"Uploading {filename}...")
-
-                result = cloudinary.uploader.upload(
-                    file_path,
-                    resource_type="video",
-                    folder="music_sphere",
-                    transformation=[{"format": "mp3", "audio_codec": "mp3"}],
-                    use_filename=True,
-                    unique_filename=False
-                )
-                cloudinary_url = result["secure_url"]
-                # Extract artist from filename or set a placeholder
-                artist = filename.split('-')[0] if '-' in filename else "Unknown Artist"
-                music_entry = {
-                    "title": filename,
-                    "artist": artist,
-                    "cloudinary_url": cloudinary_url
-                }
-                mongo.db.music.insert_one(music_entry)
-            
-                uploaded_files.append({
-                    "file_name": filename,
-                    "file_url": result["secure_url"]
-                })
-                app.logger.info(f"Uploaded: {cloudinary_url}")
-
-        return uploaded_files
-
-    # Example usage
-    if __name__ == "__main__":
-        uploaded_files = upload_music_and_save(folder_path)
-        app.logger.info("\nAll Uploaded Files: %s", uploaded_files)
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import audio_analysis
+from metrics import storage_timer
+from search import build_search_tokens
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac")
+DEFAULT_MANIFEST = ".ingest_manifest.jsonl"
+DUPLICATE_KEY = 11000
+
+
+def cloudinary_upload(file_path):
+    """Upload one audio file to Cloudinary and return its API response."""
+    import cloudinary.uploader
+
+    with storage_timer("cloudinary", "upload_audio"):
+        return cloudinary.uploader.upload(
+            file_path,
+            resource_type="video",
+            folder="music_sphere",
+            transformation=[{"format": "mp3", "audio_codec": "mp3"}],
+            use_filename=True,
+            unique_filename=False
+        )
+
+
+def music_sink(docs):
+    """Insert music documents, treating ones whose content_hash exists as already ingested."""
+    from pymongo.errors import BulkWriteError
+    from database import mongo
+    from models import Music
+
+    try:
+        mongo.db.music.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as bwe:
+        write_errors = bwe.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in write_errors):
+            raise
+        duplicates = {error["index"] for error in write_errors}
+        logger.info("%d files were already in the catalog", len(duplicates))
+        inserted = [doc for i, doc in enumerate(docs) if i not in duplicates]
+    if inserted:
+        # insert_many assigns each document's _id in place
+        Music.mark_catalog_changed([doc["_id"] for doc in inserted])
+
+
+def discover_files(folder_path, recursive=True):
+    """Yield audio file paths under a folder, sorted for reproducible runs."""
+    if recursive:
+        for root, dirs, files in os.walk(folder_path):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(AUDIO_EXTENSIONS):
+                    yield os.path.join(root, filename)
+    else:
+        for filename in sorted(os.listdir(folder_path)):
+            path = os.path.join(folder_path, filename)
+            if os.path.isfile(path) and filename.lower().endswith(AUDIO_EXTENSIONS):
+                yield path
+
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Append-only record of ingested content hashes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.done.add(json.loads(line)["hash"])
+
+    def __contains__(self, digest):
+        return digest in self.done
+
+    def record(self, entries):
+        """Persist entries of the form {"hash", "path", "url"}."""
+        if not self.path:
+            self.done.update(e["hash"] for e in entries)
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+                self.done.add(entry["hash"])
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class IngestStats:
+    def __init__(self, total):
+        self.total = total
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "total": self.total,
+            "uploaded": self.uploaded,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "elapsed_s": round(elapsed, 2),
+            "files_per_s": round(self.uploaded / elapsed, 2),
+            "mb_per_s": round(self.bytes / elapsed / (1024 * 1024), 2),
+        }
+
+
+def build_music_entry(file_path, digest, result, analysis=None):
+    """Build the music document for an uploaded file."""
+    filename = os.path.basename(file_path)
+    # Extract artist from filename or set a placeholder
+    artist = filename.split('-')[0] if '-' in filename else "Unknown Artist"
+    entry = {
+        "title": filename,
+        "artist": artist,
+        "album": None,
+        "genre": None,
+        "description": None,
+        "cloudinary_url": result["secure_url"],
+        "duration": result.get("duration", 0),
+        "file_size": result.get("bytes", os.path.getsize(file_path)),
+        "format": result.get("format", "mp3"),
+        "uploaded_by": "Anonymous",
+        "created_at": datetime.utcnow().isoformat(),
+        "cover_url": None,
+        "play_count": 0,
+        "likes": 0,
+        "public": True,
+        "content_hash": digest,
+        "storage_backend": result.get("storage_backend", "cloudinary"),
+        "storage_key": result.get("storage_key")
+    }
+    if analysis:
+        entry["analysis"] = audio_analysis.to_document(analysis)
+        entry["duration"] = entry["duration"] or analysis["duration"]
+    entry["search_tokens"] = build_search_tokens(entry)
+    return entry
+
+
+class IngestionPipeline:
+    """Concurrent, resumable folder ingestion."""
+
+    def __init__(self, sink, uploader=cloudinary_upload, concurrency=4,
+                 batch_size=100, max_retries=3, backoff=1.0,
+                 manifest_path=DEFAULT_MANIFEST, progress_every=5.0,
+                 analyzer=audio_analysis.analyze):
+        """``sink`` receives lists of music documents (e.g. a collection's insert_many).
+
+        ``analyzer`` runs local audio analysis on each file; pass None to skip it.
+        """
+        self.sink = sink
+        self.uploader = uploader
+        self.analyzer = analyzer
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.manifest = Manifest(manifest_path)
+        self.progress_every = progress_every
+        self._claimed = set()
+        self._claim_lock = threading.Lock()
+
+    def _upload_with_retry(self, file_path, stats):
+        attempt = 0
+        while True:
+            try:
+                return self.uploader(file_path)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+                logger.warning("Upload of %s failed (%s); retrying in %.1fs",
+                               file_path, e, delay)
+                stats.add_retry()
+                time.sleep(delay)
+                attempt += 1
+
+    def _ingest_one(self, file_path, stats):
+        """Hash, dedupe and upload one file; returns None when it is skipped."""
+        digest = content_hash(file_path)
+        with self._claim_lock:
+            if digest in self.manifest or digest in self._claimed:
+                return None
+            self._claimed.add(digest)
+        analysis = None
+        if self.analyzer:
+            try:
+                analysis = self.analyzer(file_path)
+            except Exception as e:
+                logger.warning("Audio analysis skipped for %s: %s", file_path, e)
+        result = self._upload_with_retry(file_path, stats)
+        return build_music_entry(file_path, digest, result, analysis)
+
+    def _flush(self, pending, stats):
+        if not pending:
+            return
+        try:
+            self.sink([doc for doc, _ in pending])
+        except Exception as e:
+            # Left out of the manifest, so a rerun retries them
+            stats.failed += len(pending)
+            logger.error("Failed to save %d uploaded files: %s", len(pending), e)
+            pending.clear()
+            return
+        self.manifest.record([
+            {"hash": doc["content_hash"], "path": path, "url": doc["cloudinary_url"]}
+            for doc, path in pending
+        ])
+        pending.clear()
+
+    def run(self, folder_path, recursive=True):
+        """Ingest every new audio file under folder_path; returns a stats summary."""
+        files = list(discover_files(folder_path, recursive))
+        stats = IngestStats(len(files))
+        pending = []
+        in_flight = {}
+        last_report = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="ingest") as pool:
+            remaining = iter(files)
+            exhausted = False
+            while True:
+                # Keep at most two uploads per worker in flight
+                while not exhausted and len(in_flight) < self.concurrency * 2:
+                    file_path = next(remaining, None)
+                    if file_path is None:
+                        exhausted = True
+                        break
+                    future = pool.submit(self._ingest_one, file_path, stats)
+                    in_flight[future] = file_path
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    try:
+                        doc = future.result()
+                    except Exception as e:
+                        stats.failed += 1
+                        logger.error("Giving up on %s: %s", file_path, e)
+                        continue
+                    if doc is None:
+                        stats.skipped += 1
+                        continue
+                    stats.uploaded += 1
+                    stats.bytes += os.path.getsize(file_path)
+                    pending.append((doc, file_path))
+                if len(pending) >= self.batch_size:
+                    self._flush(pending, stats)
+
+                if time.monotonic() - last_report >= self.progress_every:
+                    last_report = time.monotonic()
+                    logger.info("Ingest progress: %s", stats.summary())
+
+        self._flush(pending, stats)
+        return stats.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a music folder.")
+    parser.add_argument("folder", nargs="?", default="uploads")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--no-analysis", action="store_true",
+                        help="Skip local duration/loudness/waveform analysis.")
+    args = parser.parse_args()
+
+    # create_app configures logging; a second root handler would print every record twice
+    from app import app
+    import indexes
+
+    with app.app_context():
+        # The unique content_hash index is what makes reruns idempotent
+        indexes.ensure_indexes(["music"])
+        storage = app.extensions["storage"]
+        pipeline = IngestionPipeline(
+            music_sink,
+            uploader=lambda path: storage.upload_audio(path, os.path.basename(path)),
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            max_retries=args.max_retries,
+            manifest_path=args.manifest,
+            analyzer=None if args.no_analysis else audio_analysis.analyze
+        )
+        summary = pipeline.run(os.path.abspath(args.folder),
+                               recursive=not args.no_recursive)
+        app.logger.info("Ingest complete: %s", summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Asynchronous upload processing.
+
+``POST /upload`` spools the audio (and optional cover) to disk, records a
+job in the ``upload_jobs`` collection and returns its id immediately. A
+small pool of worker threads claims jobs, uploads audio and cover to
+storage concurrently, inserts the song and records the outcome on the job,
+which clients poll through ``GET /upload/<job_id>``.
+
+Capacity is bounded: ``submit`` raises ``QueueFull`` when too many jobs
+are pending in this process. Jobs survive restarts because their files
+and state live outside the process: a claimed job holds a lease, renewed
+while it runs, and any worker resumes queued jobs or jobs whose lease
+expired.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from pymongo import ReturnDocument
+import chunked_upload
+from background import PerProcess, start_thread
+from database import mongo
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the upload queue has no room for another job."""
+
+
+class UploadJobQueue:
+    def __init__(self, workers=2, max_pending=32, lease_seconds=600,
+                 recover_interval=60, sweep_interval=3600):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.recover_interval = recover_interval
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._processor = None
+        self._app = None
+        self._queue = queue.Queue()
+        self._slots = None
+        self._workers = PerProcess(self._start_workers)
+        self._lock = threading.Lock()
+        self._owner = None
+        self._stopping = False
+
+    def init_app(self, app, processor):
+        """Bind to an app and ``processor(job) -> song dict`` that does the work."""
+        self._app = app
+        self._processor = processor
+        self.workers = app.config.get("UPLOAD_WORKERS", self.workers)
+        self.max_pending = app.config.get("UPLOAD_QUEUE_SIZE", self.max_pending)
+        self.lease_seconds = app.config.get("UPLOAD_JOB_LEASE", self.lease_seconds)
+        self.sweep_interval = app.config.get("UPLOAD_SPOOL_SWEEP_INTERVAL", self.sweep_interval)
+
+    def ensure_started(self):
+        """Start worker threads in this process if they are not running."""
+        # Once stop() ran here, workers stay down
+        if self._stopping and self._workers.started:
+            return
+        self._workers.ensure()
+
+    def _start_workers(self):
+        # Fresh state after a fork: queued ids do not carry over
+        self._owner = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = queue.Queue()
+        self._stopping = False
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        return [
+            start_thread(self._run, f"upload-worker-{i}") for i in range(self.workers)
+        ]
+
+    def submit(self, job):
+        """Persist a new job and queue it; raises QueueFull when saturated."""
+        self.ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("Upload queue is full")
+        now = datetime.utcnow()
+        job.update({
+            "status": "queued",
+            "stage": "queued",
+            "progress": 0,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        try:
+            mongo.db.upload_jobs.insert_one(job)
+        except Exception:
+            self._slots.release()
+            raise
+        self._queue.put(job["_id"])
+        return job["_id"]
+
+    @staticmethod
+    def get_job(job_id):
+        return mongo.db.upload_jobs.find_one({"_id": job_id})
+
+    @staticmethod
+    def set_stage(job_id, stage, progress):
+        mongo.db.upload_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"stage": stage, "progress": progress,
+                      "updated_at": datetime.utcnow()}}
+        )
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        return mongo.db.upload_jobs.find_one_and_update(
+            {"_id": job_id, "$or": [
+                {"status": "queued"},
+                {"status": "processing", "lease_until": {"$lt": now}}
+            ]},
+            {"$set": {
+                "status": "processing",
+                "owner": self._owner,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now
+            }, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _recover(self):
+        """Queue jobs left behind by a restart or a dead worker."""
+        now = datetime.utcnow()
+        orphaned = mongo.db.upload_jobs.find(
+            {"$or": [
+                {"status": "queued", "updated_at": {"$lt": now - timedelta(seconds=self.recover_interval)}},
+                {"status": "processing", "lease_until": {"$lt": now}}
+            ]},
+            {"_id": 1}
+        ).limit(self.max_pending)
+        for job in orphaned:
+            if self._slots.acquire(blocking=False):
+                self._queue.put(job["_id"])
+            else:
+                break
+
+    def _sweep(self):
+        """Delete abandoned chunked-upload spool files, at most once per sweep_interval."""
+        with self._lock:
+            if time.monotonic() - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = time.monotonic()
+        removed = chunked_upload.sweep_spool()
+        if removed:
+            logger.info("Removed %d abandoned upload spool files", removed)
+
+    def _run(self):
+        last_recover = 0.0
+        while True:
+            if time.monotonic() - last_recover >= self.recover_interval:
+                last_recover = time.monotonic()
+                try:
+                    with self._app.app_context():
+                        self._recover()
+                except Exception:
+                    logger.exception("Upload job recovery failed")
+                try:
+                    with self._app.app_context():
+                        self._sweep()
+                except Exception:
+                    logger.exception("Upload spool sweep failed")
+            try:
+                job_id = self._queue.get(timeout=self.recover_interval)
+            except queue.Empty:
+                continue
+            if self._stopping:
+                # Jobs still queued here stay "queued" in Mongo for another worker
+                if job_id is not None:
+                    self._slots.release()
+                return
+            try:
+                with self._app.app_context():
+                    self._process(job_id)
+            except Exception:
+                # A claim or status write failed. Mongo still has the job as
+                # queued or processing, so recovery picks it up again later
+                logger.exception("Upload job %s could not be processed", job_id)
+            finally:
+                self._slots.release()
+
+    def _renew_lease(self, job_id, done):
+        """Extend a running job's lease until ``done`` is set."""
+        while not done.wait(max(1.0, self.lease_seconds / 3)):
+            try:
+                with self._app.app_context():
+                    renewed = mongo.db.upload_jobs.update_one(
+                        {"_id": job_id, "owner": self._owner, "status": "processing"},
+                        {"$set": {"lease_until": datetime.utcnow()
+                                  + timedelta(seconds=self.lease_seconds)}}
+                    )
+            except Exception:
+                logger.exception("Failed to renew the lease on upload job %s", job_id)
+                continue
+            if not renewed.matched_count:
+                logger.warning("Lost the lease on upload job %s", job_id)
+                return
+
+    def _process(self, job_id):
+        job = self._claim(job_id)
+        if job is None:
+            # Another worker has it, or it already finished
+            return
+        done = threading.Event()
+        threading.Thread(
+            target=self._renew_lease, args=(job_id, done),
+            name=f"upload-lease-{job_id}", daemon=True
+        ).start()
+        try:
+            song = self._processor(job)
+        except Exception as e:
+            logger.exception("Upload job %s failed", job_id)
+            mongo.db.upload_jobs.update_one(
+                {"_id": job_id, "owner": self._owner},
+                {"$set": {"status": "failed", "error": str(e),
+                          "updated_at": datetime.utcnow()}}
+            )
+            return
+        finally:
+            done.set()
+        mongo.db.upload_jobs.update_one(
+            {"_id": job_id, "owner": self._owner},
+            {"$set": {"status": "complete", "stage": "complete", "progress": 100,
+                      "song": song, "updated_at": datetime.utcnow()}}
+        )
+
+    def stop(self, timeout=30.0):
+        """Let in-flight jobs finish and stop this process's worker threads."""
+        if not self._workers.started:
+            return
+        self._stopping = True
+        for _ in self._workers.threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._workers.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queued_locally": self._queue.qsize(),
+        }
+
+
+def run_concurrently(*calls):
+    """Run zero-argument callables in parallel and return their results in order.
+
+    The caller's app context, if any, is pushed in each thread.
+    """
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def run(call):
+        if app is None:
+            return call()
+        with app.app_context():
+            return call()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        futures = [pool.submit(run, call) for call in calls]
+        return [future.result() for future in futures]
+
+
+upload_queue = UploadJobQueue()
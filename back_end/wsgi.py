@@ -0,0 +1,88 @@
+"""
+Production WSGI entry point, served by gunicorn's pre-fork workers:
+
+    gunicorn -c gunicorn.conf.py
+
+With ``preload_app`` the master imports this module once, which pulls in
+Flask, the routes, numpy/scipy and the drivers; forked workers share those
+pages instead of each paying the import cost. The master never builds the
+app: a MongoClient, its monitor threads and the background flushers must
+not cross a fork, so each worker calls ``load()`` right after it forks
+and ``shutdown()`` before it exits, which lets in-flight uploads finish and
+flushes buffered plays and trending counts.
+
+``load()`` logs how long building the app took in each worker, and
+``python -X importtime -c "import wsgi"`` shows where the master's
+import time goes.
+"""
+import logging
+import os
+import threading
+import time
+
+import app as app_module
+# Imported here rather than in create_app, so the master loads them before forking
+import commands  # noqa: F401
+import routes.audio  # noqa: F401
+import routes.auth  # noqa: F401
+from database import mongo
+from history_buffer import play_history_buffer
+from trending import trending_ranker
+from upload_jobs import upload_queue
+
+logger = logging.getLogger(__name__)
+
+_app = None
+_pid = None
+_lock = threading.Lock()
+
+
+def load():
+    """The Flask app for this process, built on first use after a fork."""
+    global _app, _pid
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                started = time.perf_counter()
+                _app = app_module.create_app()
+                _pid = os.getpid()
+                logger.info(
+                    "Worker %d built the app in %.1f ms",
+                    _pid, (time.perf_counter() - started) * 1000
+                )
+    return _app
+
+
+def application(environ, start_response):
+    return load()(environ, start_response)
+
+
+def sync_indexes():
+    """Create missing indexes once, before forking, instead of in every worker.
+
+    The client used for it is closed again, so no connection or monitor
+    thread is inherited by the workers.
+    """
+    os.environ["ENSURE_INDEXES_ON_STARTUP"] = "true"
+    try:
+        app_module.create_app()
+    finally:
+        os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+        if mongo.cx is not None:
+            mongo.cx.close()
+
+
+def shutdown(timeout=10.0):
+    """Drain this worker's background work before it exits."""
+    if _app is None or _pid != os.getpid():
+        return
+    started = time.perf_counter()
+    # Uploads first: a finished job can still record plays and catalog changes
+    upload_queue.stop(timeout)
+    # Flushed play events feed trending counts, so trending goes last
+    play_history_buffer.stop(timeout)
+    trending_ranker.stop()
+    logger.info(
+        "Worker %d flushed background work in %.1f ms",
+        _pid, (time.perf_counter() - started) * 1000
+    )
@@ -41,22 +41,44 @@ const MusicList = ({
       return;
     }
 
-    // Otherwise, fetch all music
-    setIsLoading(true);
-    axios
-      .get("http://localhost:5000/api/audio/music")
-      .then((response) => {
-        const validSongs = response.data.filter(
-          (song: any) => song.url && typeof song.url === "string"
+    // Otherwise, fetch all music, following next_cursor page by page
+    let cancelled = false;
+    const fetchAllPages = async () => {
+      const allSongs: Song[] = [];
+      let cursor: string | null = null;
+      do {
+        const response: { data: { items: any[]; next_cursor: string | null } } =
+          await axios.get("http://localhost:5000/api/audio/music", {
+            params: { limit: 200, cursor: cursor ?? undefined },
+          });
+        allSongs.push(
+          ...response.data.items.filter(
+            (song: any) => song.url && typeof song.url === "string"
+          )
         );
-        setSongs(validSongs);
+        cursor = response.data.next_cursor;
+      } while (cursor && !cancelled);
+      return allSongs;
+    };
+
+    setIsLoading(true);
+    fetchAllPages()
+      .then((allSongs) => {
+        if (!cancelled) {
+          setSongs(allSongs);
+        }
       })
       .catch((error) => {
         console.error("Error fetching music:", error);
       })
       .finally(() => {
-        setIsLoading(false);
+        if (!cancelled) {
+          setIsLoading(false);
+        }
       });
+    return () => {
+      cancelled = true;
+    };
   }, [propSongs]);
 
   if (isLoading) {
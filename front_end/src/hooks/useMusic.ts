@@ -16,7 +16,6 @@ export interface Song {
   created_at?: string;
   file_size?: number;
   format?: string;
-  play_count?: number;
   likes?: number;
   public?: boolean;
 }
@@ -52,6 +51,26 @@ export interface MostPlayed {
   total_duration: number;
 }
 
+interface CatalogSnapshot {
+  revision: number;
+  full: boolean;
+  fields: string[];
+  count: number;
+  columns: Record<string, any[]>;
+  deleted: string[];
+}
+
+interface CatalogCache {
+  revision: number;
+  songs: any[];
+}
+
+const CATALOG_CACHE_KEY = 'musicsphere.catalog';
+// Upload job polling: 1s, 2s, 4s, ... up to 10s apart, for at most 10 minutes
+const UPLOAD_POLL_INITIAL_MS = 1000;
+const UPLOAD_POLL_MAX_MS = 10000;
+const UPLOAD_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
 // Music API functions
 const musicApi = {
   uploadSong: async (formData: FormData): Promise<UploadResponse> => {
@@ -60,15 +79,71 @@ const musicApi = {
         'Content-Type': 'multipart/form-data',
       },
     });
-    return response.data;
+    // The server processes uploads in the background; poll the job,
+    // backing off, until it finishes or the deadline passes
+    const jobId: string = response.data.job_id;
+    const deadline = Date.now() + UPLOAD_POLL_TIMEOUT_MS;
+    let delay = UPLOAD_POLL_INITIAL_MS;
+    while (Date.now() + delay < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, delay));
+      delay = Math.min(delay * 2, UPLOAD_POLL_MAX_MS);
+      const job = await apiClient.get(`/audio/upload/${jobId}`);
+      if (job.data.status === 'complete') {
+        return { message: job.data.message, song: job.data.song };
+      }
+      if (job.data.status === 'failed') {
+        throw new Error(job.data.error || 'Upload failed');
+      }
+    }
+    throw new Error(
+      'The upload is still being processed. Check your library again in a few minutes.'
+    );
   },
 
   getAllSongs: async (): Promise<Song[]> => {
-    const response = await apiClient.get('/audio/music');
+    // Columnar catalog snapshot; after the first load only the delta since
+    // the cached revision is downloaded and merged
+    let cached: CatalogCache | null = null;
+    try {
+      cached = JSON.parse(localStorage.getItem(CATALOG_CACHE_KEY) || 'null');
+    } catch {
+      cached = null;
+    }
+    const response: { data: CatalogSnapshot } = await apiClient.get('/audio/catalog/snapshot', {
+      params: { since: cached?.revision },
+    });
+    const snapshot = response.data;
+
+    const byId = new Map<string, any>(
+      snapshot.full || !cached ? [] : cached.songs.map((song) => [song._id, song])
+    );
+    for (const id of snapshot.deleted) {
+      byId.delete(id);
+    }
+    for (let i = 0; i < snapshot.count; i++) {
+      const song: any = {};
+      for (const field of snapshot.fields) {
+        song[field] = snapshot.columns[field][i];
+      }
+      byId.set(song._id, song);
+    }
+    // Newest first, matching the paginated listing
+    const songs = Array.from(byId.values()).sort((a, b) => (a._id < b._id ? 1 : -1));
+    try {
+      localStorage.setItem(
+        CATALOG_CACHE_KEY,
+        JSON.stringify({ revision: snapshot.revision, songs })
+      );
+    } catch {
+      // Storage full or unavailable; the next load is simply a full one
+    }
+
     // Map backend data structure to frontend expectations
-    return response.data.map((song: any) => ({
+    return songs.map((song: any) => ({
       ...song,
       id: song._id, // Map _id to id
+      url: song.cloudinary_url || '',
+      artist: song.artist || 'Unknown Artist',
       uploaded_by: song.uploaded_by || 'Unknown',
       created_at: song.created_at || new Date().toISOString(),
     }));
@@ -89,7 +164,7 @@ const musicApi = {
     return response.data;
   },
 
-  recordPlay: async (song_id: string, duration_played: number): Promise<{ message: string; history_id: string }> => {
+  recordPlay: async (song_id: string, duration_played: number): Promise<{ message: string; history_id?: string }> => {
     const response = await apiClient.post('/audio/history/record', {
       song_id,
       duration_played,
@@ -29,7 +29,6 @@ interface SongData {
   duration: number;
   created_at: string;
   uploaded_by: string;
-  play_count: number;
   likes: number;
 }
 
@@ -38,6 +37,7 @@ const SongPage = () => {
   const navigate = useNavigate();
   const { currentSong, isPlaying, playSong, pauseSong } = usePlayer();
   const [song, setSong] = useState<SongData | null>(null);
+  const [playCount, setPlayCount] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [imageError, setImageError] = useState(false);
@@ -65,7 +65,21 @@ const SongPage = () => {
       }
     };
 
+    // Play counts are served apart from the (long-cached) song details
+    const fetchPlays = async () => {
+      if (!id) return;
+      try {
+        const response = await axios.get(
+          `http://localhost:5000/api/audio/music/${id}/plays`
+        );
+        setPlayCount(response.data.play_count);
+      } catch {
+        setPlayCount(null);
+      }
+    };
+
     fetchSong();
+    fetchPlays();
   }, [id]);
 
   const handlePlay = async () => {
@@ -253,7 +267,7 @@ const SongPage = () => {
           <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
             <div className="text-center p-4 bg-background rounded-lg">
               <div className="text-2xl font-bold text-brand">
-                {song.play_count}
+                {playCount ?? "-"}
               </div>
               <div className="text-sm text-muted">Plays</div>
             </div>